@@ -148,3 +148,28 @@ def edit_user(user_id):
                            
 # Import datetime for session initialization log
 from datetime import datetime
+
+# --- Bulk Matching Report ---
+from flask import request
+from app.services.client_matching import get_last_report, report_rebuild_running, start_report_rebuild
+from app.services.property_index import load_properties
+
+@admin_bp.route('/matching-report', methods=['GET', 'POST'])
+def matching_report():
+    """Match counts and best listings for every client: shows the saved report, rebuilt in the background (or by flask matching-report)."""
+    if request.method == 'POST':
+        top_n = min(max(request.form.get('top_n', 5, type=int) or 5, 1), 20)
+        if start_report_rebuild(current_app._get_current_object(), top_n=top_n):
+            flash("Пересчет отчета запущен в фоне. Обновите страницу через несколько секунд.", "info")
+        else:
+            flash("Отчет уже пересчитывается.", "warning")
+        return redirect(url_for('admin.matching_report'))
+    report = get_last_report()
+    rows, properties_by_id = [], {}
+    if report is not None:
+        top_ids = sorted({property_id for row in report.rows for property_id in row['top_property_ids']})
+        properties_by_id = {prop.id: prop for prop in load_properties(top_ids)}
+        rows = sorted(report.rows, key=lambda row: (-row['count'], row['client_name']))
+    return render_template('admin/matching_report.html', title="Сводный подбор по клиентам",
+                           report=report, rows=rows, properties_by_id=properties_by_id,
+                           rebuilding=report_rebuild_running())
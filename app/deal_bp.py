@@ -3,8 +3,13 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import Deal, Client, Property, User, DealStatusEnum, Role
 from app.forms import DealForm
+from app.services.search import search_clients, search_properties
+from app.services.deal_analytics import record_stage_change, stage_medians, monthly_conversion, ALL_AGENTS
+from app.services.rollups import counters_for, GLOBAL_SCOPE
 import json # For parsing interests JSON if needed, and for JSON responses
 import logging
+from datetime import datetime
+from sqlalchemy import tuple_
 
 deal_bp = Blueprint('deal', __name__, url_prefix='/deals')
 logger = logging.getLogger(__name__ + '.deal_bp')
@@ -16,14 +21,71 @@ def before_request():
     # For now, any logged-in user can view, admins/agents can modify.
     pass
 
+# Remote-search selects: results per lookup request, and how deep a search may be paged
+LOOKUP_PAGE_SIZE = 20
+LOOKUP_MAX_PAGES = 10
+
+def _property_label(prop):
+    return f"{prop.name} ({prop.address})" if prop.address else prop.name
+
+def _selected_choice(field, model, label):
+    """Choices holding only the field's current value (submitted or from the edited deal), if that row exists."""
+    selected = db.session.get(model, field.data) if field.data else None
+    field.choices = [(selected.id, label(selected))] if selected else []
+
 def _populate_deal_form_choices(form):
-    """Helper to populate choices for SelectFields in DealForm."""
-    form.client_id.choices = [(c.id, c.name) for c in Client.query.order_by(Client.name).all()]
-    form.property_id.choices = [(p.id, f"{p.name} ({p.address})") for p in Property.query.order_by(Property.name).all()]
-    # For agents, consider filtering by an 'Agent' role if such a role is consistently used.
-    form.agent_id.choices = [(u.id, u.username) for u in User.query.order_by(User.username).all()]
+    """
+    Helper to populate choices for SelectFields in DealForm. Clients, listings and agents are picked
+    through the lookup endpoints, so only the selected row of each is loaded; validating a submitted
+    id is then a primary-key lookup (an unknown id is not among the choices and is rejected).
+    """
+    _selected_choice(form.client_id, Client, lambda c: c.name)
+    _selected_choice(form.property_id, Property, _property_label)
+    _selected_choice(form.agent_id, User, lambda u: u.username)
     form.stage.choices = DealStatusEnum.choices()
 
+def _lookup_response(rows, label, page):
+    """JSON page for the remote-search selects: {results: [{id, text}], more}."""
+    more = len(rows) > LOOKUP_PAGE_SIZE and page < LOOKUP_MAX_PAGES
+    return jsonify({"results": [{"id": row.id, "text": label(row)} for row in rows[:LOOKUP_PAGE_SIZE]], "more": more})
+
+def _lookup_args():
+    query = request.args.get('q', '').strip()
+    page = min(max(request.args.get('page', 1, type=int) or 1, 1), LOOKUP_MAX_PAGES)
+    return query, page, (page - 1) * LOOKUP_PAGE_SIZE
+
+@deal_bp.route('/lookup/clients')
+def lookup_clients():
+    """Clients for the deal form select: full-text search by name/phone, or alphabetical without a query."""
+    query, page, offset = _lookup_args()
+    if query:
+        rows = search_clients(query, limit=offset + LOOKUP_PAGE_SIZE + 1)[offset:]
+    else:
+        rows = Client.query.options(db.load_only(Client.id, Client.name))\
+            .order_by(Client.name, Client.id).offset(offset).limit(LOOKUP_PAGE_SIZE + 1).all()
+    return _lookup_response(rows, lambda c: c.name, page)
+
+@deal_bp.route('/lookup/properties')
+def lookup_properties():
+    """Listings for the deal form select: full-text search by name/address, or newest first without a query."""
+    query, page, offset = _lookup_args()
+    if query:
+        rows = search_properties(query, limit=offset + LOOKUP_PAGE_SIZE + 1)[offset:]
+    else:
+        rows = Property.query.options(db.load_only(Property.id, Property.name, Property.address))\
+            .order_by(Property.created_at.desc(), Property.id.desc()).offset(offset).limit(LOOKUP_PAGE_SIZE + 1).all()
+    return _lookup_response(rows, _property_label, page)
+
+@deal_bp.route('/lookup/agents')
+def lookup_agents():
+    """Users for the deal form agent select, by username prefix."""
+    query, page, offset = _lookup_args()
+    users = User.query.options(db.load_only(User.id, User.username))
+    if query:
+        users = users.filter(db.func.lower(User.username).like(f"{query.lower()}%"))
+    rows = users.order_by(User.username, User.id).offset(offset).limit(LOOKUP_PAGE_SIZE + 1).all()
+    return _lookup_response(rows, lambda u: u.username, page)
+
 
 @deal_bp.route('/')
 def list_deals():
@@ -55,6 +117,8 @@ def add_deal():
         # For now, it's a required selection.
         try:
             db.session.add(new_deal)
+            db.session.flush() # Assigns id and created_at for the transition log
+            record_stage_change(new_deal, None, user_id=current_user.id, moment=new_deal.created_at)
             db.session.commit()
             flash(f"Сделка '{new_deal.title}' успешно создана.", 'success')
             return redirect(url_for('deal.list_deals'))
@@ -78,6 +142,7 @@ def edit_deal(deal_id):
     _populate_deal_form_choices(form)
         
     if form.validate_on_submit():
+        previous_stage = deal.stage
         deal.title = form.title.data
         deal.client_id = form.client_id.data
         deal.property_id = form.property_id.data
@@ -85,6 +150,7 @@ def edit_deal(deal_id):
         deal.stage = form.stage.data
         # updated_at is handled by SQLAlchemy
         try:
+            record_stage_change(deal, previous_stage, user_id=current_user.id)
             db.session.commit()
             flash(f"Сделка '{deal.title}' успешно обновлена.", 'success')
             return redirect(url_for('deal.list_deals'))
@@ -111,17 +177,61 @@ def delete_deal(deal_id):
         
     return redirect(url_for('deal.list_deals'))
 
+def _encode_deal_cursor(deal):
+    """Cursor for a Kanban column: '<updated_at ISO>_<id>' of the last card shown."""
+    return f"{deal.updated_at.isoformat()}_{deal.id}"
+
+def _decode_deal_cursor(cursor):
+    """Returns (updated_at, id) from a cursor string or None if it is malformed."""
+    try:
+        updated_at_str, id_str = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(updated_at_str), int(id_str)
+    except (AttributeError, ValueError):
+        return None
+
+def _kanban_card_options():
+    return (db.joinedload(Deal.client).load_only(Client.id, Client.name),
+            db.joinedload(Deal.property).load_only(Property.id, Property.name),
+            db.joinedload(Deal.agent).load_only(User.id, User.username))
+
 @deal_bp.route('/kanban')
 def kanban_board():
-    """Displays deals on a Kanban board."""
+    """Displays deals on a Kanban board: the newest KANBAN_COLUMN_LIMIT cards of every stage, more on demand."""
+    limit = current_app.config.get('KANBAN_COLUMN_LIMIT', 20)
     deals_by_stage = {}
-    for stage_enum_member in DealStatusEnum:
-        deals_by_stage[stage_enum_member.value] = Deal.query.filter_by(stage=stage_enum_member.value)\
-            .options(db.joinedload(Deal.client), db.joinedload(Deal.property), db.joinedload(Deal.agent))\
-            .order_by(Deal.updated_at.desc()).all()
-            
+    next_cursors = {}
+    for stage in DealStatusEnum.values():
+        # Index seek on (stage, updated_at, id) reading limit + 1 rows: no scan of the stage or the table
+        deals = Deal.query.filter(Deal.stage == stage)\
+            .options(*_kanban_card_options())\
+            .order_by(Deal.updated_at.desc(), Deal.id.desc()).limit(limit + 1).all()
+        deals_by_stage[stage] = deals[:limit]
+        if len(deals) > limit:
+            next_cursors[stage] = _encode_deal_cursor(deals[limit - 1])
+    # Column totals from the maintained rollup counters instead of COUNT(*) per stage
+    totals = counters_for([GLOBAL_SCOPE])[GLOBAL_SCOPE].get('deals.stage', {})
+
     # Pass DealStatusEnum itself to the template to iterate over its members for columns
-    return render_template('deals/kanban.html', title="Доска сделок (Канбан)", deals_by_stage=deals_by_stage, stages=DealStatusEnum)
+    return render_template('deals/kanban.html', title="Доска сделок (Канбан)", deals_by_stage=deals_by_stage,
+                           stages=DealStatusEnum, totals=totals, next_cursors=next_cursors)
+
+@deal_bp.route('/kanban/column')
+def kanban_column():
+    """Next cards of one Kanban column after `cursor`, as rendered HTML plus the cursor for the page after it."""
+    stage = request.args.get('stage')
+    if stage not in DealStatusEnum.values():
+        return jsonify({"status": "error", "message": f"Некорректная стадия: {stage}."}), 400
+    decoded_cursor = _decode_deal_cursor(request.args.get('cursor'))
+    if decoded_cursor is None:
+        return jsonify({"status": "error", "message": "Некорректный курсор."}), 400
+    limit = current_app.config.get('KANBAN_COLUMN_LIMIT', 20)
+    # Keyset seek on the same index as the board query, so deep columns never use OFFSET
+    deals = Deal.query.filter(Deal.stage == stage, tuple_(Deal.updated_at, Deal.id) < decoded_cursor)\
+        .options(*_kanban_card_options())\
+        .order_by(Deal.updated_at.desc(), Deal.id.desc()).limit(limit + 1).all()
+    next_cursor = _encode_deal_cursor(deals[limit - 1]) if len(deals) > limit else None
+    html = render_template('deals/_kanban_cards.html', deals=deals[:limit])
+    return jsonify({"status": "success", "html": html, "next_cursor": next_cursor})
 
 @deal_bp.route('/<int:deal_id>/update_stage', methods=['POST'])
 @login_required # Ensure only logged-in users can do this
@@ -144,8 +254,10 @@ def update_deal_stage(deal_id):
     #     return jsonify({"status": "error", "message": "Нет прав для изменения стадии этой сделки."}), 403
 
     try:
+        previous_stage = deal.stage
         deal.stage = new_stage_value
         deal.updated_at = datetime.utcnow() # Manually update if not relying on onupdate for this specific change type.
+        record_stage_change(deal, previous_stage, user_id=current_user.id, moment=deal.updated_at)
         db.session.commit()
         logger.info(f"Стадия сделки ID {deal.id} ('{deal.title}') обновлена на '{new_stage_value}' пользователем {current_user.username}.")
         return jsonify({"status": "success", "message": "Стадия сделки успешно обновлена."})
@@ -153,3 +265,26 @@ def update_deal_stage(deal_id):
         db.session.rollback()
         logger.error(f"Ошибка обновления стадии для сделки ID {deal.id}: {e}", exc_info=True)
         return jsonify({"status": "error", "message": f"Ошибка сервера при обновлении стадии: {str(e)}"}), 500
+
+def _format_duration(seconds):
+    """Human-readable duration for the analytics page: minutes, hours or days."""
+    if seconds is None:
+        return '-'
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} мин"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} ч"
+    return f"{seconds / 86400:.1f} дн"
+
+@deal_bp.route('/analytics')
+def pipeline_analytics():
+    """Median time in each stage and monthly conversion per agent, read from the precomputed aggregates."""
+    medians = stage_medians()
+    conversion = monthly_conversion(months=12)
+    agent_ids = sorted({agent_id for agent_id in medians if agent_id != ALL_AGENTS} |
+                       {agent_id for _, agent_id, *_ in conversion if agent_id != ALL_AGENTS})
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(agent_ids))) if agent_ids else {}
+    return render_template('deals/analytics.html', title="Аналитика воронки сделок",
+                           stages=DealStatusEnum.values(), medians=medians, agent_ids=agent_ids,
+                           usernames=usernames, conversion=conversion, all_agents=ALL_AGENTS,
+                           format_duration=_format_duration)
@@ -79,7 +79,9 @@ class PropertyForm(FlaskForm):
     link = StringField("Ссылка на оригинал (URL)", validators=[Optional(), URL(message="Некорректный URL."), Length(max=512)])
     external_id = StringField("Внешний ID объявления", validators=[Optional(), Length(max=128)])
 
-    # Removed photos TextAreaField, replaced with MultipleFileField for actual uploads
+    photos = TextAreaField("Фотографии (URL через запятую)", render_kw={"rows": 2}, validators=[Optional()],
+                           description="Изображения будут загружены по ссылкам. При редактировании заменяют существующие фото.")
+    # Photo URLs above are downloaded by add/edit routes; direct file uploads go here
     uploaded_images = MultipleFileField("Загрузить изображения (новые или для замены)", validators=[
         Optional(),
         FileAllowed(['jpg', 'jpeg', 'png', 'gif'], 'Разрешены только изображения (jpg, jpeg, png, gif)!')
@@ -177,14 +179,15 @@ class PropertyFilterForm(FlaskForm):
     district = SelectField("Район", choices=[], validators=[Optional()])
     cat = SelectField("Категория", choices=[], validators=[Optional()]) 
     status = SelectField("Статус объекта", choices=[], validators=[Optional()])
+    address = StringField("Адрес или улица", validators=[Optional(), Length(max=200)])
     min_area = FloatField("Площадь от (м²)", validators=[Optional(), NumberRange(min=0)])
     max_area = FloatField("Площадь до (м²)", validators=[Optional(), NumberRange(min=0)])
     min_floor = IntegerField("Этаж от", validators=[Optional(), NumberRange(min=0)])
     max_floor = IntegerField("Этаж до", validators=[Optional(), NumberRange(min=0)])
     total_floors_min = IntegerField("Этажей в доме от", validators=[Optional(), NumberRange(min=0)])
     total_floors_max = IntegerField("Этажей в доме до", validators=[Optional(), NumberRange(min=0)])
-    year_from = StringField("Год постройки от", validators=[Optional(), Length(max=4)]) 
-    year_to = StringField("Год постройки до", validators=[Optional(), Length(max=4)])
+    year_from = IntegerField("Год постройки от", validators=[Optional(), NumberRange(min=1800, max=2100)])
+    year_to = IntegerField("Год постройки до", validators=[Optional(), NumberRange(min=1800, max=2100)])
     condition = SelectField("Состояние", choices=[], validators=[Optional()]) 
     layout = SelectField("Планировка", choices=[], validators=[Optional()]) 
     submit = SubmitField("Применить фильтр")
@@ -193,6 +196,9 @@ class ClientSelectionForm(FlaskForm):
     client_id = SelectField("Выберите клиента", coerce=int, 
                             validators=[DataRequired(message="Необходимо выбрать клиента.")],
                             choices=[]) 
+    mode = SelectField("Режим подбора", choices=[('strict', 'Точное совпадение всех условий'),
+                                                 ('scored', 'Ранжирование (допускает небольшие отклонения)')],
+                       default='strict', validators=[Optional()])
     submit = SubmitField("Найти подходящие объекты")
 
 class AdminUserEditForm(FlaskForm):
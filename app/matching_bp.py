@@ -1,11 +1,14 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
 from app import db
-from app.models import Client, Property, DealStatusEnum # Assuming Property model has necessary fields
+from app.models import Client, Property, DealStatusEnum, ClientPropertyMatch # Assuming Property model has necessary fields
 from app.forms import ClientSelectionForm
 import json # For parsing interests JSON
 import logging
 from sqlalchemy import or_ # For OR conditions in query
+from datetime import datetime
+from flask import current_app
+from app.services.client_matching import interest_criteria, scored_matches
 
 matching_bp = Blueprint('matching', __name__, url_prefix='/matching')
 logger = logging.getLogger(__name__ + '.matching_bp')
@@ -13,7 +16,8 @@ logger = logging.getLogger(__name__ + '.matching_bp')
 def _populate_client_selection_form_choices(form):
     """Helper to populate choices for client selection."""
     clients = Client.query.order_by(Client.name).all()
-    form.client_id.choices = [('', '--- Выберите клиента ---')] + [(c.id, c.name) for c in clients]
+    # Placeholder value 0 rather than '': the field coerces to int, and DataRequired rejects 0
+    form.client_id.choices = [(0, '--- Выберите клиента ---')] + [(c.id, c.name) for c in clients]
 
 @matching_bp.route('/properties', methods=['GET', 'POST'])
 @login_required
@@ -22,6 +26,7 @@ def match_properties_to_client():
     _populate_client_selection_form_choices(form)
     
     matching_properties = []
+    match_scores = {} # property id -> weighted distance, scored mode only
     selected_client = None
     client_interests_display = {} # For displaying interests in template
 
@@ -35,63 +40,38 @@ def match_properties_to_client():
                 interests = selected_client.interests
                 client_interests_display = interests # Pass raw interests for display
                 
-                query = Property.query
-                
-                # Price range
-                if interests.get('min_price') is not None:
-                    query = query.filter(Property.price >= interests['min_price'])
-                if interests.get('max_price') is not None:
-                    query = query.filter(Property.price <= interests['max_price'])
-                
-                # Area range
-                if interests.get('min_area') is not None:
-                    query = query.filter(Property.area >= interests['min_area'])
-                if interests.get('max_area') is not None:
-                    query = query.filter(Property.area <= interests['max_area'])
-
-                # Districts (can be a list or single string in JSON)
-                districts_interest = interests.get('districts')
-                if districts_interest:
-                    if isinstance(districts_interest, list):
-                        query = query.filter(Property.district.in_(districts_interest))
-                    elif isinstance(districts_interest, str):
-                        query = query.filter(Property.district == districts_interest)
-                
-                # Condition (single string)
-                if interests.get('condition'):
-                    query = query.filter(Property.condition == interests['condition'])
-                
-                # Layout (single string)
-                if interests.get('layout'):
-                    query = query.filter(Property.layout == interests['layout'])
-
-                # Floor (min/max)
-                if interests.get('min_floor') is not None:
-                     query = query.filter(Property.floor >= interests['min_floor'])
-                if interests.get('max_floor') is not None:
-                     query = query.filter(Property.floor <= interests['max_floor'])
-
-                # Year built (from/to)
-                if interests.get('year_built_from') is not None:
-                     query = query.filter(Property.year_built >= interests['year_built_from'])
-                if interests.get('year_built_to') is not None:
-                     query = query.filter(Property.year_built <= interests['year_built_to'])
+                if form.mode.data == 'scored':
+                    # Soft constraints: best N by weighted distance instead of a strict AND of filters
+                    scored = scored_matches(selected_client, limit=current_app.config.get('MATCH_SCORE_TOP_N', 50),
+                                            tolerance=current_app.config.get('MATCH_SCORE_TOLERANCE', 0.25),
+                                            max_candidates=current_app.config.get('MATCH_SCORE_MAX_CANDIDATES', 2000))
+                    matching_properties = [prop for prop, _ in scored]
+                    match_scores = {prop.id: score for prop, score in scored}
+                    if matching_properties:
+                        flash(f"Показаны {len(matching_properties)} лучших вариантов для клиента '{selected_client.name}'.", "success")
+                    else:
+                        flash(f"Подходящие объекты для клиента '{selected_client.name}' не найдены даже с допуском.", "info")
+                else:
+                    # Structured criteria (ClientInterest), same semantics as the reverse matching of new listings
+                    criteria = selected_client.interest_criteria
+                    parsed_interests = criteria.to_parsed() if criteria else {'ranges': {}, 'terms': {}}
+                    query = Property.query.filter(*interest_criteria(parsed_interests))
 
-                # Exclude properties already in "Успешно закрыта" or "В работе" deals for this client to avoid suggesting them again.
-                # This is a more advanced filter.
-                # existing_deals_subquery = db.session.query(Deal.property_id).filter(
-                #     Deal.client_id == client_id,
-                #     or_(Deal.stage == DealStatusEnum.CLOSED_WON.value, Deal.stage == DealStatusEnum.IN_PROGRESS.value)
-                # ).subquery()
-                # query = query.filter(Property.id.notin_(existing_deals_subquery))
+                    # Exclude properties already in "Успешно закрыта" or "В работе" deals for this client to avoid suggesting them again.
+                    # This is a more advanced filter.
+                    # existing_deals_subquery = db.session.query(Deal.property_id).filter(
+                    #     Deal.client_id == client_id,
+                    #     or_(Deal.stage == DealStatusEnum.CLOSED_WON.value, Deal.stage == DealStatusEnum.IN_PROGRESS.value)
+                    # ).subquery()
+                    # query = query.filter(Property.id.notin_(existing_deals_subquery))
 
 
-                matching_properties = query.order_by(Property.price).all()
+                    matching_properties = query.order_by(Property.price).all()
                 
-                if matching_properties:
-                    flash(f"Найдено {len(matching_properties)} подходящих объектов для клиента '{selected_client.name}'.", "success")
-                else:
-                    flash(f"Подходящие объекты для клиента '{selected_client.name}' по указанным интересам не найдены.", "info")
+                    if matching_properties:
+                        flash(f"Найдено {len(matching_properties)} подходящих объектов для клиента '{selected_client.name}'.", "success")
+                    else:
+                        flash(f"Подходящие объекты для клиента '{selected_client.name}' по указанным интересам не найдены.", "info")
             else:
                 flash(f"У клиента '{selected_client.name}' не указаны или некорректно заданы интересы (требуется JSON).", "warning")
                 client_interests_display = {"ошибка": "Интересы не заданы или указаны некорректно."} if not selected_client.interests else selected_client.interests
@@ -120,5 +100,51 @@ def match_properties_to_client():
                            title="Подбор объектов для клиента", 
                            form=form, 
                            matching_properties=matching_properties,
+                           match_scores=match_scores,
                            selected_client=selected_client,
                            client_interests_display=client_interests_display)
+
+
+@matching_bp.route('/inbox')
+@login_required
+def new_matches_inbox():
+    """New listings (from scrapers and imports) that matched a client's interests and were not yet reviewed."""
+    client_id = request.args.get('client_id', type=int)
+    show_seen = request.args.get('show_seen') == '1'
+    page = request.args.get('page', 1, type=int)
+    query = ClientPropertyMatch.query.options(db.joinedload(ClientPropertyMatch.client), db.joinedload(ClientPropertyMatch.property))
+    if client_id:
+        query = query.filter(ClientPropertyMatch.client_id == client_id)
+    if not show_seen:
+        query = query.filter(ClientPropertyMatch.seen_at.is_(None))
+    pagination = query.order_by(ClientPropertyMatch.created_at.desc(), ClientPropertyMatch.id.desc())\
+        .paginate(page=page, per_page=50, error_out=False)
+    unseen_by_client = db.session.query(Client.id, Client.name, db.func.count(ClientPropertyMatch.id))\
+        .join(ClientPropertyMatch, ClientPropertyMatch.client_id == Client.id)\
+        .filter(ClientPropertyMatch.seen_at.is_(None))\
+        .group_by(Client.id, Client.name).order_by(db.func.count(ClientPropertyMatch.id).desc()).all()
+    return render_template('matching/inbox.html', title="Новые совпадения",
+                           matches=pagination.items, pagination=pagination, unseen_by_client=unseen_by_client,
+                           selected_client_id=client_id, show_seen=show_seen)
+
+@matching_bp.route('/inbox/mark-seen', methods=['POST'])
+@login_required
+def mark_matches_seen():
+    """Marks one match (match_id), all of one client's matches (client_id) or every unseen match as reviewed."""
+    query = ClientPropertyMatch.query.filter(ClientPropertyMatch.seen_at.is_(None))
+    match_id = request.form.get('match_id', type=int)
+    client_id = request.form.get('client_id', type=int)
+    if match_id:
+        query = query.filter(ClientPropertyMatch.id == match_id)
+    elif client_id:
+        query = query.filter(ClientPropertyMatch.client_id == client_id)
+    try:
+        updated = query.update({ClientPropertyMatch.seen_at: datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        if not match_id:
+            flash(f"Отмечено как просмотренные: {updated}.", "success")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Ошибка при отметке совпадений: {e}", exc_info=True)
+        flash("Не удалось отметить совпадения как просмотренные.", "danger")
+    return redirect(url_for('matching.new_matches_inbox', client_id=client_id or None))
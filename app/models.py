@@ -3,6 +3,18 @@ from flask_login import UserMixin
 # db is now initialized in app/__init__.py, so we import it from there
 from app import db 
 from datetime import datetime
+import hashlib
+import re
+
+YEAR_PATTERN = re.compile(r'(?<!\d)(1[89]\d\d|20\d\d)(?!\d)')
+
+
+def parse_year(value):
+    """First plausible four-digit year in a free-form string such as '2015', '2015 г.' or 'до 1960'; None otherwise."""
+    if value is None:
+        return None
+    match = YEAR_PATTERN.search(str(value))
+    return int(match.group(1)) if match else None
 
 class Role(db.Model):
     __tablename__ = 'roles'
@@ -71,12 +83,18 @@ class Property(db.Model):
     d_kv = db.Column(db.String(32), nullable=True)   # Дом/квартира номер
 
     year = db.Column(db.String(16), nullable=True) # Год постройки (was year_built, Integer)
+    year_built = db.Column(db.Integer, nullable=True, index=True) # Parsed from `year` for numeric range filters
     description = db.Column(db.Text, nullable=True)
     
     source = db.Column(db.String(32), nullable=True) # Источник объявления (e.g., "OLX", "Krisha", "Manual")
     photos = db.Column(db.Text, nullable=True) # Renamed from image_urls, stores comma-separated or JSON list
     link = db.Column(db.String(512), nullable=True, index=True) # Renamed from source_url (original ad URL)
     external_id = db.Column(db.String(128), nullable=True, index=True) # Updated length from 100
+
+    # Denormalized image summary so list pages never have to touch property_images.
+    # Kept in sync by refresh_image_summary() on every write path that adds/removes images.
+    cover_image_id = db.Column(db.Integer, nullable=True) # No FK: property_images already references properties
+    image_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     added_by_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True) # Was nullable=False
     last_scraped_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -93,7 +111,33 @@ class Property(db.Model):
     images = db.relationship('PropertyImage', backref='property', lazy='dynamic', cascade="all, delete-orphan")
 
     # Unique constraint for source and external_id
-    __table_args__ = (db.UniqueConstraint('source', 'external_id', name='_source_external_id_uc'),)
+    # (created_at, id) index backs the keyset pagination of the property list
+    __table_args__ = (
+        db.UniqueConstraint('source', 'external_id', name='_source_external_id_uc'),
+        db.Index('ix_properties_created_at_id', 'created_at', 'id'),
+        # Filter page / client matching: equality columns first, then the range or sort column
+        db.Index('ix_properties_district_price', 'district', 'price'),
+        db.Index('ix_properties_status_created_at', 'status', 'created_at'),
+        db.Index('ix_properties_cat_price', 'cat', 'price'),
+        db.Index('ix_properties_condition_layout', 'condition', 'layout'),
+        db.Index('ix_properties_price_id', 'price', 'id'),
+        db.Index('ix_properties_area', 'area'),
+        db.Index('ix_properties_floor_total_floors', 'floor', 'total_floors'),
+    )
+
+    @db.validates('year')
+    def _track_year(self, key, value):
+        # Every write path (forms, scrapers, Excel import) sets `year`; keep the typed column in step
+        self.year_built = parse_year(value)
+        return value
+
+    def refresh_image_summary(self):
+        """Recomputes cover_image_id and image_count from property_images (autoflushes pending images)."""
+        cover_image_id, image_count = db.session.query(
+            db.func.min(PropertyImage.id), db.func.count(PropertyImage.id)
+        ).filter(PropertyImage.property_id == self.id).one()
+        self.cover_image_id = cover_image_id
+        self.image_count = image_count
 
     def __repr__(self):
         return f'<Property {self.id} - {self.name}>'
@@ -106,10 +150,61 @@ class PropertyImage(db.Model):
     # Storing path to image is generally preferred. Let's assume path is stored, not blob.
     # If blob is truly needed, uncomment above and ensure DB support.
     # CRITICAL: Use LargeBinary for image_data. DO NOT use String or Text for a path.
-    image_data = db.Column(db.LargeBinary, nullable=False)
+    # Deferred: ordinary queries (templates, cascades) load metadata only. Code that really
+    # needs the bytes opts in via PropertyImage.query_with_data() or read_bytes().
+    # NULL when the bytes live in an external store (see `storage` and app/services/image_storage.py).
+    image_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    storage = db.Column(db.String(16), nullable=False, default='database', server_default='database')
     filename = db.Column(db.String(255), nullable=True) # Original filename for context
     mimetype = db.Column(db.String(50), nullable=True) # e.g., 'image/jpeg', 'image/png'
+    # SHA-256 of image_data (used as the HTTP ETag) and its length, so conditional and
+    # Range requests can be answered without reading the blob. Set by _track_image_data().
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
+    byte_size = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Original bytes saved because normalization did not finish within the request; the normalizer
+    # swaps the processed copy in and clears the flag (served with no-cache until then)
+    normalize_pending = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    @db.validates('image_data')
+    def _track_image_data(self, key, value):
+        if value is not None:
+            self.content_hash = hashlib.sha256(value).hexdigest()
+            self.byte_size = len(value)
+        return value
+
+    @classmethod
+    def from_bytes(cls, data, **kwargs):
+        """Builds an image record, putting the bytes in the configured backend (IMAGE_STORAGE_BACKEND)."""
+        image = cls(**kwargs)
+        image.store_bytes(data)
+        return image
+
+    def store_bytes(self, data):
+        """Puts new bytes in the configured backend; the previous file (if any) is left for images-gc."""
+        from app.services.image_storage import get_storage, content_hash_for
+        storage = get_storage()
+        if storage is None:
+            self.image_data = data
+            self.storage = 'database'
+        else:
+            self.content_hash = content_hash_for(data)
+            self.byte_size = len(data)
+            storage.save(self.content_hash, data)
+            self.image_data = None
+            self.storage = storage.name
+
+    def read_bytes(self):
+        """Returns the image bytes from whichever backend holds them."""
+        if self.storage == 'database':
+            return self.image_data
+        from app.services.image_storage import get_storage
+        return get_storage(self.storage).read(self.content_hash)
+
+    @classmethod
+    def query_with_data(cls):
+        """Query that loads image_data eagerly; for the byte-serving route and exporters only."""
+        return cls.query.options(db.undefer(cls.image_data))
 
     def __repr__(self):
         return f'<PropertyImage {self.id} for Property {self.property_id}>'
@@ -132,11 +227,103 @@ class Client(db.Model):
     # Decided not to add backref immediately to User to keep it simple, can be added later.
     # For consistency, let's ensure added_by relationship is available for querying
     added_by = db.relationship('User', backref=db.backref('created_clients', lazy='dynamic')) # Changed backref
+    # Typed, indexed copy of `interests` used for matching; kept in sync by _sync_interest_criteria
+    interest_criteria = db.relationship('ClientInterest', uselist=False, back_populates='client', cascade="all, delete-orphan")
 
+    @db.validates('interests')
+    def _sync_interest_criteria(self, key, value):
+        ClientInterest.sync(self, value)
+        return value
 
     def __repr__(self):
         return f'<Client {self.name}>'
 
+class ClientInterest(db.Model):
+    """Matching criteria from Client.interests as typed columns (NULL = no constraint), one row per client."""
+    __tablename__ = 'client_interests'
+    __table_args__ = (
+        db.Index('ix_client_interests_price', 'min_price', 'max_price'),
+        db.Index('ix_client_interests_area', 'min_area', 'max_area'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id', ondelete='CASCADE'), nullable=False, unique=True)
+    min_price = db.Column(db.Float, nullable=True)
+    max_price = db.Column(db.Float, nullable=True)
+    min_area = db.Column(db.Float, nullable=True)
+    max_area = db.Column(db.Float, nullable=True)
+    min_floor = db.Column(db.Integer, nullable=True)
+    max_floor = db.Column(db.Integer, nullable=True)
+    year_built_from = db.Column(db.Integer, nullable=True)
+    year_built_to = db.Column(db.Integer, nullable=True)
+    # Denormalized "no district terms" flag: reverse matching reaches clients with districts through the
+    # (field, value) term index and the rest through this index, never by scanning every client
+    any_district = db.Column(db.Boolean, nullable=False, default=True, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    client = db.relationship('Client', back_populates='interest_criteria')
+    terms = db.relationship('ClientInterestTerm', lazy='selectin', cascade="all, delete-orphan")
+
+    # (lower column, upper column, Property column); the interests JSON uses the same key names
+    RANGE_COLUMNS = (
+        ('min_price', 'max_price', 'price'),
+        ('min_area', 'max_area', 'area'),
+        ('min_floor', 'max_floor', 'floor'),
+        ('year_built_from', 'year_built_to', 'year_built'),
+    )
+
+    @classmethod
+    def sync(cls, client, interests):
+        """Creates, updates or removes client.interest_criteria to mirror the `interests` JSON."""
+        from app.services.client_matching import parse_interests
+        parsed = parse_interests(interests)
+        if parsed is None:
+            client.interest_criteria = None
+            return
+        row = client.interest_criteria
+        if row is None:
+            row = client.interest_criteria = cls()
+        for low_column, high_column, column in cls.RANGE_COLUMNS:
+            low, high = parsed['ranges'].get(column, (None, None)) # Floor and year bounds are already ints
+            setattr(row, low_column, low)
+            setattr(row, high_column, high)
+        wanted = {(field, value[:100]) for field, values in parsed['terms'].items() for value in values}
+        kept = [term for term in row.terms if (term.field, term.value) in wanted]
+        existing = {(term.field, term.value) for term in kept}
+        row.terms = kept + [ClientInterestTerm(field=field, value=value) for field, value in sorted(wanted - existing)]
+        row.any_district = 'district' not in parsed['terms']
+
+    def to_parsed(self):
+        """The same {'ranges', 'terms'} structure as client_matching.parse_interests, without touching the JSON."""
+        ranges = {}
+        for low_column, high_column, column in self.RANGE_COLUMNS:
+            low, high = getattr(self, low_column), getattr(self, high_column)
+            if low is not None or high is not None:
+                ranges[column] = (low, high)
+        terms = {}
+        for term in self.terms:
+            terms.setdefault(term.field, set()).add(term.value)
+        return {'ranges': ranges, 'terms': terms}
+
+    def __repr__(self):
+        return f'<ClientInterest for Client {self.client_id}>'
+
+class ClientInterestTerm(db.Model):
+    """
+    One accepted value of a set-type criterion (field is the Property column: district, condition
+    or layout). A client with no rows for a field accepts any value; (field, value) is indexed so
+    "which clients want this district" is an index lookup.
+    """
+    __tablename__ = 'client_interest_terms'
+    __table_args__ = (
+        db.Index('ix_client_interest_terms_field_value', 'field', 'value'),
+    )
+    client_interest_id = db.Column(db.Integer, db.ForeignKey('client_interests.id', ondelete='CASCADE'), primary_key=True)
+    field = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(100), primary_key=True)
+
+    def __repr__(self):
+        return f'<ClientInterestTerm {self.client_interest_id}: {self.field}={self.value}>'
+
 import enum
 
 class DealStatusEnum(enum.Enum):
@@ -158,11 +345,15 @@ class DealStatusEnum(enum.Enum):
 
 class Deal(db.Model):
     __tablename__ = 'deals'
+    __table_args__ = (
+        # Kanban: per-stage LIMIT seeks for the board and "load more", newest first
+        db.Index('ix_deals_stage_updated_at_id', 'stage', 'updated_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False, default="Сделка")
-    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
-    property_id = db.Column(db.Integer, db.ForeignKey('properties.id'), nullable=False)
-    agent_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False) # Responsible agent
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False, index=True)
+    property_id = db.Column(db.Integer, db.ForeignKey('properties.id'), nullable=False, index=True)
+    agent_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True) # Responsible agent
     
     stage = db.Column(db.String(50), nullable=False, default=DealStatusEnum.NEW.value)
     
@@ -194,3 +385,116 @@ class PropertyHistory(db.Model):
 
     def __repr__(self):
         return f'<PropertyHistory {self.id} for Property {self.property_id} - Field: {self.field_name}>'
+
+class ClientPropertyMatch(db.Model):
+    """A listing that matched a client's interests when it was ingested (scraper or Excel import)."""
+    __tablename__ = 'client_property_matches'
+    __table_args__ = (
+        db.UniqueConstraint('client_id', 'property_id', name='uq_client_property_matches_client_property'),
+        # "New matches" inbox: unseen rows, newest first
+        db.Index('ix_client_property_matches_seen_at_created_at', 'seen_at', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id', ondelete='CASCADE'), nullable=False, index=True)
+    property_id = db.Column(db.Integer, db.ForeignKey('properties.id', ondelete='CASCADE'), nullable=False, index=True)
+    source = db.Column(db.String(50), nullable=True) # Batch that produced the match: scraper name or "Excel Import"
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    seen_at = db.Column(db.DateTime, nullable=True) # Set when an agent dismisses it from the inbox
+
+    client = db.relationship('Client', backref=db.backref('property_matches', lazy='dynamic', cascade="all, delete-orphan"))
+    property = db.relationship('Property', backref=db.backref('client_matches', lazy='dynamic', cascade="all, delete-orphan"))
+
+    def __repr__(self):
+        return f'<ClientPropertyMatch client={self.client_id} property={self.property_id}>'
+
+class RollupCounter(db.Model):
+    """
+    Precomputed row count for the dashboard: one row per (scope, dimension, value), e.g.
+    (0, 'properties.district', 'Алмалинский'). agent_id 0 is the global scope, otherwise the user
+    who added the property/client or is responsible for the deal. Maintained by
+    app/services/rollups.py on every flush and rebuilt by `flask rollups-reconcile`.
+    """
+    __tablename__ = 'rollup_counters'
+    __table_args__ = (
+        db.UniqueConstraint('agent_id', 'dimension', 'value', name='uq_rollup_counters_agent_dimension_value'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    agent_id = db.Column(db.Integer, nullable=False, default=0) # No FK: 0 is the global scope
+    dimension = db.Column(db.String(40), nullable=False) # 'properties', 'properties.source', 'deals.stage', ...
+    value = db.Column(db.String(100), nullable=False, default='') # '' for totals and unset values
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<RollupCounter {self.agent_id}:{self.dimension}={self.value!r} {self.count}>'
+
+class DealStageTransition(db.Model):
+    """Append-only log of deal stage changes (from_stage is NULL for the creation of the deal)."""
+    __tablename__ = 'deal_stage_transitions'
+    __table_args__ = (
+        db.Index('ix_deal_stage_transitions_deal_id_transitioned_at', 'deal_id', 'transitioned_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    deal_id = db.Column(db.Integer, db.ForeignKey('deals.id', ondelete='SET NULL'), nullable=True) # History outlives the deal
+    agent_id = db.Column(db.Integer, nullable=True) # Deal's agent at the time of the transition
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True) # Who moved the deal
+    from_stage = db.Column(db.String(50), nullable=True)
+    to_stage = db.Column(db.String(50), nullable=False)
+    transitioned_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    seconds_in_stage = db.Column(db.Float, nullable=True) # Time spent in from_stage
+
+    def __repr__(self):
+        return f'<DealStageTransition deal={self.deal_id} {self.from_stage} -> {self.to_stage}>'
+
+class DealStageMonthly(db.Model):
+    """Per month, agent and stage: deals that entered / left the stage and total time spent in it before leaving."""
+    __tablename__ = 'deal_stage_monthly'
+    __table_args__ = (
+        db.UniqueConstraint('month', 'agent_id', 'stage', name='uq_deal_stage_monthly_month_agent_stage'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False) # 'YYYY-MM' of the transition (UTC)
+    agent_id = db.Column(db.Integer, nullable=False)
+    stage = db.Column(db.String(50), nullable=False)
+    entered = db.Column(db.Integer, nullable=False, default=0)
+    exited = db.Column(db.Integer, nullable=False, default=0)
+    seconds_total = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<DealStageMonthly {self.month} agent={self.agent_id} {self.stage}>'
+
+class DealStageDuration(db.Model):
+    """
+    Histogram of time-in-stage on a logarithmic scale (see app/services/deal_analytics.py), per
+    stage for every agent and for all agents (agent_id 0); medians are read from the buckets.
+    """
+    __tablename__ = 'deal_stage_durations'
+    __table_args__ = (
+        db.UniqueConstraint('agent_id', 'stage', 'bucket', name='uq_deal_stage_durations_agent_stage_bucket'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    agent_id = db.Column(db.Integer, nullable=False)
+    stage = db.Column(db.String(50), nullable=False)
+    bucket = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DealStageDuration agent={self.agent_id} {self.stage} bucket={self.bucket}: {self.count}>'
+
+class MatchingReport(db.Model):
+    """
+    A built bulk matching report (app/services/client_matching.py: bulk_match_report), written by
+    `flask matching-report` or the admin page's background rebuild; the page shows the newest one.
+    """
+    __tablename__ = 'matching_reports'
+    id = db.Column(db.Integer, primary_key=True)
+    generated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    top_n = db.Column(db.Integer, nullable=False)
+    property_count = db.Column(db.Integer, nullable=False)
+    client_count = db.Column(db.Integer, nullable=False)
+    skipped_clients = db.Column(db.Integer, nullable=False, default=0)
+    load_ms = db.Column(db.Float, nullable=False)
+    total_ms = db.Column(db.Float, nullable=False)
+    rows = db.Column(db.JSON, nullable=False) # [{'client_id', 'client_name', 'count', 'top_property_ids'}]
+
+    def __repr__(self):
+        return f'<MatchingReport {self.id} {self.generated_at}>'
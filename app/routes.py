@@ -1,13 +1,28 @@
-from flask import render_template, redirect, url_for, flash, request, abort, current_app, Response, send_from_directory
+from flask import render_template, redirect, url_for, flash, request, abort, current_app, Response, send_from_directory, send_file, jsonify
 from app import app, db, login_manager
 from app.forms import LoginForm, RegistrationForm, PropertyForm, PropertyImportForm, PropertyFilterForm
 from app.models import User, Role, Property, PropertyHistory, PropertyImage # Ensured PropertyImage is imported
+from app.services.image_storage import get_storage, STORAGE_DATABASE
+from app.services.image_variants import get_variant_path, normalize_width, variant_mimetype
+from app.services.image_processing import NormalizationBudget, submit_normalization
+from app.services.http_client import fetch, FetchError
+from app.services.facets import get_facet_choices, get_facet_counts
+from app.services.property_filters import normalize_filter, filter_criteria
+from app.services.property_index import get_property_index, load_properties
+from app.services.search import search_properties, search_clients
+from app.services.address_index import fuzzy_address_matches
+from app.services.client_matching import record_new_matches
+from app.services.autocomplete import suggest, KIND_PROPERTY, KIND_DISTRICT, KIND_CLIENT
+from app.services.rollups import counters_for, agent_totals, GLOBAL_SCOPE
 from flask_login import login_user, logout_user, current_user, login_required
 from datetime import datetime
-from sqlalchemy import inspect 
+from sqlalchemy import inspect, tuple_
 import pandas as pd
 import os
 from werkzeug.utils import secure_filename
+from werkzeug.datastructures import ContentRange
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import is_resource_modified
 import pdfkit 
 from urllib.parse import urlparse # For PropertyForm image handling
 from uuid import uuid4 # For PropertyForm image handling
@@ -68,20 +83,84 @@ def profile():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    from app.models import Client # Delayed import if needed
+    # Counters from rollup_counters (kept up to date on every flush) instead of COUNT(*) over the tables
+    counters = counters_for([GLOBAL_SCOPE, current_user.id])
+    overall, mine = counters[GLOBAL_SCOPE], counters[current_user.id]
+
+    def total(scope, prefix):
+        return scope.get(prefix, {}).get('', 0)
+
+    def breakdown(scope, dimension, limit=None):
+        items = sorted(scope.get(dimension, {}).items(), key=lambda item: (-item[1], item[0]))
+        return items[:limit] if limit else items
+
     stats = {
-        'num_properties': Property.query.count(), 
-        'num_clients': Client.query.count(), 
-        'num_deals': 0 # Placeholder for Deal model
+        'num_properties': total(overall, 'properties'),
+        'num_clients': total(overall, 'clients'),
+        'num_deals': total(overall, 'deals'),
+        'my_properties': total(mine, 'properties'),
+        'my_clients': total(mine, 'clients'),
+        'my_deals': total(mine, 'deals'),
+    }
+    breakdowns = {
+        'source': breakdown(overall, 'properties.source'),
+        'status': breakdown(overall, 'properties.status'),
+        'district': breakdown(overall, 'properties.district', limit=10),
+        'stage': breakdown(overall, 'deals.stage'),
+        'my_stage': breakdown(mine, 'deals.stage'),
     }
-    return render_template('dashboard.html', title='Панель управления', stats=stats)
+    agents = agent_totals()
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_([agent_id for agent_id, _ in agents]))) if agents else {}
+    return render_template('dashboard.html', title='Панель управления', stats=stats, breakdowns=breakdowns,
+                           agents=[(usernames.get(agent_id, f'ID {agent_id}'), totals) for agent_id, totals in agents])
 
 # Property Routes
+
+# Columns rendered by the property list; description, photos and the other wide
+# text columns stay deferred so a page never pulls them from the DB.
+PROPERTY_LIST_COLUMNS = (
+    Property.id, Property.name, Property.address, Property.street, Property.district,
+    Property.price, Property.area, Property.floor, Property.total_floors, Property.year,
+    Property.source, Property.status, Property.added_by_user_id, Property.created_at,
+    Property.cover_image_id, Property.image_count,
+)
+
+def _encode_property_cursor(prop):
+    """Cursor for keyset pagination: '<created_at ISO>_<id>' of the last row on the page."""
+    return f"{prop.created_at.isoformat()}_{prop.id}"
+
+def _decode_property_cursor(cursor):
+    """Returns (created_at, id) from a cursor string or None if it is malformed."""
+    try:
+        created_at_str, id_str = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at_str), int(id_str)
+    except (AttributeError, ValueError):
+        return None
+
 @app.route('/properties')
 @login_required
 def list_properties():
-    properties = Property.query.order_by(Property.created_at.desc()).all()
-    return render_template('properties/properties.html', properties=properties, title='Объекты недвижимости')
+    per_page = current_app.config.get('PROPERTIES_PER_PAGE', 50)
+    cursor = request.args.get('cursor')
+
+    query = Property.query.options(db.load_only(*PROPERTY_LIST_COLUMNS))
+    if cursor:
+        decoded_cursor = _decode_property_cursor(cursor)
+        if decoded_cursor:
+            # Seek past the last seen row instead of OFFSET, so every page is an index range scan
+            query = query.filter(tuple_(Property.created_at, Property.id) < decoded_cursor)
+        else:
+            flash('Некорректная ссылка на страницу списка, показана первая страница.', 'warning')
+            cursor = None
+
+    properties = query.order_by(Property.created_at.desc(), Property.id.desc()).limit(per_page + 1).all()
+    next_cursor = None
+    if len(properties) > per_page:
+        properties = properties[:per_page]
+        next_cursor = _encode_property_cursor(properties[-1])
+
+    return render_template('properties/properties.html', properties=properties, title='Объекты недвижимости',
+                           next_cursor=next_cursor, is_first_page=not cursor)
 
 @app.route('/properties/add', methods=['GET', 'POST'])
 @login_required
@@ -105,21 +184,22 @@ def add_property():
 
         if form.photos.data: # This is now a TextAreaField with comma-separated URLs
             image_urls = [url.strip() for url in form.photos.data.split(',') if url.strip()]
+            pending_images = [] # (normalization future, original bytes, mimetype, filename); resized while the next one downloads
             for img_url in image_urls[:10]: # Limit number of images
                 try:
-                    img_response = requests.get(img_url, timeout=10)
-                    img_response.raise_for_status()
-                    new_image_record = PropertyImage(
-                        property_id=new_property.id, 
-                        image_data=img_response.content, 
-                        mimetype=img_response.headers.get('Content-Type', 'application/octet-stream'),
-                        filename=os.path.basename(urlparse(img_url).path) or f"image_{uuid4().hex[:6]}"
-                    )
-                    db.session.add(new_image_record)
+                    img_response = fetch(img_url, timeout=10, max_retries=0)
+                    mimetype = img_response.headers.get('Content-Type', 'application/octet-stream')
+                    filename = os.path.basename(urlparse(img_url).path) or f"image_{uuid4().hex[:6]}"
+                    pending_images.append((submit_normalization(img_response.content, mimetype, filename),
+                                           img_response.content, mimetype, filename))
                     app.logger.info(f"Downloaded and queued image from URL: {img_url} for property {new_property.id}")
                 except Exception as e:
                     app.logger.error(f"Could not download/store image {img_url} for property {new_property.id}: {e}", exc_info=True)
                     flash(f"Не удалось загрузить изображение: {img_url}", "warning")
+            budget = NormalizationBudget()
+            for pending_image in pending_images:
+                db.session.add(budget.image(*pending_image, property_id=new_property.id))
+        new_property.refresh_image_summary()
         try:
             db.session.commit()
             flash('Объект успешно добавлен!', 'success')
@@ -136,8 +216,15 @@ def add_property():
 @login_required
 def view_property(property_id):
     property_item = Property.query.get_or_404(property_id)
-    # Images will be accessed via property_item.images in the template
-    return render_template('properties/property_detail.html', property=property_item, title=property_item.name)
+    # Metadata only: the gallery links to serve_property_image, blobs are never loaded here
+    images = db.session.query(PropertyImage.id, PropertyImage.filename)\
+        .filter(PropertyImage.property_id == property_item.id).order_by(PropertyImage.id).all()
+    gallery_urls = [url_for('serve_property_image', image_id=image.id) for image in images]
+    gallery_filenames = [image.filename for image in images]
+    gallery_srcsets = [image_srcset(image.id) for image in images]
+    return render_template('properties/property_detail.html', property=property_item, title=property_item.name,
+                           images=images, gallery_urls=gallery_urls, gallery_filenames=gallery_filenames,
+                           gallery_srcsets=gallery_srcsets)
 
 @app.route('/properties/<int:property_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -206,21 +293,22 @@ def edit_property(property_id):
             app.logger.info(f"Cleared existing images for property ID {property_to_edit.id} due to new photo URL submission.")
             
             image_urls = [url.strip() for url in form.photos.data.split(',') if url.strip()]
+            pending_images = []
             for img_url in image_urls[:10]: # Limit number of new images
                 try:
-                    img_response = requests.get(img_url, timeout=10)
-                    img_response.raise_for_status()
-                    new_image_record = PropertyImage(
-                        property_id=property_to_edit.id, 
-                        image_data=img_response.content, 
-                        mimetype=img_response.headers.get('Content-Type', 'application/octet-stream'),
-                        filename=os.path.basename(urlparse(img_url).path) or f"image_{uuid4().hex[:6]}"
-                    )
-                    db.session.add(new_image_record)
+                    img_response = fetch(img_url, timeout=10, max_retries=0)
+                    mimetype = img_response.headers.get('Content-Type', 'application/octet-stream')
+                    filename = os.path.basename(urlparse(img_url).path) or f"image_{uuid4().hex[:6]}"
+                    pending_images.append((submit_normalization(img_response.content, mimetype, filename),
+                                           img_response.content, mimetype, filename))
                     app.logger.info(f"Downloaded and queued new image from URL: {img_url} for property {property_to_edit.id}")
                 except Exception as e:
                     app.logger.error(f"Could not download/store image {img_url} for property {property_to_edit.id}: {e}", exc_info=True)
                     flash(f"Не удалось загрузить изображение: {img_url}", "warning")
+            budget = NormalizationBudget()
+            for pending_image in pending_images:
+                db.session.add(budget.image(*pending_image, property_id=property_to_edit.id))
+            property_to_edit.refresh_image_summary()
         
         try:
             db.session.commit()
@@ -267,61 +355,172 @@ def property_history(property_id):
 #     return send_from_directory(base_upload_dir, filename)
 
 # NEW Route to serve images directly from DB (PropertyImage.image_data)
+IMAGE_CACHE_MAX_AGE = 604800 # 7 days
+
+def _image_etag(image_record):
+    """Strong ETag from the content hash; rows not yet backfilled fall back to id + creation time."""
+    if image_record.content_hash:
+        return image_record.content_hash
+    created = image_record.created_at.strftime('%Y%m%d%H%M%S%f') if image_record.created_at else '0'
+    return f"img-{image_record.id}-{created}"
+
+def _set_image_cache_headers(response, image_record, etag):
+    # No Last-Modified: the bytes behind an image id are rewritten after creation (ingest
+    # normalization), so only the content-hash ETag may validate conditional and If-Range requests
+    response.set_etag(etag)
+    response.headers.pop('Last-Modified', None)
+    response.cache_control.public = True
+    if image_record.normalize_pending:
+        # The processed copy replaces these bytes shortly: cached copies must be revalidated
+        response.cache_control.no_cache = True
+        response.cache_control.max_age = 0
+        response.headers.pop('Expires', None)
+    else:
+        response.cache_control.max_age = IMAGE_CACHE_MAX_AGE
+    response.accept_ranges = 'bytes'
+    return response
+
+def _single_byte_range():
+    """The request's Range when it asks for one byte range; others (multi-range) are ignored and the whole image is sent."""
+    byte_range = request.range
+    if byte_range is not None and byte_range.units == 'bytes' and len(byte_range.ranges) == 1:
+        return byte_range
+    return None
+
+def _if_range_matches(if_range, etag):
+    """If-Range: honour the Range header only while the client's copy is still current."""
+    if if_range.etag is None and if_range.date is None:
+        return True # No If-Range header sent
+    # A date cannot prove that: no Last-Modified is sent, the ETag is the only validator
+    return if_range.etag is not None and if_range.etag == etag
+
+def _send_image_file(path, mimetype, image_record, etag):
+    """send_file (wsgi.file_wrapper/sendfile, or X-Sendfile when USE_X_SENDFILE is on) with the image validators."""
+    response = send_file(path, mimetype=mimetype, etag=etag, max_age=IMAGE_CACHE_MAX_AGE, conditional=False)
+    response.headers.pop('Last-Modified', None) # send_file sets the file's mtime
+    environ = request.environ
+    if request.range is not None and _single_byte_range() is None:
+        environ = dict(environ)
+        del environ['HTTP_RANGE'] # werkzeug would answer 416 to a multi-range request
+    try:
+        response = response.make_conditional(environ, accept_ranges=True, complete_length=os.path.getsize(path))
+    except RequestedRangeNotSatisfiable:
+        response.close()
+        raise
+    if response.status_code == 304:
+        response.headers.pop('X-Sendfile', None)
+    return _set_image_cache_headers(response, image_record, etag)
+
 @app.route('/property_image/<int:image_id>')
 def serve_property_image(image_id):
-    # Import PropertyImage here to avoid circular dependency if models imports routes, though less likely with blueprints
-    # from app.models import PropertyImage 
-    
+    # Metadata only (image_data is deferred): revalidations are answered without touching the blob
     image_record = PropertyImage.query.get_or_404(image_id)
-    
-    if not image_record.image_data:
+    etag = _image_etag(image_record)
+    mimetype = image_record.mimetype or 'application/octet-stream'
+
+    # ?w=320 asks for a resized variant; widths snap to IMAGE_VARIANT_WIDTHS so the cache stays bounded
+    width = request.args.get('w', type=int)
+    if width and width > 0 and image_record.content_hash:
+        width = normalize_width(width)
+        etag = f"{etag}-w{width}"
+    else:
+        width = None
+
+    if not is_resource_modified(request.environ, etag=etag):
+        return _set_image_cache_headers(Response(status=304), image_record, etag)
+
+    if width:
+        try:
+            variant_path = get_variant_path(image_record, width)
+        except Exception as e:
+            app.logger.error(f"Failed to build {width}px variant for PropertyImage ID: {image_id}: {e}")
+            variant_path = None
+        if variant_path:
+            return _send_image_file(variant_path, variant_mimetype(), image_record, etag)
+        # Original is already no wider than requested (or could not be decoded): serve it under the variant ETag
+
+    if image_record.storage != STORAGE_DATABASE:
+        # File store: streamed by send_file, which also answers Range requests
+        image_path = get_storage(image_record.storage).path_for(image_record.content_hash)
+        if not os.path.exists(image_path):
+            app.logger.warning(f"Image file missing from store for PropertyImage ID: {image_id} ({image_record.content_hash})")
+            abort(404)
+        return _send_image_file(image_path, mimetype, image_record, etag)
+
+    total_size = image_record.byte_size
+    byte_range = _single_byte_range()
+    if byte_range and total_size and _if_range_matches(request.if_range, etag):
+        requested = byte_range.range_for_length(total_size)
+        if requested is None: # The one range lies outside the image
+            response = Response(status=416)
+            response.content_range = ContentRange('bytes', None, None, total_size)
+            return _set_image_cache_headers(response, image_record, etag)
+        start, stop = requested
+        # SUBSTR is 1-based and works on SQLite BLOBs and PostgreSQL bytea, so only the slice is read
+        chunk = db.session.query(db.func.substr(PropertyImage.image_data, start + 1, stop - start))\
+            .filter(PropertyImage.id == image_id).scalar()
+        response = Response(bytes(chunk or b''), status=206, mimetype=mimetype)
+        response.content_range = ContentRange('bytes', start, stop, total_size)
+        return _set_image_cache_headers(response, image_record, etag)
+
+    image_data = db.session.query(PropertyImage.image_data).filter(PropertyImage.id == image_id).scalar()
+    if not image_data:
         app.logger.warning(f"No image data found for PropertyImage ID: {image_id}")
         abort(404)
 
-    response = Response(image_record.image_data, mimetype=image_record.mimetype or 'application/octet-stream')
-    response.headers['Cache-Control'] = 'public, max-age=604800' # Cache for 7 days
+    response = Response(image_data, mimetype=mimetype)
     # response.headers['Content-Disposition'] = f'inline; filename="{image_record.filename or "image.jpg"}"'
-    return response
+    return _set_image_cache_headers(response, image_record, etag)
+
+@app.template_global()
+def image_srcset(image_id, widths=None):
+    """srcset value listing the resized variants of a property image."""
+    widths = widths or current_app.config['IMAGE_VARIANT_WIDTHS']
+    return ', '.join(f"{url_for('serve_property_image', image_id=image_id, w=width)} {width}w" for width in widths)
+
+@app.route('/properties/<int:property_id>/images.json')
+@login_required
+def property_images_json(property_id):
+    """Image metadata for the gallery modal; reads ids/filenames only, never the blobs."""
+    images = db.session.query(PropertyImage.id, PropertyImage.filename)\
+        .filter(PropertyImage.property_id == property_id).order_by(PropertyImage.id).all()
+    return jsonify([
+        {"url": url_for('serve_property_image', image_id=image_id), "srcset": image_srcset(image_id), "filename": filename}
+        for image_id, filename in images
+    ])
 
 @app.route('/properties/filter', methods=['GET'])
 @login_required
 def filter_properties():
     form = PropertyFilterForm(request.args, meta={'csrf': False}) 
 
-    distinct_districts = db.session.query(Property.district).distinct().filter(Property.district.isnot(None)).filter(Property.district != '').order_by(Property.district).all()
-    form.district.choices = [('', 'Любой район')] + [(d[0], d[0]) for d in distinct_districts]
-    distinct_conditions = db.session.query(Property.condition).distinct().filter(Property.condition.isnot(None)).filter(Property.condition != '').order_by(Property.condition).all()
-    form.condition.choices = [('', 'Любое состояние')] + [(c[0], c[0]) for c in distinct_conditions]
-    distinct_layouts = db.session.query(Property.layout).distinct().filter(Property.layout.isnot(None)).filter(Property.layout != '').order_by(Property.layout).all()
-    form.layout.choices = [('', 'Любая планировка')] + [(l[0], l[0]) for l in distinct_layouts]
-    distinct_cats = db.session.query(Property.cat).distinct().filter(Property.cat.isnot(None)).filter(Property.cat != '').order_by(Property.cat).all()
-    form.cat.choices = [('', 'Любая категория')] + [(c[0], c[0]) for c in distinct_cats]
-    distinct_statuses = db.session.query(Property.status).distinct().filter(Property.status.isnot(None)).filter(Property.status != '').order_by(Property.status).all()
-    form.status.choices = [('', 'Любой статус')] + [(s[0], s[0]) for s in distinct_statuses]
-
-    query = Property.query
-    if form.min_price.data is not None: query = query.filter(Property.price >= form.min_price.data)
-    if form.max_price.data is not None: query = query.filter(Property.price <= form.max_price.data)
-    if form.district.data: query = query.filter(Property.district == form.district.data)
-    if form.min_area.data is not None: query = query.filter(Property.area >= form.min_area.data)
-    if form.max_area.data is not None: query = query.filter(Property.area <= form.max_area.data)
-    if form.min_floor.data is not None: query = query.filter(Property.floor >= form.min_floor.data)
-    if form.max_floor.data is not None: query = query.filter(Property.floor <= form.max_floor.data)
-    if form.year_from.data: query = query.filter(Property.year >= form.year_from.data) 
-    if form.year_to.data: query = query.filter(Property.year <= form.year_to.data)
-    if form.condition.data: query = query.filter(Property.condition == form.condition.data)
-    if form.layout.data: query = query.filter(Property.layout == form.layout.data)
-    if form.cat.data: query = query.filter(Property.cat == form.cat.data)
-    if form.status.data: query = query.filter(Property.status == form.status.data)
-    if form.total_floors_min.data is not None: query = query.filter(Property.total_floors >= form.total_floors_min.data)
-    if form.total_floors_max.data is not None: query = query.filter(Property.total_floors <= form.total_floors_max.data)
-
-    filtered_properties = query.order_by(Property.created_at.desc()).all() 
+    # Drop-down choices come from the facet cache (one UNION ALL query when cold, invalidated on Property commits)
+    facet_choices = get_facet_choices()
+    form.district.choices = [('', 'Любой район')] + [(d, d) for d in facet_choices['district']]
+    form.condition.choices = [('', 'Любое состояние')] + [(c, c) for c in facet_choices['condition']]
+    form.layout.choices = [('', 'Любая планировка')] + [(l, l) for l in facet_choices['layout']]
+    form.cat.choices = [('', 'Любая категория')] + [(c, c) for c in facet_choices['cat']]
+    form.status.choices = [('', 'Любой статус')] + [(s, s) for s in facet_choices['status']]
+
+    filters = normalize_filter(form.data)
+    property_index = get_property_index() # None unless PROPERTY_INDEX_ENABLED
+    if property_index is not None:
+        filtered_properties = load_properties(property_index.search(filters))
+    else:
+        filtered_properties = Property.query.filter(*filter_criteria(filters))\
+            .order_by(Property.created_at.desc(), Property.id.desc()).all()
     if request.args and not filtered_properties: flash('По вашему запросу объекты не найдены.', 'info')
     
     return render_template('properties/filter_properties.html', 
                            title="Фильтр объектов", form=form, properties=filtered_properties)
 
+@app.route('/properties/filter/facets')
+@login_required
+def filter_facet_counts():
+    """Option counts for the filter page drop-downs under the filter currently entered (JSON)."""
+    form = PropertyFilterForm(request.args, meta={'csrf': False})
+    return jsonify(get_facet_counts(normalize_filter(form.data)))
+
 @app.route('/properties/export/pdf')
 @login_required
 def export_properties_pdf():
@@ -346,10 +545,8 @@ def export_properties_pdf():
         flash(f"Произошла ошибка при генерации PDF: {str(e)}", "danger")
         return redirect(url_for('list_properties'))
 
-from sqlalchemy import or_, func
 from urllib.parse import urlparse
 from uuid import uuid4
-import requests # Added for Excel import image fetching, though might be already imported
 import mimetypes # Added for Excel import image fetching
 from werkzeug.utils import secure_filename # Added for Excel import image filename
 
@@ -361,29 +558,47 @@ def global_search_results():
     search_query = request.args.get('query', '').strip()
     property_results = []
     client_results = []
+    address_results = []
     if not search_query:
         flash("Пожалуйста, введите поисковый запрос.", "info")
     else:
-        search_term = f"%{search_query.lower()}%"
-        property_results = Property.query.filter(
-            or_(
-                func.lower(Property.name).like(search_term), func.lower(Property.address).like(search_term),
-                func.lower(Property.district).like(search_term), func.lower(Property.description).like(search_term),
-                func.lower(Property.street).like(search_term), func.lower(Property.cat).like(search_term),
-                func.lower(Property.status).like(search_term) 
-            )
-        ).limit(20).all()
-        client_results = Client.query.filter(
-            or_(
-                func.lower(Client.name).like(search_term), func.lower(Client.email).like(search_term),
-                func.lower(Client.phone).like(search_term), func.lower(Client.notes).like(search_term)
-            )
-        ).limit(20).all()
-        if not property_results and not client_results:
+        # Ranked full-text search (FTS5 / tsvector); see app/services/search.py
+        property_results = search_properties(search_query, limit=20)
+        client_results = search_clients(search_query, limit=20)
+        # Typo-tolerant address matches (trigram similarity) that full-text search did not return
+        found_ids = {prop.id for prop in property_results}
+        address_matches = [(property_id, similarity) for property_id, similarity in fuzzy_address_matches(search_query, limit=20)
+                           if property_id not in found_ids]
+        similarity_by_id = dict(address_matches)
+        address_results = [(prop, similarity_by_id[prop.id])
+                           for prop in load_properties([property_id for property_id, _ in address_matches])]
+        if not property_results and not client_results and not address_results:
             flash("По вашему запросу ничего не найдено.", "info")
     return render_template('main/global_search_results.html', 
                            title=f"Результаты поиска: {search_query}", search_query=search_query,
-                           property_results=property_results, client_results=client_results)
+                           property_results=property_results, client_results=client_results,
+                           address_results=address_results)
+
+@app.route('/search/autocomplete')
+@login_required
+def search_autocomplete():
+    """Typeahead suggestions for the navbar search (JSON): property names, streets, districts, clients."""
+    prefix = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 10, type=int) or 10, 20)
+    if len(prefix) < 2:
+        return jsonify({'query': prefix, 'suggestions': []})
+    suggestions = []
+    for item in suggest(prefix, limit=limit):
+        if item['kind'] == KIND_PROPERTY:
+            url = url_for('view_property', property_id=item['id'])
+        elif item['kind'] == KIND_CLIENT:
+            url = url_for('client.edit_client', client_id=item['id'])
+        elif item['kind'] == KIND_DISTRICT:
+            url = url_for('filter_properties', district=item['label'])
+        else:
+            url = url_for('global_search_results', query=item['label'])
+        suggestions.append({'kind': item['kind'], 'label': item['label'], 'url': url})
+    return jsonify({'query': prefix, 'suggestions': suggestions})
 
 @app.route('/properties/import', methods=['GET', 'POST'])
 @login_required
@@ -401,6 +616,8 @@ def import_properties():
         try:
             df = pd.read_excel(temp_file_path)
             added_count = 0; error_count = 0; skipped_count = 0
+            imported_properties = []
+            normalization_budget = NormalizationBudget() # Shared by all rows: later photos are normalized after the commit
             col_map = {key.replace('_col',''): getattr(form, key).data for key in dir(form) if key.endswith('_col')}
 
             required_db_fields = ['name', 'price', 'area'] 
@@ -457,10 +674,10 @@ def import_properties():
 
                     if prop_data.get('photos') and isinstance(prop_data.get('photos'), str):
                         image_urls = [url.strip() for url in prop_data.get('photos').split(',') if url.strip()]
+                        pending_images = []
                         for img_url in image_urls[:10]: # Limit to 10 images
                             try:
-                                response = requests.get(img_url.strip(), timeout=15) # Increased timeout slightly
-                                response.raise_for_status()
+                                response = fetch(img_url.strip(), timeout=15, max_retries=0) # Increased timeout slightly
                                 image_binary_content = response.content
                                 
                                 parsed_url = urlparse(img_url.strip())
@@ -471,32 +688,31 @@ def import_properties():
                                     filename += ".jpg" # default to jpg if no extension
 
                                 server_mimetype = response.headers.get('Content-Type')
-                                mimetype, _ = guess_type(filename) # Guess from filename first
+                                mimetype, _ = mimetypes.guess_type(filename) # Guess from filename first
                                 if server_mimetype and server_mimetype != 'application/octet-stream':
                                     mimetype = server_mimetype # Prefer server's specific mimetype if available and not generic
                                 
                                 if not mimetype: # If still no mimetype, try to guess from URL or default
-                                    mimetype, _ = guess_type(img_url.strip())
+                                    mimetype, _ = mimetypes.guess_type(img_url.strip())
                                     if not mimetype:
                                         mimetype = 'application/octet-stream' # Ultimate fallback
 
                                 if image_binary_content and mimetype and 'image' in mimetype.lower():
-                                    new_db_image = PropertyImage(
-                                        image_data=image_binary_content,
-                                        filename=filename,
-                                        mimetype=mimetype
-                                    )
-                                    new_prop_instance.images.append(new_db_image)
-                                    # db.session.add(new_db_image) # Not strictly needed if appended to collection that is part of session
+                                    pending_images.append((submit_normalization(image_binary_content, mimetype, filename),
+                                                           image_binary_content, mimetype, filename))
                                     app.logger.info(f"Строка {index+2}: Успешно обработано изображение с URL: {img_url} для объекта {new_prop_instance.name or 'ID ' + str(new_prop_instance.id)}")
                                 else:
                                     app.logger.warning(f"Строка {index+2}: Не удалось обработать изображение с URL (неверные данные или mimetype): {img_url} для объекта {new_prop_instance.name or 'ID ' + str(new_prop_instance.id)}. Mimetype: {mimetype}")
                             
-                            except requests.exceptions.RequestException as e_req:
+                            except FetchError as e_req:
                                 app.logger.error(f"Строка {index+2}: Не удалось загрузить изображение с URL: {img_url} для объекта {new_prop_instance.name or 'ID ' + str(new_prop_instance.id)}. Ошибка сети: {e_req}")
                             except Exception as e_img_proc:
                                 app.logger.error(f"Строка {index+2}: Неожиданная ошибка при обработке изображения {img_url} для {new_prop_instance.name or 'ID ' + str(new_prop_instance.id)}: {e_img_proc}", exc_info=True)
+                        for pending_image in pending_images:
+                            new_prop_instance.images.append(normalization_budget.image(*pending_image))
+                        new_prop_instance.refresh_image_summary()
                     
+                    imported_properties.append(new_prop_instance)
                     added_count += 1
                 except Exception as e_row:
                     error_count += 1
@@ -509,6 +725,9 @@ def import_properties():
                 flash(f"Импорт успешно завершен. Добавлено объектов: {added_count}. Пропущено строк: {skipped_count}.", "success")
             
             db.session.commit()
+            matched_count = record_new_matches([p.id for p in imported_properties if db.inspect(p).persistent], source="Excel Import")
+            if matched_count:
+                flash(f"Новых совпадений с интересами клиентов: {matched_count}.", "info")
         except Exception as e_file:
             db.session.rollback()
             app.logger.error(f"Ошибка при импорте файла Excel: {e_file}", exc_info=True)
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_REQUESTS_PER_SECOND = 1.0
+
+
+def scraper_settings():
+    """Reads the SCRAPER_* settings in the calling thread; worker threads have no app context."""
+    if not has_app_context():
+        return {'max_workers': DEFAULT_MAX_WORKERS, 'requests_per_second': DEFAULT_REQUESTS_PER_SECOND}
+    config = current_app.config
+    return {
+        'max_workers': max(1, int(config.get('SCRAPER_MAX_WORKERS') or DEFAULT_MAX_WORKERS)),
+        'requests_per_second': float(config.get('SCRAPER_REQUESTS_PER_SECOND') or DEFAULT_REQUESTS_PER_SECOND),
+    }
+
+
+class HostRateLimiter:
+    """
+    Token bucket per host: each host gets `rate` requests per second with bursts of up to `burst`.
+    `acquire` reserves a slot under the lock and sleeps outside it, so waiting threads are released
+    in arrival order and different hosts never wait on each other.
+    """
+
+    def __init__(self, rate=DEFAULT_REQUESTS_PER_SECOND, burst=1):
+        self._lock = threading.Lock()
+        self._buckets = {} # host -> (tokens, last refill time)
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst=1):
+        with self._lock:
+            self.rate = rate
+            self.burst = max(1, burst)
+
+    def acquire(self, url):
+        if not self.rate or self.rate <= 0:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate) - 1
+            self._buckets[host] = (tokens, now)
+        # A negative balance is a reservation in the future: wait until it has been refilled
+        if tokens < 0:
+            time.sleep(-tokens / self.rate)
+
+
+_rate_limiter = HostRateLimiter()
+
+
+def get_rate_limiter(requests_per_second=None):
+    """The process-wide limiter, so parallel scraping tasks share each host's budget."""
+    if requests_per_second is not None and requests_per_second != _rate_limiter.rate:
+        _rate_limiter.configure(requests_per_second)
+    return _rate_limiter
+
+
+class _BufferedCallback:
+    """Collects status updates from a worker thread so they can be replayed in the calling thread."""
+
+    def __init__(self):
+        self.updates = []
+
+    def __call__(self, status):
+        self.updates.append(status)
+
+
+def fetch_ordered(func, items, max_workers=DEFAULT_MAX_WORKERS, update_callback=None):
+    """
+    Runs `func(item, update_callback=...)` for every item on a bounded thread pool and yields
+    (index, item, result) in input order. Workers run inside the caller's app, if it has one, so
+    code reading current_app.config (image normalization settings) sees the real configuration.
+    The caller's update_callback (which may need its request session) is only invoked from the
+    calling thread: each worker's updates are buffered and replayed when its result is yielded.
+    A worker that raises yields its exception as the result.
+    """
+    items = list(items)
+    if not items:
+        return
+    buffers = [_BufferedCallback() for _ in items]
+    flask_app = current_app._get_current_object() if has_app_context() else None
+
+    def run(index):
+        if flask_app is None:
+            return func(items[index], update_callback=buffers[index])
+        with flask_app.app_context():
+            return func(items[index], update_callback=buffers[index])
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix='scraper-fetch') as executor:
+        futures = [executor.submit(run, index) for index in range(len(items))]
+        for index, future in enumerate(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            if update_callback:
+                for status in buffers[index].updates:
+                    update_callback(status)
+            yield index, items[index], result
@@ -1,10 +1,16 @@
-import requests
 from bs4 import BeautifulSoup
-import time
+import threading
 import logging
 import re # For cleaning text, extracting numbers
 import json # For parsing JSON-like data if found
 from datetime import datetime # Import datetime
+import os
+from urllib.parse import urlparse
+from uuid import uuid4
+from werkzeug.utils import secure_filename
+from app.services.image_processing import submit_normalization
+from app.services.http_client import fetch, FetchError
+from app.scrapers.concurrency import get_rate_limiter, scraper_settings, fetch_ordered
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,6 +18,7 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # --- Selenium setup (optional, only if needed for phone numbers) ---
 USE_SELENIUM_FOR_OLX_PHONES = True # Set to False if direct scraping works or to skip
 SELENIUM_DRIVER = None
+SELENIUM_LOCK = threading.Lock() # Ad pages are parsed in parallel; the single driver is used by one at a time
 
 if USE_SELENIUM_FOR_OLX_PHONES:
     try:
@@ -51,8 +58,7 @@ HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36',
     'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
     'Accept-Encoding': 'gzip, deflate, br',
-    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
-    'Connection': 'keep-alive'
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9'
 }
 
 def get_phone_number_olx_selenium(ad_url):
@@ -103,10 +109,8 @@ def parse_olx_ad_page(ad_url, update_callback=None): # Added update_callback
     
     logging.info(f"Scraping OLX ad page: {ad_url}")
     try:
-        response = requests.get(ad_url, headers=HEADERS, timeout=15)
-        response.raise_for_status()
-        time.sleep(1) 
-    except requests.RequestException as e:
+        response = fetch(ad_url, headers=HEADERS, timeout=15, rate_limiter=get_rate_limiter())
+    except FetchError as e:
         logging.error(f"{log_prefix}: Ошибка загрузки страницы: {e}", exc_info=True)
         if update_callback: update_callback({"log_message": f"[ОШИБКА] {log_prefix}: Не удалось загрузить страницу: {e}", "error_occurred": True})
         return None
@@ -169,19 +173,21 @@ def parse_olx_ad_page(ad_url, update_callback=None): # Added update_callback
             if img_url and img_url.startswith('http') and not img_url.startswith('data:image'): # Ensure it's a fetchable URL
                 try:
                     if update_callback: update_callback({"log_message": f"{log_prefix}: Загрузка изображения {img_url[:50]}..."})
-                    img_response = requests.get(img_url, timeout=10, stream=True)
-                    img_response.raise_for_status()
+                    img_response = fetch(img_url, timeout=10, rate_limiter=get_rate_limiter())
                     image_binary_content = img_response.content
                     mimetype = img_response.headers.get('Content-Type', 'application/octet-stream')
                     filename = os.path.basename(urlparse(img_url).path) or f"{ad_data['external_id']}_{uuid4().hex[:4]}.jpg"
                     
+                    filename = secure_filename(filename)
                     ad_data['scraped_images_data'].append({
-                        'filename': secure_filename(filename),
+                        'filename': filename,
                         'mimetype': mimetype,
-                        'data': image_binary_content
+                        # Resize/re-encode runs on the worker pool while the next image downloads; the
+                        # raw bytes are held by the Future only, not kept in the dict until the batch is saved
+                        'normalized': submit_normalization(image_binary_content, mimetype, filename)
                     })
                     logging.info(f"{log_prefix}: Изображение {img_url} успешно загружено ({len(image_binary_content)} байт).")
-                except requests.RequestException as img_req_e:
+                except FetchError as img_req_e:
                     logging.error(f"{log_prefix}: Ошибка загрузки изображения {img_url}: {img_req_e}", exc_info=True)
                     if update_callback: update_callback({"log_message": f"[ОШИБКА] {log_prefix}: Не удалось загрузить изображение {img_url[:50]}: {img_req_e}", "error_occurred": True})
                 except Exception as img_e_other:
@@ -233,7 +239,8 @@ def parse_olx_ad_page(ad_url, update_callback=None): # Added update_callback
         # Other fields like 's', 's_kh', 'p', 'd_kv' are harder to map without specific examples from OLX
 
 
-        ad_data['seller_phone'] = get_phone_number_olx_selenium(ad_url) 
+        with SELENIUM_LOCK:
+            ad_data['seller_phone'] = get_phone_number_olx_selenium(ad_url) 
         ad_data['last_scraped_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S') # Corrected usage
         
         if not ad_data.get('name') and not ad_data.get('description'): 
@@ -268,6 +275,9 @@ def scrape_olx(base_url, num_pages_to_scrape=1, update_callback=None):
     # For this function, we assume SELENIUM_DRIVER is either None or a valid driver instance
     # if phone scraping via Selenium is enabled. The actual initialization happens in run_parsing_task.
     
+    settings = scraper_settings()
+    rate_limiter = get_rate_limiter(settings['requests_per_second'])
+
     if USE_SELENIUM_FOR_OLX_PHONES and SELENIUM_DRIVER is None:
         # This case should ideally be handled by the caller (e.g. run_parsing_task)
         # or a local instance should be created and quit here.
@@ -295,10 +305,8 @@ def scrape_olx(base_url, num_pages_to_scrape=1, update_callback=None):
         logging.info(current_task_message)
 
         try:
-            response = requests.get(page_url, headers=HEADERS, timeout=20)
-            response.raise_for_status()
-            time.sleep(2) 
-        except requests.RequestException as e:
+            response = fetch(page_url, headers=HEADERS, timeout=20, rate_limiter=rate_limiter)
+        except FetchError as e:
             logging.error(f"OLX: Ошибка загрузки страницы {page_url}: {e}", exc_info=True)
             if update_callback:
                 update_callback({"log_message": f"[ОШИБКА] OLX: Не удалось загрузить страницу: {page_url}. Ошибка: {e}", "error_occurred": True})
@@ -323,7 +331,8 @@ def scrape_olx(base_url, num_pages_to_scrape=1, update_callback=None):
         logging.info(f"OLX: Найдено {num_cards_on_page} карточек на стр. {page_num}.")
         if update_callback: update_callback({"log_message": f"OLX: Найдено {num_cards_on_page} карточек на стр. {page_num}."})
 
-        for card_idx, card in enumerate(ad_cards):
+        ad_urls = []
+        for card in ad_cards:
             ad_url_path = None # Initialize here for error logging
             try:
                 ad_link_tag = card.find('a', href=True)
@@ -335,36 +344,39 @@ def scrape_olx(base_url, num_pages_to_scrape=1, update_callback=None):
                         logging.debug(f"OLX: Пропуск нерелевантной ссылки: {ad_url_full}") # Debug as this can be common
                         if update_callback: update_callback({"log_message": f"OLX: Пропуск (не объявление): {ad_url_full[:70]}..."})
                         continue
-                    
-                    # Update progress for each item within the page
-                    item_progress_within_page = int(((card_idx + 1) / num_cards_on_page) * (1/num_pages_to_scrape) * 50) if num_cards_on_page > 0 else 0
-                    current_overall_progress = scraper_progress + item_progress_within_page
-                    
-                    if update_callback:
-                        update_callback({
-                            "current_task": f"OLX: Стр. {page_num}, объявление {card_idx+1}/{num_cards_on_page}",
-                            "progress_percent": min(current_overall_progress, 50) # Cap at 50 for scraping phase
-                        })
-                    
-                    property_data = parse_olx_ad_page(ad_url_full, update_callback=update_callback) 
-                    if property_data:
-                        all_properties.append(property_data)
+                    ad_urls.append(ad_url_full)
                 else:
                     logging.warning("OLX: Найдена карточка без ссылки.")
                     if update_callback: update_callback({"log_message": "[ПРЕДУПРЕЖДЕНИЕ] OLX: Найдена карточка без ссылки."})
             except Exception as e_card:
                 logging.error(f"OLX: Ошибка обработки карточки (URL path: {ad_url_path if ad_url_path else 'N/A'}): {e_card}", exc_info=True)
-                if update_callback: update_callback({"log_message": f"[ОШИBКА] OLX: Ошибка обработки карточки: {e_card}", "error_occurred": True})
+                if update_callback: update_callback({"log_message": f"[ОШИБКА] OLX: Ошибка обработки карточки: {e_card}", "error_occurred": True})
                 # Continue to the next card
+
+        # Ad pages are fetched on a bounded pool, paced per host by the rate limiter; results
+        # (and their log messages) come back in card order
+        num_ads = len(ad_urls)
+        for ad_idx, ad_url_full, property_data in fetch_ordered(parse_olx_ad_page, ad_urls, settings['max_workers'], update_callback):
+            if isinstance(property_data, Exception):
+                logging.error(f"OLX: Ошибка обработки объявления {ad_url_full}: {property_data}")
+                if update_callback: update_callback({"log_message": f"[ОШИБКА] OLX: Ошибка обработки объявления: {property_data}", "error_occurred": True})
+            elif property_data:
+                all_properties.append(property_data)
+
+            # Update progress for each item within the page
+            item_progress_within_page = int(((ad_idx + 1) / num_ads) * (1/num_pages_to_scrape) * 50)
+            current_overall_progress = scraper_progress + item_progress_within_page
+            if update_callback:
+                update_callback({
+                    "current_task": f"OLX: Стр. {page_num}, объявление {ad_idx+1}/{num_ads}",
+                    "progress_percent": min(current_overall_progress, 50) # Cap at 50 for scraping phase
+                })
         
         log_msg_page_finish = f"OLX: Завершена страница {page_num}. Собрано объявлений с этой страницы: {len(ad_cards) if ad_cards else 0}. Всего успешно собрано: {len(all_properties)}"
         if update_callback:
             update_callback({"log_message": log_msg_page_finish})
         logging.info(log_msg_page_finish)
 
-        if page_num < num_pages_to_scrape: # If there are more pages to scrape
-             time.sleep(3) # Longer delay between main listing pages
-
     if update_callback:
         update_callback({"current_task": "Сбор данных с OLX.kz завершен.", "progress_percent": 50}) 
     
@@ -0,0 +1,234 @@
+import logging
+import re
+import time
+from array import array
+
+import numpy as np
+from flask import current_app
+
+from app import db
+from app.models import Property
+from app.services.synced_index import IndexSync, SyncedIndex
+
+logger = logging.getLogger(__name__)
+
+# Latin letters that look like Cyrillic ones; applied only inside words that already contain Cyrillic
+LATIN_LOOKALIKES = str.maketrans({
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к', 'm': 'м',
+    'o': 'о', 'p': 'р', 't': 'т', 'x': 'х', 'y': 'у', 'ё': 'е',
+})
+CYRILLIC = re.compile(r'[а-я]')
+
+# Street type words and other address noise: dropped so "ул. Абая" and "улица Абая" index the same
+ADDRESS_STOPWORDS = {
+    'ул', 'улица', 'пр', 'пр-т', 'просп', 'проспект', 'мкр', 'мкрн', 'микрорайон', 'мкр-н',
+    'пер', 'переулок', 'б-р', 'бул', 'бульвар', 'ш', 'шоссе', 'пл', 'площадь', 'наб', 'набережная',
+    'д', 'дом', 'кв', 'квартира', 'р-н', 'район', 'г', 'город', 'обл', 'область', 'угол', 'уг',
+}
+WORD = re.compile(r'[0-9a-zа-яё]+(?:-[0-9a-zа-яё]+)*')
+
+
+def normalize_address(value):
+    """Lower-cased address words with lookalike Latin letters mapped to Cyrillic and street-type words removed."""
+    if not value:
+        return ''
+    words = []
+    for word in WORD.findall(value.lower()):
+        if CYRILLIC.search(word):
+            word = word.translate(LATIN_LOOKALIKES)
+        word = word.replace('ё', 'е')
+        if word not in ADDRESS_STOPWORDS:
+            words.append(word)
+    return ' '.join(words)
+
+
+def trigrams(normalized):
+    """pg_trgm-style trigrams: every word padded with two leading spaces and one trailing space."""
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class AddressIndex(SyncedIndex):
+    """
+    Inverted trigram index over normalized street + address + district text of every property.
+    Posting lists are array('i') of row positions, read through numpy without copying; a lookup
+    sums trigram overlaps with bincount and ranks by the share of query trigrams present in each row.
+    """
+
+    models = (Property,)
+    label = 'Триграммный индекс адресов'
+
+    def __init__(self):
+        super().__init__()
+        self.postings = {} # trigram -> array('i') of row positions
+        self.row_ids = array('q') # row position -> property id
+        self.row_sizes = array('i') # row position -> number of trigrams
+        self.row_alive = bytearray()
+        self._positions = {} # property id -> current row position
+        self._texts = {} # property id -> normalized text of its current row
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _size(self, model):
+        return len(self)
+
+    def describe(self):
+        return f"{len(self)} объектов, {len(self.postings)} триграмм"
+
+    def needs_rebuild(self):
+        # Superseded and deleted rows stay in the postings until the next full load
+        return len(self.row_ids) - len(self._positions) > len(self._positions)
+
+    def _select(self, model, ids=None, since=None):
+        query = db.session.query(Property.id, Property.updated_at, Property.street, Property.address, Property.district)
+        if ids is not None:
+            query = query.filter(Property.id.in_(ids))
+        if since is not None:
+            query = query.filter(Property.updated_at >= since)
+        return query.order_by(Property.id).yield_per(5000)
+
+    def _add(self, property_id, text):
+        normalized = normalize_address(text)
+        old_position = self._positions.get(property_id)
+        if old_position is not None:
+            # Overlap re-reads and edits of other fields come through here too; only a changed
+            # address needs a new row
+            if self._texts[property_id] == normalized:
+                return False
+            self.row_alive[old_position] = 0
+        grams = trigrams(normalized)
+        position = len(self.row_ids)
+        self.row_ids.append(property_id)
+        self.row_sizes.append(len(grams))
+        self.row_alive.append(1 if grams else 0)
+        self._positions[property_id] = position
+        self._texts[property_id] = normalized
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array('i')
+            posting.append(position)
+        return True
+
+    def _apply(self, model, rows):
+        changed = False
+        for property_id, updated_at, street, address, district in rows:
+            changed |= self._add(property_id, ' '.join(part for part in (street, address, district) if part))
+        return changed
+
+    def _remove(self, model, property_ids):
+        for property_id in property_ids:
+            position = self._positions.pop(property_id, None)
+            if position is not None:
+                self.row_alive[position] = 0
+                del self._texts[property_id]
+
+    def lookup(self, query, limit=20, min_similarity=0.6, budget_ms=50.0):
+        """
+        [(property_id, similarity)] best first, every match when `limit` is None. Posting lists are
+        merged rarest trigram first; once `budget_ms` is spent the remaining (most common, least
+        selective) trigrams are skipped, which can only lower scores, so weak matches may be missed.
+        """
+        grams = trigrams(normalize_address(query))
+        if not grams:
+            return []
+        deadline = time.perf_counter() + budget_ms / 1000.0
+        with self._lock:
+            row_count = len(self.row_ids)
+            if not row_count:
+                return []
+            postings = sorted((self.postings[g] for g in grams if g in self.postings), key=len)
+            shared = np.zeros(row_count, dtype=np.int32)
+            for posting in postings:
+                shared += np.bincount(np.frombuffer(posting, dtype=np.int32), minlength=row_count)
+                if time.perf_counter() > deadline:
+                    logger.debug(f"Бюджет поиска адреса исчерпан: {query!r}")
+                    break
+            sizes = np.frombuffer(self.row_sizes, dtype=np.int32)
+            alive = np.frombuffer(bytes(self.row_alive), dtype=np.uint8).astype(bool)
+            candidates = np.flatnonzero(alive & (shared > 0))
+            if not len(candidates):
+                return []
+            overlap = shared[candidates]
+            # Share of the query's trigrams found in the address (like pg_trgm word_similarity), so a bare
+            # street name still matches a long "street, house, district" text; ranking also rewards rows
+            # whose whole text is close to the query (plain trigram similarity)
+            similarity = overlap / len(grams)
+            keep = similarity >= min_similarity
+            candidates, similarity, overlap = candidates[keep], similarity[keep], overlap[keep]
+            rank = similarity + overlap / (len(grams) + sizes[candidates] - overlap) / 2
+            if limit and len(candidates) > limit:
+                top = np.argpartition(-rank, limit)[:limit]
+                candidates, similarity, rank = candidates[top], similarity[top], rank[top]
+            order = np.lexsort((candidates, -rank))
+            row_ids = np.frombuffer(self.row_ids, dtype=np.int64)
+            return [(int(row_ids[candidates[i]]), float(similarity[i])) for i in order]
+
+
+index_sync = IndexSync(AddressIndex, 'ADDRESS_INDEX_REFRESH_SECONDS', 30)
+
+
+def _substring_matches(query, limit):
+    """Plain substring matches on street/address/district, used until the trigram index is first built."""
+    words = [word for word in re.findall(WORD.pattern, query, re.IGNORECASE) if word.lower() not in ADDRESS_STOPWORDS]
+    if not words:
+        return []
+    columns = (Property.street, Property.address, Property.district)
+    rows = db.session.query(Property.id).filter(*[db.or_(*(column.ilike(f"%{word}%") for column in columns)) for word in words])\
+        .order_by(Property.id.desc())
+    if limit:
+        rows = rows.limit(limit)
+    return [(property_id, 1.0) for property_id, in rows]
+
+
+def fuzzy_address_matches(query, limit=20):
+    """[(property_id, similarity)] for addresses resembling `query`, within ADDRESS_SEARCH_BUDGET_MS."""
+    index = index_sync.get()
+    if index is None:
+        return _substring_matches(query, limit)
+    config = current_app.config
+    return index.lookup(query, limit=limit,
+                        min_similarity=config.get('ADDRESS_SEARCH_MIN_SIMILARITY', 0.6),
+                        budget_ms=config.get('ADDRESS_SEARCH_BUDGET_MS', 50))
+
+
+def fuzzy_address_ids(query, limit=500):
+    return [property_id for property_id, _ in fuzzy_address_matches(query, limit=limit)]
+
+
+def sample_queries(count=50, seed=0):
+    """Real street/address strings with one character dropped or swapped, to measure typo lookups."""
+    import random
+    rng = random.Random(seed)
+    rows = db.session.query(Property.street, Property.address).filter(
+        db.or_(Property.street.isnot(None), Property.address.isnot(None))).limit(count * 20).all()
+    queries = []
+    for street, address in rng.sample(rows, min(count, len(rows))):
+        value = ' '.join(part for part in (street, address) if part)[:40]
+        if len(value) > 4:
+            i = rng.randrange(1, len(value) - 2)
+            value = value[:i] + value[i + 1] + value[i] + value[i + 2:] if rng.random() < 0.5 else value[:i] + value[i + 1:]
+        queries.append(value)
+    return queries
+
+
+def benchmark(queries, repeat=5, budget_ms=None):
+    """(index, [(query, median_ms, result_count)]) for lookups against a freshly loaded index."""
+    index = AddressIndex()
+    index.load()
+    config = current_app.config
+    budget_ms = budget_ms if budget_ms is not None else config.get('ADDRESS_SEARCH_BUDGET_MS', 50)
+    results = []
+    for query in queries:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            matches = index.lookup(query, min_similarity=config.get('ADDRESS_SEARCH_MIN_SIMILARITY', 0.6),
+                                   budget_ms=budget_ms)
+            timings.append(time.perf_counter() - started)
+        results.append((query, float(np.median(timings)) * 1000, len(matches)))
+    return index, results
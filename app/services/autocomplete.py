@@ -0,0 +1,227 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from flask import current_app
+
+from app import db
+from app.models import Property, Client
+from app.services.synced_index import IndexSync, SyncedIndex
+
+# Suggestion kinds, in the order they are listed for equal scores
+KIND_PROPERTY = 'property'
+KIND_STREET = 'street'
+KIND_DISTRICT = 'district'
+KIND_CLIENT = 'client'
+KIND_ORDER = {KIND_DISTRICT: 0, KIND_STREET: 1, KIND_PROPERTY: 2, KIND_CLIENT: 3}
+
+# Upper bound on index keys inspected per lookup; short prefixes ("а") stay within the latency target
+MAX_SCANNED_KEYS = 3000
+MAX_LABEL_WORDS = 6
+
+
+def normalize_text(value):
+    return ' '.join((value or '').lower().replace('ё', 'е').split())
+
+
+def _word_keys(label):
+    """Keys under which `label` is found: the normalized label from each of its first words on, so "ул. Абая" matches "аб"."""
+    words = normalize_text(label).split()
+    keys = []
+    for i in range(min(len(words), MAX_LABEL_WORDS)):
+        key = ' '.join(words[i:]).lstrip('.,-«"(')
+        if key:
+            keys.append((key, i))
+    return keys
+
+
+class AutocompleteIndex(SyncedIndex):
+    """
+    Sorted (key, entry) list searched with bisect. Property and client names are one entry per row;
+    streets and districts are one entry per distinct value, weighted by how many listings use it.
+    Changed rows are applied with insort/delete instead of a rebuild.
+    """
+
+    models = (Property, Client)
+    label = 'Индекс автодополнения'
+
+    def __init__(self):
+        super().__init__()
+        self._bulk = None
+        self._keys = [] # sorted (key, word position, entry id)
+        self.entries = {} # entry id -> {'kind', 'label', 'id', 'weight'}
+        self._property_values = {} # property id -> (name, street, district) as indexed
+        self._client_values = {} # client id -> name as indexed
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _size(self, model):
+        return len(self._client_values if model is Client else self._property_values)
+
+    def describe(self):
+        return f"{len(self)} подсказок, {len(self._keys if self._bulk is None else self._bulk)} ключей"
+
+    def _insert_keys(self, entry_id, label):
+        if self._bulk is not None:
+            self._bulk.extend((key, position, entry_id) for key, position in _word_keys(label))
+            return
+        for key, position in _word_keys(label):
+            insort(self._keys, (key, position, entry_id))
+
+    def _delete_keys(self, entry_id, label):
+        for key, position in _word_keys(label):
+            i = bisect_left(self._keys, (key, position, entry_id))
+            if i < len(self._keys) and self._keys[i] == (key, position, entry_id):
+                del self._keys[i]
+
+    def _add_entry(self, entry_id, kind, label, object_id=None, weight=1):
+        entry = self.entries.get(entry_id)
+        if entry is not None:
+            entry['weight'] += weight
+            return
+        self.entries[entry_id] = {'kind': kind, 'label': label, 'id': object_id, 'weight': weight}
+        self._insert_keys(entry_id, label)
+
+    def _remove_entry(self, entry_id, weight=None):
+        """Drops the entry, or only `weight` of it when other listings still use the value."""
+        entry = self.entries.get(entry_id)
+        if entry is None:
+            return
+        if weight is not None and entry['weight'] > weight:
+            entry['weight'] -= weight
+            return
+        del self.entries[entry_id]
+        self._delete_keys(entry_id, entry['label'])
+
+    def _apply_property(self, property_id, name, street, district):
+        old = self._property_values.get(property_id)
+        if old == (name, street, district):
+            return False
+        if old is not None:
+            _, old_street, old_district = old
+            self._remove_entry((KIND_PROPERTY, property_id))
+            if old_street:
+                self._remove_entry((KIND_STREET, normalize_text(old_street)), weight=1)
+            if old_district:
+                self._remove_entry((KIND_DISTRICT, normalize_text(old_district)), weight=1)
+        if name:
+            self._add_entry((KIND_PROPERTY, property_id), KIND_PROPERTY, name, object_id=property_id)
+        if street:
+            self._add_entry((KIND_STREET, normalize_text(street)), KIND_STREET, street.strip())
+        if district:
+            self._add_entry((KIND_DISTRICT, normalize_text(district)), KIND_DISTRICT, district.strip())
+        self._property_values[property_id] = (name, street, district)
+        return True
+
+    def _apply_client(self, client_id, name):
+        old = self._client_values.get(client_id)
+        if old == name:
+            return False
+        if old is not None:
+            self._remove_entry((KIND_CLIENT, client_id))
+        if name:
+            self._add_entry((KIND_CLIENT, client_id), KIND_CLIENT, name, object_id=client_id)
+        self._client_values[client_id] = name
+        return True
+
+    def _select(self, model, ids=None, since=None):
+        if model is Client:
+            query = db.session.query(Client.id, Client.updated_at, Client.name)
+        else:
+            query = db.session.query(Property.id, Property.updated_at, Property.name, Property.street, Property.district)
+        if ids is not None:
+            query = query.filter(model.id.in_(ids))
+        if since is not None:
+            query = query.filter(model.updated_at >= since)
+        return query.yield_per(5000)
+
+    def _apply(self, model, rows):
+        changed = False
+        for row in rows:
+            if model is Client:
+                changed |= self._apply_client(row[0], row[2])
+            else:
+                changed |= self._apply_property(row[0], *row[2:])
+        return changed
+
+    def _remove(self, model, ids):
+        for object_id in ids:
+            if model is Client and object_id in self._client_values:
+                self._apply_client(object_id, None)
+                del self._client_values[object_id]
+            elif model is Property and object_id in self._property_values:
+                self._apply_property(object_id, None, None, None)
+                del self._property_values[object_id]
+
+    def load(self):
+        # Bulk load: collect keys and sort once instead of an insort per key
+        self._bulk = []
+        try:
+            super().load()
+            self._keys = sorted(self._bulk)
+        finally:
+            self._bulk = None
+
+    def suggest(self, prefix, limit=10):
+        """
+        Best `limit` suggestions for `prefix`: labels starting with it rank above labels where a later
+        word starts with it, then by weight (listings per street/district) and kind.
+        """
+        prefix = normalize_text(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            start = bisect_left(self._keys, (prefix,))
+            best = {}
+            for key, position, entry_id in self._keys[start:start + MAX_SCANNED_KEYS]:
+                if not key.startswith(prefix):
+                    break
+                entry = self.entries.get(entry_id)
+                if entry is None:
+                    continue
+                score = (position == 0, entry['weight'], -KIND_ORDER[entry['kind']], -len(entry['label']))
+                if entry_id not in best or score > best[entry_id][0]:
+                    best[entry_id] = (score, entry)
+            top = heapq.nlargest(limit, best.values(), key=lambda item: item[0])
+            return [{'kind': entry['kind'], 'label': entry['label'], 'id': entry['id']} for _, entry in top]
+
+
+class SuggestionCache:
+    """Small LRU of recent (prefix, limit) results, valid for one index generation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, max_entries):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+
+index_sync = IndexSync(AutocompleteIndex, 'AUTOCOMPLETE_REFRESH_SECONDS', 10)
+suggestion_cache = SuggestionCache()
+
+
+def suggest(prefix, limit=10):
+    """Suggestions from the published index; none while its first build (in the background) is running."""
+    index = index_sync.get()
+    if index is None:
+        return []
+    key = (index.generation, normalize_text(prefix), limit)
+    suggestions = suggestion_cache.get(key)
+    if suggestions is None:
+        suggestions = index.suggest(prefix, limit=limit)
+        suggestion_cache.put(key, suggestions, current_app.config.get('AUTOCOMPLETE_CACHE_SIZE', 512))
+    return suggestions
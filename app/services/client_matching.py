@@ -0,0 +1,383 @@
+import heapq
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app import db
+from app.models import Client, ClientInterest, ClientInterestTerm, Property, ClientPropertyMatch, MatchingReport, parse_year
+
+logger = logging.getLogger(__name__)
+
+# Client.interests keys for range constraints: (lower bound key, upper bound key, Property column);
+# the keys double as the ClientInterest column names
+INTEREST_RANGES = ClientInterest.RANGE_COLUMNS
+# Client.interests keys for set-membership constraints: (interests key, Property column)
+INTEREST_TERMS = (
+    ('districts', 'district'),
+    ('condition', 'condition'),
+    ('layout', 'layout'),
+)
+
+# Scored matching: default weight of each criterion, overridable per client with interests['weights']
+DEFAULT_MATCH_WEIGHTS = {'price': 3.0, 'area': 2.0, 'district': 2.0, 'floor': 1.0, 'year_built': 1.0,
+                         'condition': 1.0, 'layout': 1.0}
+
+# Floors are whole numbers: fractional bounds are widened to the enclosing floors
+INTEGER_BOUNDS = {'min_floor': math.floor, 'max_floor': math.ceil}
+
+# Listings matched per statement in record_new_matches (keeps the IN list well under driver limits)
+RECORD_MATCHES_BATCH_SIZE = 500
+
+
+def _bound(key, value):
+    if value is None or value == '':
+        return None
+    if key.startswith('year_built'):
+        return parse_year(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number): # "nan", "inf", "1e999"
+        return None
+    rounding = INTEGER_BOUNDS.get(key)
+    return rounding(number) if rounding else number
+
+
+def parse_interests(interests):
+    """
+    {'ranges': {column: (low, high)}, 'terms': {column: set of values}} for a Client.interests dict,
+    keeping only constraints that are actually set; None when there is nothing to match on.
+    """
+    if not isinstance(interests, dict):
+        return None
+    ranges = {}
+    for low_key, high_key, column in INTEREST_RANGES:
+        low, high = _bound(low_key, interests.get(low_key)), _bound(high_key, interests.get(high_key))
+        if low is not None or high is not None:
+            ranges[column] = (low, high)
+    terms = {}
+    for key, column in INTEREST_TERMS:
+        value = interests.get(key)
+        values = value if isinstance(value, (list, tuple)) else [value]
+        values = {v.strip() for v in values if isinstance(v, str) and v.strip()}
+        if values:
+            terms[column] = values
+    if not ranges and not terms:
+        return None
+    return {'ranges': ranges, 'terms': terms}
+
+
+def interest_criteria(parsed):
+    """SQL predicates on Property for parsed interests (same semantics as client_interest_join)."""
+    criteria = []
+    for column_name, (low, high) in parsed['ranges'].items():
+        column = getattr(Property, column_name)
+        if low is not None:
+            criteria.append(column >= low)
+        if high is not None:
+            criteria.append(column <= high)
+    for column_name, values in parsed['terms'].items():
+        column = getattr(Property, column_name)
+        criteria.append(column.in_(sorted(values)) if len(values) > 1 else column == next(iter(values)))
+    return criteria
+
+
+def match_weights(interests):
+    """DEFAULT_MATCH_WEIGHTS updated with the numeric, non-negative entries of interests['weights']."""
+    weights = dict(DEFAULT_MATCH_WEIGHTS)
+    custom = interests.get('weights') if isinstance(interests, dict) else None
+    if isinstance(custom, dict):
+        for key, value in custom.items():
+            key = 'district' if key == 'districts' else key
+            if key not in weights:
+                continue
+            try:
+                weights[key] = max(float(value), 0.0)
+            except (TypeError, ValueError):
+                continue
+    return weights
+
+
+def score_candidates(parsed, columns, weights):
+    """
+    Weighted distance of every candidate row from the client's interests (0 = all criteria met).
+    `columns` maps Property column names to NumPy arrays (NaN / None for NULL). A range criterion
+    contributes its relative shortfall or excess (5% over budget -> 0.05, capped at 1), a set
+    criterion 0 or 1; a missing value counts as a full miss. The result is normalized by the
+    total weight of the criteria the client set, so it reads as an average deviation.
+    """
+    count = len(next(iter(columns.values()))) if columns else 0
+    total = np.zeros(count)
+    weight_sum = 0.0
+    for column, (low, high) in parsed['ranges'].items():
+        weight = weights.get(column, 0.0)
+        if not weight:
+            continue
+        values = columns[column]
+        deviation = np.zeros(count)
+        with np.errstate(invalid='ignore'):
+            if low is not None:
+                deviation = np.maximum(deviation, (low - values) / max(abs(low), 1.0))
+            if high is not None:
+                deviation = np.maximum(deviation, (values - high) / max(abs(high), 1.0))
+        deviation = np.where(np.isnan(values), 1.0, np.minimum(deviation, 1.0))
+        total += weight * deviation
+        weight_sum += weight
+    for column, wanted in parsed['terms'].items():
+        weight = weights.get(column, 0.0)
+        if not weight:
+            continue
+        values = columns[column]
+        total += weight * np.fromiter((value not in wanted for value in values), dtype=np.float64, count=count)
+        weight_sum += weight
+    return total / weight_sum if weight_sum else total
+
+
+def top_scored(scores, ids, limit):
+    """[(score, id)] of the `limit` lowest scores via a bounded heap, without sorting every candidate."""
+    return heapq.nsmallest(limit, zip(scores.tolist(), ids.tolist()))
+
+
+def _sql_range_deviation(parsed, weights):
+    """SQL expression of the range part of score_candidates (unnormalized), to order candidates before the cap."""
+    terms = []
+    for column_name, (low, high) in parsed['ranges'].items():
+        weight = weights.get(column_name, 0.0)
+        if not weight:
+            continue
+        column = getattr(Property, column_name)
+        whens = [(column.is_(None), 1.0)]
+        if low is not None:
+            scale = max(abs(low), 1.0)
+            whens += [(column <= low - scale, 1.0), (column < low, (low - column) / scale)]
+        if high is not None:
+            scale = max(abs(high), 1.0)
+            whens += [(column >= high + scale, 1.0), (column > high, (column - high) / scale)]
+        terms.append(weight * db.case(*whens, else_=0.0))
+    return sum(terms[1:], terms[0]) if terms else None
+
+
+def scored_matches(client, limit=50, tolerance=0.25, max_candidates=2000):
+    """
+    Best `limit` listings for a client under soft constraints, as [(Property, score)] best first.
+    Candidates come from SQL: districts, condition and layout must match and every range is
+    widened by `tolerance` (relative), so the indexes bound the scan and nothing far outside the
+    client's interests is loaded. At most `max_candidates` rows, closest on the ranges first, are scored.
+    """
+    if client.interest_criteria is None:
+        return []
+    parsed = client.interest_criteria.to_parsed()
+    weights = match_weights(client.interests)
+    from app.services.property_index import load_properties
+    criteria = interest_criteria({'ranges': {}, 'terms': parsed['terms']})
+    for column_name, (low, high) in parsed['ranges'].items():
+        column = getattr(Property, column_name)
+        if low is not None:
+            criteria.append(column >= low - abs(low) * tolerance)
+        if high is not None:
+            criteria.append(column <= high + abs(high) * tolerance)
+    column_names = list(parsed['ranges']) + list(parsed['terms'])
+    query = db.session.query(Property.id, *[getattr(Property, c) for c in column_names]).filter(*criteria)
+    deviation = _sql_range_deviation(parsed, weights)
+    if deviation is not None:
+        query = query.order_by(deviation, Property.id)
+    else:
+        query = query.order_by(Property.id.desc()) # Only exact term matches: newest listings first
+    rows = query.limit(max_candidates).all()
+    if not rows:
+        return []
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    columns = {}
+    for offset, name in enumerate(column_names, start=1):
+        if name in parsed['ranges']:
+            columns[name] = np.array([np.nan if row[offset] is None else row[offset] for row in rows], dtype=np.float64)
+        else:
+            columns[name] = np.array([row[offset] for row in rows], dtype=object)
+    best = top_scored(score_candidates(parsed, columns, weights), ids, limit)
+    scores = {property_id: score for score, property_id in best}
+    return [(prop, scores[prop.id]) for prop in load_properties([property_id for _, property_id in best])]
+
+
+def client_interest_join(property_ids):
+    """
+    (client_id, property_id) pairs for the given listings whose values satisfy the client's
+    structured interests. A NULL bound or a field with no client_interest_terms rows places no
+    constraint; a NULL listing value fails any bound set on it, as in interest_criteria.
+    Clients with districts are reached through the (field, value) term index and the others
+    through ClientInterest.any_district, so each listing only visits clients of its district.
+    """
+    criteria = []
+    for low_column, high_column, column in INTEREST_RANGES:
+        value = getattr(Property, column)
+        low, high = getattr(ClientInterest, low_column), getattr(ClientInterest, high_column)
+        criteria.append(db.or_(low.is_(None), value >= low))
+        criteria.append(db.or_(high.is_(None), value <= high))
+    for _, field in INTEREST_TERMS:
+        if field == 'district':
+            continue
+        # Uncorrelated, so evaluated once per statement rather than once per candidate pair
+        constrained = db.select(ClientInterestTerm.client_interest_id).where(ClientInterestTerm.field == field)
+        accepted = db.select(ClientInterestTerm.client_interest_id).where(
+            ClientInterestTerm.client_interest_id == ClientInterest.id, ClientInterestTerm.field == field,
+            ClientInterestTerm.value == getattr(Property, field))
+        criteria.append(db.or_(ClientInterest.id.not_in(constrained), accepted.exists()))
+    District = db.aliased(ClientInterestTerm)
+    by_district = db.select(ClientInterest.client_id, Property.id).select_from(Property)\
+        .join(District, db.and_(District.field == 'district', District.value == Property.district))\
+        .join(ClientInterest, ClientInterest.id == District.client_interest_id)\
+        .where(Property.id.in_(property_ids), *criteria)
+    any_district = db.select(ClientInterest.client_id, Property.id).select_from(Property)\
+        .join(ClientInterest, ClientInterest.any_district.is_(True))\
+        .where(Property.id.in_(property_ids), *criteria)
+    return db.union_all(by_district, any_district)
+
+
+def record_new_matches(property_ids, source=None):
+    """
+    Matches the given (just committed) listings against every client's interests in SQL and
+    stores the new (client, listing) pairs for the inbox. Returns the number of pairs added.
+    """
+    if not property_ids:
+        return 0
+    property_ids = sorted(set(property_ids))
+    pairs = set()
+    for start in range(0, len(property_ids), RECORD_MATCHES_BATCH_SIZE):
+        batch = property_ids[start:start + RECORD_MATCHES_BATCH_SIZE]
+        pairs.update(db.session.execute(client_interest_join(batch)).all())
+    if not pairs:
+        return 0
+    existing = set()
+    for start in range(0, len(property_ids), RECORD_MATCHES_BATCH_SIZE):
+        batch = property_ids[start:start + RECORD_MATCHES_BATCH_SIZE]
+        existing.update(db.session.query(ClientPropertyMatch.client_id, ClientPropertyMatch.property_id)
+                        .filter(ClientPropertyMatch.property_id.in_(batch)).all())
+    now = datetime.utcnow()
+    new_rows = [{'client_id': client_id, 'property_id': property_id, 'source': source, 'created_at': now}
+                for client_id, property_id in sorted(pairs - existing)]
+    if new_rows:
+        db.session.execute(db.insert(ClientPropertyMatch), new_rows)
+        db.session.commit()
+    logger.info(f"Новые совпадения для клиентов: {len(new_rows)} (объектов: {len(property_ids)}, источник: {source}).")
+    return len(new_rows)
+
+
+class BulkMatcher:
+    """
+    Matches many clients against one columnar snapshot of the listings (PropertyIndex arrays).
+    Rows are sorted by price once, so a client's price range is a contiguous slice found with
+    searchsorted; the remaining constraints are vectorized masks over that slice only, and the
+    first hits of a slice are already the cheapest matches (the order of the on-demand matcher).
+    """
+
+    def __init__(self, index):
+        with index._lock:
+            rows = np.flatnonzero(index.alive)
+            order = np.argsort(index.numeric['price'][rows], kind='stable') # NaN prices sort last
+            rows = rows[order]
+            self.ids = index.ids[rows]
+            self.numeric = {column: index.numeric[column][rows] for _, _, column in INTEREST_RANGES}
+            self.codes = {column: index.codes[column][rows] for _, column in INTEREST_TERMS}
+            self.dictionaries = {column: dict(index.dictionaries[column]) for _, column in INTEREST_TERMS}
+        self.priced = int(np.count_nonzero(~np.isnan(self.numeric['price'])))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def match(self, parsed, top_n=5):
+        """(match count, ids of the `top_n` cheapest matches) for parsed interests."""
+        start, stop = 0, len(self.ids)
+        if 'price' in parsed['ranges']:
+            low, high = parsed['ranges']['price']
+            prices = self.numeric['price'][:self.priced]
+            start = int(np.searchsorted(prices, low, side='left')) if low is not None else 0
+            stop = int(np.searchsorted(prices, high, side='right')) if high is not None else self.priced
+        if stop <= start:
+            return 0, []
+        mask = np.ones(stop - start, dtype=bool)
+        for column, (low, high) in parsed['ranges'].items():
+            if column == 'price':
+                continue
+            values = self.numeric[column][start:stop]
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        for column, wanted in parsed['terms'].items():
+            codes = [self.dictionaries[column][v] for v in wanted if v in self.dictionaries[column]]
+            if not codes:
+                return 0, []
+            values = self.codes[column][start:stop]
+            mask &= np.isin(values, codes) if len(codes) > 1 else (values == codes[0])
+        hits = np.flatnonzero(mask)
+        return len(hits), self.ids[start + hits[:top_n]].tolist()
+
+
+_report_lock = threading.Lock() # Held while this process builds a report
+
+
+def bulk_match_report(top_n=5):
+    """
+    Match counts and the cheapest `top_n` listings for every client with interests, computed from
+    one load of the listings and saved as the MatchingReport the admin page shows (older ones are
+    deleted). Run by `flask matching-report` and by start_report_rebuild, never in a request.
+    """
+    from app.services.property_index import PropertyIndex, get_property_index
+    started = time.perf_counter()
+    index = get_property_index() # Shared index when PROPERTY_INDEX_ENABLED, otherwise a one-off load
+    if index is None:
+        index = PropertyIndex()
+        index.load()
+    matcher = BulkMatcher(index)
+    loaded_ms = (time.perf_counter() - started) * 1000
+    rows = []
+    criteria = db.session.query(ClientInterest, Client.name).join(Client, Client.id == ClientInterest.client_id)\
+        .order_by(Client.name).all() # terms are selectin-loaded in one extra query
+    for interest, name in criteria:
+        count, top_ids = matcher.match(interest.to_parsed(), top_n=top_n)
+        rows.append({'client_id': interest.client_id, 'client_name': name, 'count': count, 'top_property_ids': top_ids})
+    skipped = db.session.query(db.func.count(Client.id)).scalar() - len(rows)
+    report = MatchingReport(generated_at=datetime.utcnow(), top_n=top_n, property_count=len(matcher),
+                            client_count=len(rows), skipped_clients=skipped, load_ms=loaded_ms,
+                            total_ms=(time.perf_counter() - started) * 1000, rows=rows)
+    db.session.add(report)
+    db.session.flush()
+    db.session.query(MatchingReport).filter(MatchingReport.id != report.id).delete(synchronize_session=False)
+    db.session.commit()
+    logger.info(f"Сводный подбор: {len(rows)} клиентов x {len(matcher)} объектов за {report.total_ms:.0f} мс "
+                f"(загрузка {loaded_ms:.0f} мс).")
+    return report
+
+
+def get_last_report():
+    """The newest saved MatchingReport, or None before the first build."""
+    return MatchingReport.query.order_by(MatchingReport.generated_at.desc(), MatchingReport.id.desc()).first()
+
+
+def _build_report_in_background(app, top_n):
+    with app.app_context():
+        try:
+            bulk_match_report(top_n=top_n)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Ошибка построения сводного подбора: {e}", exc_info=True)
+        finally:
+            db.session.remove()
+            _report_lock.release()
+
+
+def start_report_rebuild(app, top_n=5):
+    """Builds a report in a background thread; returns False if this process is already building one."""
+    if not _report_lock.acquire(blocking=False):
+        return False
+    threading.Thread(target=_build_report_in_background, args=(app, top_n), daemon=True,
+                     name='matching-report').start()
+    return True
+
+
+def report_rebuild_running():
+    return _report_lock.locked()
@@ -0,0 +1,146 @@
+import logging
+import math
+from datetime import datetime
+
+from app import db
+from app.models import DealStageTransition, DealStageMonthly, DealStageDuration, DealStatusEnum
+from app.services.rollups import upsert_increment
+
+logger = logging.getLogger(__name__)
+
+ALL_AGENTS = 0
+
+# Time-in-stage histogram: bucket b holds durations in [1 min * 2**(b/4), 1 min * 2**((b+1)/4)),
+# i.e. ~19% wide, so a median read from the buckets is within ~10% of the exact one
+BUCKET_BASE_SECONDS = 60.0
+BUCKETS_PER_DOUBLING = 4
+
+
+def duration_bucket(seconds):
+    if seconds <= BUCKET_BASE_SECONDS:
+        return 0
+    return int(math.floor(BUCKETS_PER_DOUBLING * math.log2(seconds / BUCKET_BASE_SECONDS)))
+
+
+def bucket_midpoint(bucket):
+    """Representative duration (geometric middle) of a histogram bucket, in seconds."""
+    return BUCKET_BASE_SECONDS * 2 ** ((bucket + 0.5) / BUCKETS_PER_DOUBLING)
+
+
+def _month(moment):
+    return moment.strftime('%Y-%m')
+
+
+def _aggregate_rows(transition):
+    """(monthly rows, duration rows) that one transition adds to the aggregates."""
+    month = _month(transition.transitioned_at)
+    agent_id = transition.agent_id or ALL_AGENTS
+    monthly = [{'month': month, 'agent_id': agent_id, 'stage': transition.to_stage,
+                'entered': 1, 'exited': 0, 'seconds_total': 0.0}]
+    durations = []
+    if transition.from_stage is not None and transition.seconds_in_stage is not None:
+        monthly.append({'month': month, 'agent_id': agent_id, 'stage': transition.from_stage,
+                        'entered': 0, 'exited': 1, 'seconds_total': transition.seconds_in_stage})
+        bucket = duration_bucket(transition.seconds_in_stage)
+        scopes = {ALL_AGENTS, agent_id}
+        durations = [{'agent_id': scope, 'stage': transition.from_stage, 'bucket': bucket, 'count': 1} for scope in scopes]
+    return monthly, durations
+
+
+def _apply(connection, transitions):
+    monthly, durations = [], []
+    for transition in transitions:
+        m, d = _aggregate_rows(transition)
+        monthly.extend(m)
+        durations.extend(d)
+    upsert_increment(connection, DealStageMonthly.__table__, ('month', 'agent_id', 'stage'), monthly)
+    upsert_increment(connection, DealStageDuration.__table__, ('agent_id', 'stage', 'bucket'), durations)
+
+
+def record_stage_change(deal, from_stage, user_id=None, moment=None):
+    """
+    Appends a DealStageTransition for `deal` (already holding its new stage) and adds it to the
+    monthly and time-in-stage aggregates, in the caller's transaction. from_stage None records the
+    creation of the deal. Returns the transition, or None when the stage did not change.
+    """
+    if from_stage == deal.stage:
+        return None
+    moment = moment or datetime.utcnow()
+    seconds = None
+    if from_stage is not None:
+        # When the deal entered from_stage: its latest transition; for deals created before the log
+        # existed only the initial stage has a known start (the creation of the deal)
+        entered_at = db.session.query(DealStageTransition.transitioned_at)\
+            .filter(DealStageTransition.deal_id == deal.id)\
+            .order_by(DealStageTransition.transitioned_at.desc(), DealStageTransition.id.desc())\
+            .limit(1).scalar()
+        if entered_at is None and from_stage == DealStatusEnum.NEW.value:
+            entered_at = deal.created_at
+        seconds = max((moment - entered_at).total_seconds(), 0.0) if entered_at else None
+    transition = DealStageTransition(deal_id=deal.id, agent_id=deal.agent_id, user_id=user_id,
+                                     from_stage=from_stage, to_stage=deal.stage,
+                                     transitioned_at=moment, seconds_in_stage=seconds)
+    db.session.add(transition)
+    _apply(db.session.connection(), [transition])
+    return transition
+
+
+def rebuild_aggregates(batch_size=5000):
+    """Recomputes deal_stage_monthly and deal_stage_durations from the full transition log."""
+    db.session.execute(db.delete(DealStageMonthly))
+    db.session.execute(db.delete(DealStageDuration))
+    last_id = processed = 0
+    while True:
+        batch = DealStageTransition.query.filter(DealStageTransition.id > last_id)\
+            .order_by(DealStageTransition.id).limit(batch_size).all()
+        if not batch:
+            break
+        _apply(db.session.connection(), batch)
+        last_id = batch[-1].id
+        processed += len(batch)
+    db.session.commit()
+    logger.info(f"Аналитика сделок пересчитана: {processed} переходов.")
+    return processed
+
+
+def median_from_buckets(buckets):
+    """Approximate median duration (seconds) from {bucket: count}; None if empty."""
+    total = sum(buckets.values())
+    if not total:
+        return None
+    seen = 0
+    for bucket in sorted(buckets):
+        seen += buckets[bucket]
+        if seen * 2 >= total:
+            return bucket_midpoint(bucket)
+
+
+def stage_medians():
+    """{agent_id: {stage: (median seconds, sample count)}}; agent_id 0 covers all agents."""
+    histograms = {}
+    for row in DealStageDuration.query.filter(DealStageDuration.count > 0):
+        histograms.setdefault(row.agent_id, {}).setdefault(row.stage, {})[row.bucket] = row.count
+    return {agent_id: {stage: (median_from_buckets(buckets), sum(buckets.values())) for stage, buckets in stages.items()}
+            for agent_id, stages in histograms.items()}
+
+
+def monthly_conversion(months=12):
+    """
+    [(month, agent_id, created, won, lost, conversion)] for the last `months` months with activity,
+    newest first; conversion = won / (won + lost) of the deals closed in that month (None if none).
+    """
+    recent = [month for (month,) in db.session.query(DealStageMonthly.month).distinct()
+              .order_by(DealStageMonthly.month.desc()).limit(months)]
+    outcomes = {DealStatusEnum.NEW.value: 'created', DealStatusEnum.CLOSED_WON.value: 'won',
+                DealStatusEnum.CLOSED_LOST.value: 'lost'}
+    table = {}
+    rows = DealStageMonthly.query.filter(DealStageMonthly.month.in_(recent), DealStageMonthly.stage.in_(list(outcomes)))
+    for row in rows if recent else []:
+        entry = table.setdefault((row.month, row.agent_id), {'created': 0, 'won': 0, 'lost': 0})
+        entry[outcomes[row.stage]] += row.entered
+    result = []
+    for (month, agent_id), entry in sorted(table.items(), key=lambda item: (item[0][0], -item[0][1]), reverse=True):
+        closed = entry['won'] + entry['lost']
+        result.append((month, agent_id, entry['created'], entry['won'], entry['lost'],
+                       entry['won'] / closed if closed else None))
+    return result
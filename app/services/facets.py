@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import literal, union_all
+
+from app import db
+from app.models import Property
+from app.services.property_filters import FACET_FILTERS, range_criteria
+
+logger = logging.getLogger(__name__)
+
+# Property columns offered as drop-downs on the filter page
+FACET_COLUMNS = FACET_FILTERS
+
+_SESSION_FLAG = 'facets_dirty'
+_SESSION_DATA_FLAG = 'properties_dirty'
+
+
+class FacetCache:
+    """
+    Distinct values of FACET_COLUMNS, loaded with one UNION ALL query and kept until a committed
+    Property change touches a facet column or FACET_CACHE_TTL expires (the TTL bounds staleness
+    between worker processes and after bulk UPDATEs that bypass the session).
+    Also holds an LRU of per-filter option counts, dropped on any committed Property change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._choices = None
+        self._loaded_at = 0.0
+        self.generation = 0 # Bumped on every invalidation; later caches key on it
+        self.data_generation = 0 # Bumped on any committed Property change (counts depend on every column)
+        self._counts = OrderedDict() # (data_generation, filter key) -> (loaded_at, counts), LRU order
+
+    def invalidate(self):
+        with self._lock:
+            self._choices = None
+            self.generation += 1
+
+    def invalidate_counts(self):
+        with self._lock:
+            self._counts.clear()
+            self.data_generation += 1
+
+    def get(self):
+        ttl = current_app.config.get('FACET_CACHE_TTL', 300)
+        with self._lock:
+            if self._choices is not None and time.monotonic() - self._loaded_at < ttl:
+                return self._choices
+            generation = self.generation
+        choices = self._load()
+        with self._lock:
+            if generation == self.generation: # Not invalidated while loading
+                self._choices = choices
+                self._loaded_at = time.monotonic()
+        return choices
+
+    @staticmethod
+    def _load():
+        selects = []
+        for name in FACET_COLUMNS:
+            column = getattr(Property, name)
+            selects.append(
+                db.select(literal(name).label('facet'), column.label('value'))
+                .where(column.isnot(None), column != '')
+                .group_by(column)
+            )
+        choices = {name: [] for name in FACET_COLUMNS}
+        for facet, value in db.session.execute(union_all(*selects)):
+            choices[facet].append(value)
+        for values in choices.values():
+            values.sort()
+        logger.info(f"Кэш фасетов фильтра обновлен: {', '.join(f'{k}={len(v)}' for k, v in choices.items())}.")
+        return choices
+
+    def get_counts(self, filters):
+        ttl = current_app.config.get('FACET_CACHE_TTL', 300)
+        max_entries = current_app.config.get('FACET_COUNTS_CACHE_SIZE', 256)
+        with self._lock:
+            key = (self.data_generation, tuple(sorted(filters.items())))
+            entry = self._counts.get(key)
+            if entry is not None and time.monotonic() - entry[0] < ttl:
+                self._counts.move_to_end(key)
+                return entry[1]
+        counts = self._count(filters)
+        with self._lock:
+            if key[0] == self.data_generation:
+                self._counts[key] = (time.monotonic(), counts)
+                self._counts.move_to_end(key)
+                while len(self._counts) > max_entries:
+                    self._counts.popitem(last=False)
+        return counts
+
+    @staticmethod
+    def _count(filters):
+        """
+        Per-option counts for every facet under the current filter, from one GROUP BY over the facet columns.
+        Each facet's own selection is ignored when counting its options, so the numbers show what
+        switching to another option would return; the other selections and range filters still apply.
+        """
+        columns = [getattr(Property, name) for name in FACET_COLUMNS]
+        rows = db.session.query(*columns, db.func.count()).filter(*range_criteria(filters)).group_by(*columns).all()
+        selected = {name: filters[name] for name in FACET_COLUMNS if name in filters}
+        facets = {name: {} for name in FACET_COLUMNS}
+        total = 0
+        for row in rows:
+            values, count = dict(zip(FACET_COLUMNS, row[:-1])), row[-1]
+            mismatched = [name for name, value in selected.items() if values[name] != value]
+            if not mismatched:
+                total += count
+            elif len(mismatched) > 1:
+                continue
+            for name in FACET_COLUMNS:
+                value = values[name]
+                if not value or (mismatched and mismatched[0] != name):
+                    continue
+                facets[name][value] = facets[name].get(value, 0) + count
+        return {'total': total, 'facets': facets}
+
+
+facet_cache = FacetCache()
+
+
+def get_facet_choices():
+    """{column: sorted distinct non-empty values} for every facet column."""
+    return facet_cache.get()
+
+
+def get_facet_counts(filters):
+    """{'total': n, 'facets': {column: {value: count}}} for a filter from property_filters.normalize_filter."""
+    return facet_cache.get_counts(filters)
+
+
+def _changed_properties(session):
+    """(any Property row changed, a facet column changed) for the pending flush."""
+    data_changed = facets_changed = False
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Property):
+            return True, True
+    for obj in session.dirty:
+        if isinstance(obj, Property) and session.is_modified(obj):
+            data_changed = True
+            state = db.inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in FACET_COLUMNS):
+                return True, True
+    return data_changed, facets_changed
+
+
+@db.event.listens_for(db.session, 'before_flush')
+def _mark_facets_dirty(session, flush_context, instances):
+    if session.info.get(_SESSION_FLAG):
+        return
+    data_changed, facets_changed = _changed_properties(session)
+    if data_changed:
+        session.info[_SESSION_DATA_FLAG] = True
+    if facets_changed:
+        session.info[_SESSION_FLAG] = True
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _invalidate_facets_on_commit(session):
+    if session.info.pop(_SESSION_DATA_FLAG, False):
+        facet_cache.invalidate_counts()
+    if session.info.pop(_SESSION_FLAG, False):
+        facet_cache.invalidate()
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _reset_facets_flag(session):
+    session.info.pop(_SESSION_FLAG, None)
+    session.info.pop(_SESSION_DATA_FLAG, None)
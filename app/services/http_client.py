@@ -0,0 +1,187 @@
+import atexit
+import email.utils
+import importlib.util
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from flask import current_app, has_app_context
+
+try:
+    import httpx
+except ImportError: # requests (a hard dependency) is used instead
+    httpx = None
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+DEFAULT_SETTINGS = {
+    'max_connections': 20,
+    'max_connections_per_host': 4,
+    'max_retries': 3,
+    'backoff_base': 0.5,
+    'backoff_max': 30.0,
+}
+
+_client = None
+_client_lock = threading.Lock()
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+class FetchError(Exception):
+    """A request that failed for good: transport error or non-2xx status after all retries."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def http_settings():
+    """Reads the HTTP_* settings in the calling thread; worker threads have no app context."""
+    if not has_app_context():
+        return dict(DEFAULT_SETTINGS)
+    config = current_app.config
+    return {
+        'max_connections': config.get('HTTP_MAX_CONNECTIONS', DEFAULT_SETTINGS['max_connections']),
+        'max_connections_per_host': config.get('HTTP_MAX_CONNECTIONS_PER_HOST', DEFAULT_SETTINGS['max_connections_per_host']),
+        'max_retries': config.get('HTTP_MAX_RETRIES', DEFAULT_SETTINGS['max_retries']),
+        'backoff_base': config.get('HTTP_BACKOFF_BASE_SECONDS', DEFAULT_SETTINGS['backoff_base']),
+        'backoff_max': config.get('HTTP_BACKOFF_MAX_SECONDS', DEFAULT_SETTINGS['backoff_max']),
+    }
+
+
+class _HttpxTransport:
+    """httpx.Client: pooled keep-alive connections, HTTP/2 when the h2 package is installed."""
+
+    retry_errors = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) if httpx else ()
+    errors = (httpx.HTTPError, httpx.InvalidURL) if httpx else ()
+
+    def __init__(self, settings):
+        http2 = importlib.util.find_spec('h2') is not None
+        limits = httpx.Limits(max_connections=settings['max_connections'],
+                              max_keepalive_connections=settings['max_connections'])
+        self.client = httpx.Client(http2=http2, limits=limits, follow_redirects=True)
+        self.name = 'httpx (HTTP/2)' if http2 else 'httpx'
+
+    def get(self, url, headers, timeout):
+        return self.client.get(url, headers=headers, timeout=timeout)
+
+    def close(self):
+        self.client.close()
+
+
+class _RequestsTransport:
+    """requests.Session fallback: HTTP/1.1 keep-alive pools of max_connections_per_host per host."""
+
+    retry_errors = (requests.ConnectionError, requests.Timeout)
+    errors = (requests.RequestException,)
+
+    def __init__(self, settings):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=settings['max_connections'],
+                              pool_maxsize=settings['max_connections_per_host'])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.name = 'requests'
+
+    def get(self, url, headers, timeout):
+        return self.session.get(url, headers=headers, timeout=timeout)
+
+    def close(self):
+        self.session.close()
+
+
+def _get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            settings = http_settings()
+            transport = (_HttpxTransport if httpx else _RequestsTransport)(settings)
+            _client = (transport, settings)
+            logger.info(f"HTTP-клиент инициализирован: {transport.name}.")
+        return _client
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client[0].close()
+            _client = None
+
+
+atexit.register(close_client)
+
+
+def _host_slot(host, limit):
+    """Semaphore capping concurrent requests (and so open connections) to one host."""
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(limit)
+        return slot
+
+
+def _retry_after(response):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max((moment - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def _backoff(attempt, settings):
+    """Exponential backoff with full jitter: uniform in [0, min(max, base * 2**attempt)]."""
+    return random.uniform(0, min(settings['backoff_max'], settings['backoff_base'] * 2 ** attempt))
+
+
+def fetch(url, headers=None, timeout=15, rate_limiter=None, max_retries=None):
+    """
+    GETs `url` through the shared pooled client and returns the response (content fully read).
+    Connection errors, timeouts, 429 and 5xx are retried with exponential backoff and jitter,
+    honouring Retry-After, up to `max_retries` times (default HTTP_MAX_RETRIES; pass 0 from
+    request handlers so a user never waits on backoff); `rate_limiter.acquire(url)` is called
+    before every attempt. Raises FetchError when the request still fails or returns a non-2xx status.
+    """
+    transport, settings = _get_client()
+    if max_retries is None:
+        max_retries = settings['max_retries']
+    slot = _host_slot(urlparse(url).netloc, settings['max_connections_per_host'])
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire(url)
+        try:
+            with slot:
+                response = transport.get(url, headers, timeout)
+        except transport.errors as e:
+            if not isinstance(e, transport.retry_errors) or attempt == max_retries:
+                raise FetchError(f"{url}: {e}") from e
+            retry_in = _backoff(attempt, settings)
+            logger.warning(f"Ошибка соединения {url}: {e}. Повтор через {retry_in:.1f} с.")
+        else:
+            status = response.status_code
+            if 200 <= status < 300:
+                return response
+            if status not in RETRY_STATUSES or attempt == max_retries:
+                raise FetchError(f"{url}: HTTP {status}", status_code=status)
+            retry_after = _retry_after(response)
+            retry_in = min(retry_after, settings['backoff_max']) if retry_after is not None else _backoff(attempt, settings)
+            logger.warning(f"HTTP {status} для {url}. Повтор через {retry_in:.1f} с.")
+        time.sleep(retry_in)
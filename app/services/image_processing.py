@@ -0,0 +1,211 @@
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app, has_app_context
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import PropertyImage
+from app.services.image_storage import content_hash_for
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_MIMETYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+OUTPUT_EXTENSIONS = {'WEBP': '.webp', 'JPEG': '.jpg'}
+
+DEFAULT_SETTINGS = {'max_dimension': 1920, 'output_format': 'WEBP', 'quality': 82}
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+_SESSION_QUEUED = 'normalize_images_queued'
+_SESSION_READY = 'normalize_images_ready'
+
+# Post-commit swaps: attempts while the database is locked, first backoff delay
+SWAP_ATTEMPTS = 5
+SWAP_RETRY_SECONDS = 0.2
+
+_executor = None
+_executor_lock = threading.Lock()
+_swap_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def normalization_settings():
+    """Reads the IMAGE_* settings in the calling thread; worker threads have no app context."""
+    if not has_app_context():
+        return dict(DEFAULT_SETTINGS)
+    config = current_app.config
+    return {
+        'max_dimension': config.get('IMAGE_MAX_DIMENSION', DEFAULT_SETTINGS['max_dimension']),
+        'output_format': config.get('IMAGE_OUTPUT_FORMAT', DEFAULT_SETTINGS['output_format']),
+        'quality': config.get('IMAGE_QUALITY', DEFAULT_SETTINGS['quality']),
+    }
+
+
+def normalize_image(data, mimetype=None, filename=None, max_dimension=1920, output_format='WEBP', quality=82):
+    """
+    Caps the longest side at `max_dimension`, re-encodes to `output_format` and drops EXIF/ICC/XMP metadata.
+    Returns (data, mimetype, filename). Bytes Pillow cannot decode, animations and re-encodes that would
+    grow an already small image are returned unchanged.
+    """
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if getattr(image, 'is_animated', False):
+                return data, mimetype, filename
+            image = ImageOps.exif_transpose(image) # Bake the orientation in before EXIF is dropped
+            resized = max(image.size) > max_dimension
+            if resized:
+                image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            keep_alpha = output_format == 'WEBP' and ('A' in image.getbands() or 'transparency' in image.info)
+            target_mode = 'RGBA' if keep_alpha else 'RGB'
+            if image.mode != target_mode:
+                image = image.convert(target_mode)
+            output = io.BytesIO()
+            # No exif/icc_profile arguments: Pillow writes none, which strips the metadata
+            image.save(output, format=output_format, quality=quality)
+    except Exception as e:
+        logger.warning(f"Не удалось нормализовать изображение {filename or ''}: {e}")
+        return data, mimetype, filename
+
+    normalized = output.getvalue()
+    if not resized and len(normalized) >= len(data):
+        return data, mimetype, filename
+    if filename:
+        filename = os.path.splitext(filename)[0] + OUTPUT_EXTENSIONS.get(output_format, '')
+    return normalized, OUTPUT_MIMETYPES.get(output_format, mimetype), filename
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = DEFAULT_WORKERS
+            if has_app_context():
+                workers = current_app.config.get('IMAGE_PROCESSING_WORKERS') or workers
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-normalize')
+        return _executor
+
+
+def submit_normalization(data, mimetype=None, filename=None):
+    """
+    Queues `normalize_image` on the shared worker pool and returns a Future of (data, mimetype, filename).
+    Pillow releases the GIL while decoding, resizing and encoding, so threads give real parallelism here
+    and callers keep downloading while earlier images are processed.
+    """
+    return _get_executor().submit(normalize_image, data, mimetype, filename, **normalization_settings())
+
+
+def resolve_scraped_image(image_dict):
+    """(data, mimetype, filename) for a scraper image entry, waiting on its normalization Future if it has one."""
+    future = image_dict.get('normalized')
+    if future is not None:
+        return future.result()
+    return normalize_image(image_dict['data'], image_dict.get('mimetype'), image_dict.get('filename'),
+                           **normalization_settings())
+
+
+class NormalizationBudget:
+    """
+    How long one request may wait, in total, for its photos' normalization futures
+    (IMAGE_NORMALIZE_WAIT_SECONDS). Photos done in time are stored normalized before the commit;
+    the rest are stored as originals flagged normalize_pending and swapped in after the commit by
+    the single normalization writer, so requests never hold a second write transaction open.
+    """
+
+    def __init__(self):
+        self.remaining = current_app.config.get('IMAGE_NORMALIZE_WAIT_SECONDS', 3.0)
+
+    def image(self, future, data, mimetype=None, filename=None, **fields):
+        """PropertyImage for a photo whose normalization `future` came from submit_normalization(data, ...)."""
+        started = time.monotonic()
+        try:
+            data, mimetype, filename = future.result(timeout=max(self.remaining, 0))
+        except FutureTimeoutError:
+            image = PropertyImage.from_bytes(data, mimetype=mimetype, filename=filename, normalize_pending=True, **fields)
+            db.session.info.setdefault(_SESSION_QUEUED, []).append((image, future, current_app._get_current_object()))
+            return image
+        finally:
+            self.remaining -= time.monotonic() - started
+        return PropertyImage.from_bytes(data, mimetype=mimetype, filename=filename, **fields)
+
+
+def apply_normalized(image_id, original_hash, normalized):
+    """
+    Stores `normalized` (data, mimetype, filename) in a pending image row and clears its flag, in its
+    own transaction. Skipped when the row was deleted or its bytes replaced since; retried with backoff
+    while another writer holds the database lock (SQLite "database is locked"). Returns True if applied.
+    """
+    data, mimetype, filename = normalized
+    for attempt in range(SWAP_ATTEMPTS):
+        try:
+            image = db.session.get(PropertyImage, image_id)
+            if image is None or image.content_hash != original_hash:
+                db.session.rollback()
+                return False
+            if content_hash_for(data) != original_hash:
+                image.store_bytes(data)
+                image.mimetype, image.filename = mimetype, filename
+            image.normalize_pending = False
+            db.session.commit()
+            return True
+        except OperationalError as e:
+            db.session.rollback()
+            if attempt == SWAP_ATTEMPTS - 1:
+                logger.error(f"Не удалось сохранить обработанное изображение {image_id}: {e}")
+                return False
+            time.sleep(SWAP_RETRY_SECONDS * 2 ** attempt)
+
+
+def _write_normalized_images():
+    """The only thread that writes post-commit swaps, one short transaction per image."""
+    while True:
+        flask_app, image_id, original_hash, future = _swap_queue.get()
+        with flask_app.app_context():
+            try:
+                apply_normalized(image_id, original_hash, future.result())
+            except Exception as e:
+                logger.error(f"Ошибка замены изображения {image_id} обработанной копией: {e}", exc_info=True)
+            finally:
+                db.session.remove()
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_normalized_images, name='image-normalize-writer', daemon=True)
+            _writer.start()
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def _collect_flushed_images(session, flush_context):
+    # Row ids exist from the flush on; snapshot them now, the objects are expired after the commit
+    queued = session.info.get(_SESSION_QUEUED)
+    if not queued:
+        return
+    ready = session.info.setdefault(_SESSION_READY, [])
+    for image, future, flask_app in queued:
+        if image.id is not None:
+            ready.append((flask_app, image.id, image.content_hash, future))
+    session.info[_SESSION_QUEUED] = [job for job in queued if job[0].id is None]
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _queue_committed_images(session):
+    ready = session.info.pop(_SESSION_READY, None)
+    if ready:
+        _start_writer()
+        for job in ready:
+            _swap_queue.put(job)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _discard_queued_images(session):
+    session.info.pop(_SESSION_QUEUED, None)
+    session.info.pop(_SESSION_READY, None)
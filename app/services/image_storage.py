@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DATABASE = 'database' # Bytes kept inline in property_images.image_data
+STORAGE_FILESYSTEM = 'filesystem' # Bytes kept in the content-addressed file store
+
+
+def content_hash_for(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ImageStorage(ABC):
+    """Interface for out-of-database image backends. Objects are addressed by their SHA-256 hex digest."""
+    name = None
+
+    @abstractmethod
+    def save(self, content_hash, data):
+        """Stores data under its hash; returns False if it was already stored (deduplicated)."""
+
+    @abstractmethod
+    def read(self, content_hash):
+        """Returns the stored bytes."""
+
+    @abstractmethod
+    def delete(self, content_hash):
+        """Removes the object; returns False if it did not exist."""
+
+    @abstractmethod
+    def iter_hashes(self):
+        """Yields the hashes of all stored objects."""
+
+    @abstractmethod
+    def modified_at(self, content_hash):
+        """Unix time the object was last written or re-saved, or None if it does not exist."""
+
+
+class FileSystemImageStorage(ImageStorage):
+    """
+    Content-addressed store on local disk: <root>/ab/cd/abcd...ef.
+    Two levels of sharding keep directories small; identical photos across listings
+    share one file because the path is derived from the content hash.
+    """
+    name = STORAGE_FILESYSTEM
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], content_hash)
+
+    def save(self, content_hash, data):
+        """Writes data under its hash. Returns False if the content was already stored (deduplicated)."""
+        path = self.path_for(content_hash)
+        if os.path.exists(path):
+            # Refresh the mtime: a row about to reference this file is not committed yet, and
+            # images-gc leaves recently written files alone
+            try:
+                os.utime(path)
+                return False
+            except FileNotFoundError:
+                pass # Removed by images-gc in the meantime; write it again
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file in the same directory and rename, so readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+
+    def read(self, content_hash):
+        with open(self.path_for(content_hash), 'rb') as f:
+            return f.read()
+
+    def delete(self, content_hash):
+        path = self.path_for(content_hash)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def modified_at(self, content_hash):
+        try:
+            return os.path.getmtime(self.path_for(content_hash))
+        except FileNotFoundError:
+            return None
+
+    def iter_hashes(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.startswith('.tmp-'):
+                    yield filename
+
+
+STORAGE_BACKENDS = {
+    STORAGE_FILESYSTEM: FileSystemImageStorage,
+}
+
+
+def get_storage(name=None):
+    """Returns the backend instance for `name` (default: IMAGE_STORAGE_BACKEND), or None for inline DB storage."""
+    name = name or current_app.config.get('IMAGE_STORAGE_BACKEND', STORAGE_DATABASE)
+    if name == STORAGE_DATABASE:
+        return None
+    backend_cls = STORAGE_BACKENDS.get(name)
+    if backend_cls is None:
+        raise ValueError(f"Неизвестный бэкенд хранения изображений: {name}")
+    root = current_app.config.get('IMAGE_STORAGE_PATH') or os.path.join(current_app.instance_path, 'image_store')
+    return backend_cls(root)
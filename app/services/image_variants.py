@@ -0,0 +1,164 @@
+import io
+import logging
+import os
+import tempfile
+import threading
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+VARIANT_MIMETYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+
+
+class VariantCache:
+    """
+    Disk cache of resized images with a byte cap and least-recently-used eviction.
+    File mtime doubles as the LRU timestamp: hits touch the file, eviction removes the oldest.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None # Computed lazily from disk on first write
+
+    def path_for(self, content_hash, width, image_format):
+        extension = image_format.lower()
+        return os.path.join(self.root, content_hash[:2], f"{content_hash}_w{width}.{extension}")
+
+    def marker_path(self, content_hash, width):
+        """Empty file recording that the original is no wider than `width` (there is no variant to make)."""
+        return os.path.join(self.root, content_hash[:2], f"{content_hash}_w{width}.original")
+
+    def _touch(self, path):
+        try:
+            os.utime(path) # Mark as recently used
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, content_hash, width, image_format):
+        return self._touch(self.path_for(content_hash, width, image_format))
+
+    def is_original(self, content_hash, width):
+        return self._touch(self.marker_path(content_hash, width)) is not None
+
+    def mark_original(self, content_hash, width):
+        path = self.marker_path(content_hash, width)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'ab').close() # Zero bytes: markers do not count against max_bytes
+
+    def put(self, content_hash, width, image_format, data):
+        path = self.path_for(content_hash, width, image_format)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        with self._lock:
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            if self._total_bytes is None:
+                self._total_bytes = self._disk_usage()
+            else:
+                self._total_bytes += len(data) - previous_size
+            if self._total_bytes > self.max_bytes:
+                self._evict(keep=path)
+        return path
+
+    def _iter_files(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.startswith('.tmp-'):
+                    yield os.path.join(dirpath, filename)
+
+    def _disk_usage(self):
+        return sum(os.path.getsize(path) for path in self._iter_files())
+
+    def _evict(self, keep=None):
+        """Removes least recently used variants until the cache is at 90% of its cap. Caller holds the lock."""
+        target = int(self.max_bytes * 0.9)
+        entries = []
+        for path in self._iter_files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._total_bytes <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                self._total_bytes -= size
+            except FileNotFoundError:
+                pass
+        logger.info(f"Кэш превью изображений очищен до {self._total_bytes} байт.")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_variant_cache():
+    global _cache
+    with _cache_lock:
+        root = current_app.config.get('IMAGE_VARIANT_CACHE_PATH') or os.path.join(current_app.instance_path, 'image_variants')
+        if _cache is None or _cache.root != root:
+            _cache = VariantCache(root, current_app.config.get('IMAGE_VARIANT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+        return _cache
+
+
+def normalize_width(requested_width):
+    """Snaps a requested width to the smallest configured variant width that covers it."""
+    widths = sorted(current_app.config.get('IMAGE_VARIANT_WIDTHS', (80, 160, 320, 640, 1280)))
+    for width in widths:
+        if requested_width <= width:
+            return width
+    return widths[-1]
+
+
+def resize_image(data, width, image_format, quality):
+    """Returns `data` scaled down to `width` pixels wide, or None if the original is already that small."""
+    from PIL import Image, ImageOps
+    with Image.open(io.BytesIO(data)) as image:
+        if image.width <= width:
+            return None
+        image = ImageOps.exif_transpose(image)
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        if image_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+            resized = resized.convert('RGB')
+        output = io.BytesIO()
+        resized.save(output, format=image_format, quality=quality)
+        return output.getvalue()
+
+
+def get_variant_path(image_record, width):
+    """
+    Path of the cached `width` variant of an image, generating it on first request.
+    Returns None when the original is not larger than `width` (serve the original instead); that
+    is cached as a marker too, so repeat requests do not decode the original again.
+    """
+    image_format = current_app.config.get('IMAGE_VARIANT_FORMAT', 'WEBP')
+    cache = get_variant_cache()
+    path = cache.get(image_record.content_hash, width, image_format)
+    if path:
+        return path
+    if cache.is_original(image_record.content_hash, width):
+        return None
+    resized = resize_image(image_record.read_bytes(), width, image_format,
+                           current_app.config.get('IMAGE_VARIANT_QUALITY', 80))
+    if resized is None:
+        cache.mark_original(image_record.content_hash, width)
+        return None
+    return cache.put(image_record.content_hash, width, image_format, resized)
+
+
+def variant_mimetype():
+    return VARIANT_MIMETYPES.get(current_app.config.get('IMAGE_VARIANT_FORMAT', 'WEBP'), 'application/octet-stream')
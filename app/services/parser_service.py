@@ -11,6 +11,8 @@ import time
 from sqlalchemy.exc import SQLAlchemyError
 from app import db
 from app.models import Property, User, Role, PropertyImage # PropertyImage is key
+from app.services.image_processing import resolve_scraped_image
+from app.services.client_matching import record_new_matches
 
 # Scraper imports
 from app.scrapers.olx_scraper import scrape_olx
@@ -55,6 +57,7 @@ def process_scraped_data(scraped_properties, source_site_name, app_instance_path
 
     counts = {"added": 0, "updated": 0, "errors": 0, "skipped": 0}
     total_items = len(scraped_properties)
+    added_properties = [] # Matched against client interests once the batch is committed
 
     property_fields_from_schema = [ # Fields expected from scraper, matching new Property model
         'name', 'address', 'cat', 'status', 'district', 'price', 'layout', # 'layout' kept from PropertyForm
@@ -132,14 +135,12 @@ def process_scraped_data(scraped_properties, source_site_name, app_instance_path
                     if update_callback and existing_property.images.count() > 0: update_callback({"log_message": f"Удалены старые фото для ID {item_id_short}."})
                     
                     for image_dict in prop_data['scraped_images_data'][:10]: # Limit images
-                        new_db_image = PropertyImage(
-                            image_data=image_dict['data'],
-                            filename=image_dict['filename'],
-                            mimetype=image_dict['mimetype']
-                        )
+                        image_data, mimetype, filename = resolve_scraped_image(image_dict)
+                        new_db_image = PropertyImage.from_bytes(image_data, filename=filename, mimetype=mimetype)
                         existing_property.images.append(new_db_image)
                     if update_callback: update_callback({"log_message": f"Добавлены/обновлены фото ({len(prop_data['scraped_images_data'])}) для ID {item_id_short}."})
                     if 'images' not in updated_fields_log: updated_fields_log.append('images')
+                    existing_property.refresh_image_summary()
                 
                 db.session.add(existing_property)
                 counts["updated"] += 1
@@ -152,14 +153,13 @@ def process_scraped_data(scraped_properties, source_site_name, app_instance_path
                 
                 if 'scraped_images_data' in prop_data and prop_data['scraped_images_data']:
                     for image_dict in prop_data['scraped_images_data'][:10]:
-                        new_db_image = PropertyImage(
-                            image_data=image_dict['data'],
-                            filename=image_dict['filename'],
-                            mimetype=image_dict['mimetype']
-                        )
+                        image_data, mimetype, filename = resolve_scraped_image(image_dict)
+                        new_db_image = PropertyImage.from_bytes(image_data, filename=filename, mimetype=mimetype)
                         new_property.images.append(new_db_image)
                 
                 db.session.add(new_property)
+                new_property.refresh_image_summary()
+                added_properties.append(new_property)
                 counts["added"] += 1
                 log_msg = f"Добавлено новое: {new_property.name} (Ext. ID: {new_property.external_id})"
             
@@ -183,6 +183,7 @@ def process_scraped_data(scraped_properties, source_site_name, app_instance_path
         db.session.commit()
         logger.info("Все успешные изменения сохранены в БД.")
         if update_callback: update_callback({"log_message": "Все успешные изменения сохранены в БД."})
+        _record_client_matches(added_properties, source_site_name, update_callback)
     except SQLAlchemyError as e_commit:
         db.session.rollback()
         logger.error(f"Критическая ошибка при сохранении сессии в БД: {e_commit}", exc_info=True) 
@@ -203,6 +204,19 @@ def process_scraped_data(scraped_properties, source_site_name, app_instance_path
         counts["errors"] = total_items; counts["added"] = 0; counts["updated"] = 0
     return counts
 
+def _record_client_matches(added_properties, source_site_name, update_callback=None):
+    """Stores which clients the newly added listings suit; a failure here never undoes the committed batch."""
+    property_ids = [p.id for p in added_properties if db.inspect(p).persistent]
+    if not property_ids:
+        return
+    try:
+        matched = record_new_matches(property_ids, source=source_site_name)
+        if matched and update_callback:
+            update_callback({"log_message": f"Новых совпадений с интересами клиентов: {matched}."})
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Ошибка при подборе клиентов для новых объявлений: {e}", exc_info=True)
+
 def run_parsing_task(flask_app, source_name, num_pages, base_url):
     with flask_app.app_context():
         from flask import session 
@@ -0,0 +1,70 @@
+from flask import current_app
+
+from app.models import Property
+
+# Filter page inputs that map to range predicates: (form field, Property column, comparison)
+RANGE_FILTERS = (
+    ('min_price', 'price', '>='), ('max_price', 'price', '<='),
+    ('min_area', 'area', '>='), ('max_area', 'area', '<='),
+    ('min_floor', 'floor', '>='), ('max_floor', 'floor', '<='),
+    ('year_from', 'year_built', '>='), ('year_to', 'year_built', '<='),
+    ('total_floors_min', 'total_floors', '>='), ('total_floors_max', 'total_floors', '<='),
+)
+
+# Filter page inputs that are equality predicates on a column of the same name (drop-down facets)
+FACET_FILTERS = ('district', 'condition', 'layout', 'cat', 'status')
+
+# Free-text address input, resolved to property ids through the trigram index (typos and "ул."/"улица" tolerated)
+ADDRESS_FILTER = 'address'
+
+
+def normalize_filter(data):
+    """
+    Reduces PropertyFilterForm.data to the filters actually set, with stable value types,
+    so equivalent filter states compare (and cache) equal.
+    """
+    filters = {}
+    for name, _, _ in RANGE_FILTERS:
+        value = data.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            continue
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        filters[name] = value
+    for name in FACET_FILTERS:
+        value = (data.get(name) or '').strip()
+        if value:
+            filters[name] = value
+    address = ' '.join((data.get(ADDRESS_FILTER) or '').split())
+    if address:
+        filters[ADDRESS_FILTER] = address
+    return filters
+
+
+def range_criteria(filters):
+    criteria = []
+    for name, column_name, op in RANGE_FILTERS:
+        if name in filters:
+            column = getattr(Property, column_name)
+            criteria.append(column >= filters[name] if op == '>=' else column <= filters[name])
+    if ADDRESS_FILTER in filters:
+        criteria.append(Property.id.in_(address_filter_ids(filters[ADDRESS_FILTER])))
+    return criteria
+
+
+def facet_criteria(filters, exclude=None):
+    """Equality predicates for the selected facets, optionally leaving one facet out (drill-down counts)."""
+    return [getattr(Property, name) == filters[name] for name in FACET_FILTERS
+            if name in filters and name != exclude]
+
+
+def address_filter_ids(address):
+    from app.services.address_index import fuzzy_address_ids
+    # Best-ranked matches only: the ids become an IN list in SQL, so keep it short
+    return fuzzy_address_ids(address, limit=current_app.config.get('ADDRESS_FILTER_MAX_MATCHES', 500))
+
+
+def filter_criteria(filters):
+    return range_criteria(filters) + facet_criteria(filters)
@@ -0,0 +1,184 @@
+import time
+
+import numpy as np
+from flask import current_app
+
+from app import db
+from app.models import Property
+from app.services.property_filters import ADDRESS_FILTER, FACET_FILTERS, RANGE_FILTERS, address_filter_ids
+from app.services.synced_index import IndexSync, SyncedIndex
+
+NUMERIC_COLUMNS = ('price', 'area', 'floor', 'total_floors', 'year_built')
+CATEGORICAL_COLUMNS = FACET_FILTERS
+
+
+class PropertyIndex(SyncedIndex):
+    """
+    In-process columnar copy of the filterable Property fields.
+    Numeric columns are float64 arrays with NaN for NULL (so comparisons behave like SQL),
+    categorical columns are int32 codes into a per-column dictionary (-1 for NULL/empty).
+    Filters are evaluated as vectorized masks; results are id lists in the filter page order.
+    """
+
+    models = (Property,)
+    label = 'Индекс объектов'
+
+    def __init__(self):
+        super().__init__()
+        self.ids = np.empty(0, dtype=np.int64)
+        self.created_at = np.empty(0, dtype='datetime64[us]')
+        self.alive = np.empty(0, dtype=bool)
+        self.numeric = {name: np.empty(0, dtype=np.float64) for name in NUMERIC_COLUMNS}
+        self.codes = {name: np.empty(0, dtype=np.int32) for name in CATEGORICAL_COLUMNS}
+        self.dictionaries = {name: {} for name in CATEGORICAL_COLUMNS} # value -> code
+        self._positions = {} # property id -> row position
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def _size(self, model):
+        return len(self)
+
+    def _select(self, model, ids=None, since=None):
+        columns = [Property.id, Property.updated_at, Property.created_at]
+        columns += [getattr(Property, name) for name in NUMERIC_COLUMNS + CATEGORICAL_COLUMNS]
+        query = db.session.query(*columns)
+        if ids is not None:
+            query = query.filter(Property.id.in_(ids))
+        if since is not None:
+            query = query.filter(Property.updated_at >= since)
+        return query.order_by(Property.id).all()
+
+    def _encode(self, name, value):
+        if not value:
+            return -1
+        dictionary = self.dictionaries[name]
+        code = dictionary.get(value)
+        if code is None:
+            code = dictionary[value] = len(dictionary)
+        return code
+
+    def _apply(self, model, rows):
+        """Overwrites known ids in place and appends new ones in a single concatenate per column."""
+        new_rows = []
+        rows = list(rows)
+        for row in rows:
+            position = self._positions.get(row[0])
+            if position is None:
+                new_rows.append(row)
+                continue
+            self.created_at[position] = row[2]
+            self.alive[position] = True
+            for offset, name in enumerate(NUMERIC_COLUMNS, start=3):
+                self.numeric[name][position] = np.nan if row[offset] is None else row[offset]
+            for offset, name in enumerate(CATEGORICAL_COLUMNS, start=3 + len(NUMERIC_COLUMNS)):
+                self.codes[name][position] = self._encode(name, row[offset])
+        if new_rows:
+            start = len(self.ids)
+            self.ids = np.concatenate([self.ids, np.fromiter((row[0] for row in new_rows), dtype=np.int64, count=len(new_rows))])
+            self.created_at = np.concatenate([self.created_at, np.array([row[2] for row in new_rows], dtype='datetime64[us]')])
+            self.alive = np.concatenate([self.alive, np.ones(len(new_rows), dtype=bool)])
+            for offset, name in enumerate(NUMERIC_COLUMNS, start=3):
+                column = np.array([np.nan if row[offset] is None else row[offset] for row in new_rows], dtype=np.float64)
+                self.numeric[name] = np.concatenate([self.numeric[name], column])
+            for offset, name in enumerate(CATEGORICAL_COLUMNS, start=3 + len(NUMERIC_COLUMNS)):
+                column = np.fromiter((self._encode(name, row[offset]) for row in new_rows), dtype=np.int32, count=len(new_rows))
+                self.codes[name] = np.concatenate([self.codes[name], column])
+            for position, row in enumerate(new_rows, start=start):
+                self._positions[row[0]] = position
+        return bool(rows)
+
+    def _remove(self, model, property_ids):
+        for property_id in property_ids:
+            position = self._positions.get(property_id)
+            if position is not None:
+                self.alive[position] = False
+
+    def mask(self, filters):
+        """Boolean row mask for a filter dict from property_filters.normalize_filter."""
+        mask = self.alive.copy()
+        for name, column_name, op in RANGE_FILTERS:
+            if name in filters:
+                column = self.numeric[column_name]
+                value = float(filters[name])
+                mask &= (column >= value) if op == '>=' else (column <= value)
+        for name in CATEGORICAL_COLUMNS:
+            if name not in filters:
+                continue
+            values = filters[name] if isinstance(filters[name], (list, tuple, set)) else [filters[name]]
+            codes = [self.dictionaries[name][v] for v in values if v in self.dictionaries[name]]
+            if not codes:
+                return np.zeros_like(mask)
+            mask &= np.isin(self.codes[name], codes) if len(codes) > 1 else (self.codes[name] == codes[0])
+        if ADDRESS_FILTER in filters:
+            mask &= np.isin(self.ids, address_filter_ids(filters[ADDRESS_FILTER]))
+        return mask
+
+    def search(self, filters):
+        """Matching ids newest first (created_at, id descending), the filter page order."""
+        with self._lock:
+            rows = np.flatnonzero(self.mask(filters))
+            ids = self.ids[rows]
+            order = np.lexsort((ids, self.created_at[rows]))[::-1]
+            return ids[order].tolist()
+
+
+index_sync = IndexSync(PropertyIndex, 'PROPERTY_INDEX_REFRESH_SECONDS', 5)
+
+
+def get_property_index():
+    """
+    The process-wide index, or None when PROPERTY_INDEX_ENABLED is off or its first build (in the
+    background) has not finished yet: callers then use SQL.
+    """
+    if not current_app.config.get('PROPERTY_INDEX_ENABLED'):
+        return None
+    return index_sync.get()
+
+
+def sample_filters(index, limit=20):
+    """Representative filter states for benchmarking: each facet value, price bands and combinations."""
+    samples = [{}]
+    prices = index.numeric['price'][index.alive & ~np.isnan(index.numeric['price'])]
+    bands = []
+    if len(prices):
+        low, mid, high = np.percentile(prices, [25, 50, 75])
+        bands = [{'min_price': int(low), 'max_price': int(high)}, {'max_price': int(mid)}]
+        samples.extend(bands)
+    for name in CATEGORICAL_COLUMNS:
+        for value in list(index.dictionaries[name])[:3]:
+            samples.append({name: value})
+            for band in bands[:1]:
+                samples.append({name: value, **band, 'min_area': 30})
+    samples.append({'year_from': 1980, 'year_to': 2010, 'min_floor': 2})
+    return samples[:limit]
+
+
+def benchmark(filters_list, repeat=20):
+    """[(filters, sql_ms, index_ms, same_result)] with median timings of the SQL path and the index."""
+    from app.services.property_filters import filter_criteria
+    index = PropertyIndex()
+    index.load()
+    results = []
+    for filters in filters_list:
+        sql_times, index_times = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            sql_ids = [row[0] for row in db.session.query(Property.id).filter(*filter_criteria(filters))
+                       .order_by(Property.created_at.desc(), Property.id.desc())]
+            sql_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            index_ids = index.search(filters)
+            index_times.append(time.perf_counter() - started)
+        results.append((filters, float(np.median(sql_times)) * 1000, float(np.median(index_times)) * 1000,
+                        sql_ids == index_ids))
+    return results
+
+
+def load_properties(property_ids, chunk_size=500):
+    """Property rows for `property_ids`, in that order (IN lists are chunked to stay under bind limits)."""
+    by_id = {}
+    for start in range(0, len(property_ids), chunk_size):
+        chunk = property_ids[start:start + chunk_size]
+        by_id.update((prop.id, prop) for prop in Property.query.filter(Property.id.in_(chunk)))
+    return [by_id[property_id] for property_id in property_ids if property_id in by_id]
@@ -0,0 +1,75 @@
+import logging
+
+from sqlalchemy import text
+
+from app import db
+from app.models import Property
+
+logger = logging.getLogger(__name__)
+
+
+def _plan_checks():
+    """(label, query) pairs mirroring the common filter page and client matching predicates."""
+    newest_first = (Property.created_at.desc(), Property.id.desc())
+    return [
+        ('Район + диапазон цены (подбор)',
+         Property.query.filter(Property.district.in_(['Алмалинский', 'Бостандыкский']),
+                               Property.price >= 10000000, Property.price <= 30000000).order_by(Property.price)),
+        ('Район (фильтр)',
+         Property.query.filter(Property.district == 'Алмалинский').order_by(*newest_first)),
+        ('Диапазон цены',
+         Property.query.filter(Property.price >= 10000000, Property.price <= 30000000).order_by(Property.price)),
+        ('Статус, новые сначала',
+         Property.query.filter(Property.status == 'Продажа').order_by(*newest_first)),
+        ('Категория + цена',
+         Property.query.filter(Property.cat == 'Квартира', Property.price <= 30000000).order_by(Property.price)),
+        ('Состояние + планировка',
+         Property.query.filter(Property.condition == 'Евроремонт', Property.layout == 'Раздельная')),
+        ('Диапазон площади',
+         Property.query.filter(Property.area >= 40, Property.area <= 80)),
+        ('Год постройки',
+         Property.query.filter(Property.year_built >= 1990, Property.year_built <= 2010)),
+        ('Этаж + этажность',
+         Property.query.filter(Property.floor >= 2, Property.floor <= 5, Property.total_floors <= 9)),
+    ]
+
+
+def explain(query):
+    """Plan lines for `query` as reported by the current database (SQLite or PostgreSQL); None for other dialects."""
+    dialect = db.engine.dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'sqlite':
+        return [row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    if dialect.name == 'postgresql':
+        # Small tables make a sequential scan the cheapest plan; disable it to see whether an index applies at all
+        db.session.execute(text("SET LOCAL enable_seqscan = off"))
+        try:
+            return [row[0] for row in db.session.execute(text(f"EXPLAIN {sql}"))]
+        finally:
+            db.session.rollback()
+    logger.warning(f"Проверка планов запросов не поддерживается для {dialect.name}; пропущено.")
+    return None
+
+
+def full_scans(plan_lines, table='properties'):
+    """Plan lines that read every row of `table` instead of searching an index."""
+    scans = []
+    for line in plan_lines:
+        stripped = line.strip(' |-`')
+        if stripped.startswith(f'SCAN {table}'): # SQLite; SEARCH means an index lookup, SCAN walks every row
+            scans.append(line)
+        elif f'Seq Scan on {table}' in line: # PostgreSQL
+            scans.append(line)
+    return scans
+
+
+def check_query_plans():
+    """
+    Runs EXPLAIN for every plan check; returns [(label, plan_lines, full_scan_lines)].
+    plan_lines is None (and full_scan_lines empty) when the database cannot be checked.
+    """
+    results = []
+    for label, query in _plan_checks():
+        plan = explain(query)
+        results.append((label, plan, full_scans(plan) if plan is not None else []))
+    return results
@@ -0,0 +1,181 @@
+import logging
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.models import Property, Client, Deal, RollupCounter
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_SCOPE = 0
+
+# model -> (dimension prefix, attribute holding the agent, attributes broken down by value)
+ROLLUPS = {
+    Property: ('properties', 'added_by_user_id', ('source', 'status', 'district')),
+    Client: ('clients', 'added_by_user_id', ()),
+    Deal: ('deals', 'agent_id', ('stage',)),
+}
+
+_SESSION_DELTAS = 'rollup_counter_deltas'
+
+
+def _noop_set(target, value, oldvalue, initiator):
+    pass
+
+
+# Load the previous value when a tracked attribute is assigned on an expired instance, so the
+# flush always knows which counter to decrement
+for _model, (_, _agent_attr, _dimensions) in ROLLUPS.items():
+    for _attr in (_agent_attr,) + _dimensions:
+        db.event.listen(getattr(_model, _attr), 'set', _noop_set, active_history=True)
+
+
+def _counter_keys(model, values):
+    """(agent_id, dimension, value) keys counting one row with the given attribute values."""
+    prefix, agent_attr, dimensions = ROLLUPS[model]
+    scopes = [GLOBAL_SCOPE]
+    if values[agent_attr]:
+        scopes.append(values[agent_attr])
+    keys = []
+    for scope in scopes:
+        keys.append((scope, prefix, ''))
+        keys.extend((scope, f'{prefix}.{name}', (values[name] or '')[:100]) for name in dimensions)
+    return keys
+
+
+def _values(obj, old):
+    """Current or pre-flush values of the tracked attributes of `obj`."""
+    _, agent_attr, dimensions = ROLLUPS[type(obj)]
+    state = db.inspect(obj)
+    values = {}
+    for name in (agent_attr,) + dimensions:
+        history = state.attrs[name].history
+        if old and history.deleted:
+            values[name] = history.deleted[0]
+        elif old and history.added:
+            values[name] = None # Was never set before this flush
+        else:
+            values[name] = getattr(obj, name)
+    return values
+
+
+def collect_deltas(session):
+    """Counter changes implied by the pending flush: {(agent_id, dimension, value): delta}."""
+    deltas = {}
+
+    def add(model, values, sign):
+        for key in _counter_keys(model, values):
+            deltas[key] = deltas.get(key, 0) + sign
+
+    for obj in session.new:
+        if type(obj) in ROLLUPS:
+            add(type(obj), _values(obj, old=False), 1)
+    for obj in session.deleted:
+        if type(obj) in ROLLUPS:
+            add(type(obj), _values(obj, old=True), -1)
+    for obj in session.dirty:
+        if type(obj) in ROLLUPS and session.is_modified(obj):
+            add(type(obj), _values(obj, old=True), -1)
+            add(type(obj), _values(obj, old=False), 1)
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def upsert_increment(connection, table, key_columns, rows):
+    """
+    Adds each row's non-key values to the stored row with the same key, inserting missing rows:
+    INSERT ... ON CONFLICT (key_columns) DO UPDATE SET column = column + excluded.column
+    (SQLite and PostgreSQL). `key_columns` must be covered by a unique constraint.
+    """
+    if not rows:
+        return
+    insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(table)
+    increments = [name for name in rows[0] if name not in key_columns]
+    statement = statement.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={name: table.c[name] + statement.excluded[name] for name in increments},
+    )
+    connection.execute(statement, rows)
+
+
+def apply_deltas(connection, deltas):
+    rows = [{'agent_id': agent_id, 'dimension': dimension, 'value': value, 'count': delta}
+            for (agent_id, dimension, value), delta in sorted(deltas.items())]
+    upsert_increment(connection, RollupCounter.__table__, ('agent_id', 'dimension', 'value'), rows)
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def _update_counters(session, flush_context):
+    # after_flush still sees the pre-flush new/dirty/deleted sets and attribute history; writing
+    # through the flush's connection keeps the counters in the same transaction as the rows
+    deltas = collect_deltas(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def _grouped_counts(model, columns, agent_column=None):
+    if agent_column is not None:
+        columns = [agent_column] + columns
+    query = db.session.query(*columns, db.func.count()).select_from(model)
+    if agent_column is not None:
+        query = query.filter(agent_column.isnot(None))
+    return query.group_by(*columns).all()
+
+
+def compute_counters():
+    """All counters recomputed with GROUP BY queries: {(agent_id, dimension, value): count}."""
+    counters = {}
+    for model, (prefix, agent_attr, dimensions) in ROLLUPS.items():
+        agent_column = getattr(model, agent_attr)
+        counters[(GLOBAL_SCOPE, prefix, '')] = db.session.query(db.func.count()).select_from(model).scalar()
+        for agent_id, count in _grouped_counts(model, [], agent_column):
+            counters[(agent_id, prefix, '')] = count
+        for name in dimensions:
+            column = getattr(model, name)
+            for value, count in _grouped_counts(model, [column]):
+                key = (GLOBAL_SCOPE, f'{prefix}.{name}', (value or '')[:100])
+                counters[key] = counters.get(key, 0) + count
+            for agent_id, value, count in _grouped_counts(model, [column], agent_column):
+                key = (agent_id, f'{prefix}.{name}', (value or '')[:100])
+                counters[key] = counters.get(key, 0) + count
+    return {key: count for key, count in counters.items() if count}
+
+
+def reconcile():
+    """
+    Rebuilds rollup_counters from the base tables (to repair drift from bulk SQL or writes that
+    bypassed the ORM). Returns the number of counters that had a different value.
+    """
+    expected = compute_counters()
+    stored = {(row.agent_id, row.dimension, row.value): row.count for row in RollupCounter.query}
+    drifted = {key for key in expected.keys() | stored.keys() if expected.get(key, 0) != stored.get(key, 0)}
+    if drifted:
+        for key in drifted:
+            logger.warning(f"Счетчик {key}: сохранено {stored.get(key, 0)}, фактически {expected.get(key, 0)}.")
+        db.session.execute(db.delete(RollupCounter))
+        if expected: # An empty parameter list would run one INSERT of defaults
+            db.session.execute(db.insert(RollupCounter), [
+                {'agent_id': agent_id, 'dimension': dimension, 'value': value, 'count': count}
+                for (agent_id, dimension, value), count in sorted(expected.items())])
+    db.session.commit()
+    return len(drifted)
+
+
+def counters_for(agent_ids):
+    """{agent_id: {dimension: {value: count}}} for the given scopes (one indexed query)."""
+    result = {agent_id: {} for agent_id in agent_ids}
+    rows = RollupCounter.query.filter(RollupCounter.agent_id.in_(agent_ids), RollupCounter.count != 0)
+    for row in rows:
+        result[row.agent_id].setdefault(row.dimension, {})[row.value] = row.count
+    return result
+
+
+def agent_totals():
+    """[(agent_id, {'properties': n, 'clients': n, 'deals': n})] for every agent with counted rows."""
+    totals = {}
+    rows = RollupCounter.query.filter(RollupCounter.agent_id != GLOBAL_SCOPE,
+                                      RollupCounter.dimension.in_([prefix for prefix, _, _ in ROLLUPS.values()]),
+                                      RollupCounter.count != 0)
+    for row in rows:
+        totals.setdefault(row.agent_id, {})[row.dimension] = row.count
+    return sorted(totals.items())
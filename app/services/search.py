@@ -0,0 +1,170 @@
+import logging
+import re
+
+from sqlalchemy import text, or_, func
+
+from app import db
+from app.models import Property, Client
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERY_TERMS = 8
+
+# SQLite: FTS5 external-content tables kept in sync by triggers. unicode61 folds case for
+# Cyrillic as well (lower() in SQLite only folds ASCII).
+SQLITE_FTS_TABLES = {
+    'properties': ('properties_fts', ('name', 'street', 'address', 'district', 'cat', 'status', 'description')),
+    'clients': ('clients_fts', ('name', 'email', 'phone', 'notes')),
+}
+# bm25 column weights, in the column order above
+SQLITE_FTS_WEIGHTS = {
+    'properties': (10.0, 4.0, 4.0, 3.0, 2.0, 1.0, 1.0),
+    'clients': (10.0, 5.0, 5.0, 1.0),
+}
+
+# PostgreSQL: stored generated tsvector columns with GIN indexes
+POSTGRES_SEARCH_VECTORS = {
+    'properties': (
+        "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce(street, '') || ' ' || coalesce(address, '') || ' ' || coalesce(district, '')), 'B') || "
+        "setweight(to_tsvector('russian', coalesce(cat, '') || ' ' || coalesce(status, '')), 'C') || "
+        "setweight(to_tsvector('russian', coalesce(description, '')), 'D')"
+    ),
+    'clients': (
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(email, '') || ' ' || coalesce(phone, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(notes, '')), 'D')"
+    ),
+}
+
+
+def sqlite_fts_ddl(table):
+    """CREATE statements (idempotent) for the FTS5 table of `table` and the triggers that keep it in sync."""
+    fts_table, columns = SQLITE_FTS_TABLES[table]
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5({column_list}, content='{table}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END",
+        # Only updates of the indexed columns touch the index; price/area/image edits skip it
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+def postgres_search_ddl(table):
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({POSTGRES_SEARCH_VECTORS[table]}) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)",
+    ]
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def search_index_available(table):
+    """True when the full-text objects for `table` exist (they are created by migrations or `flask search-reindex`)."""
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        fts_table = SQLITE_FTS_TABLES[table][0]
+        return db.session.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                  {'name': fts_table}).first() is not None
+    if dialect == 'postgresql':
+        return db.session.execute(text(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = 'search_vector'"
+        ), {'table': table}).first() is not None
+    return False
+
+
+def rebuild_search_index():
+    """Creates any missing full-text objects and re-indexes every row. Returns the dialect name."""
+    dialect = _dialect()
+    for table in SQLITE_FTS_TABLES:
+        if dialect == 'sqlite':
+            for statement in sqlite_fts_ddl(table):
+                db.session.execute(text(statement))
+            fts_table = SQLITE_FTS_TABLES[table][0]
+            db.session.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+        elif dialect == 'postgresql':
+            for statement in postgres_search_ddl(table):
+                db.session.execute(text(statement))
+            db.session.execute(text(f"REINDEX INDEX ix_{table}_search_vector"))
+        else:
+            raise NotImplementedError(f"Полнотекстовый поиск не поддерживается для {dialect}")
+    db.session.commit()
+    return dialect
+
+
+def query_terms(query):
+    """Word tokens of a user query, lower-cased; punctuation and FTS operators are dropped."""
+    return re.findall(r'\w+', query.lower())[:MAX_QUERY_TERMS]
+
+
+def _ranked_ids(table, terms, limit):
+    """Row ids matching every term (as a prefix), best match first."""
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        fts_table = SQLITE_FTS_TABLES[table][0]
+        weights = ', '.join(str(w) for w in SQLITE_FTS_WEIGHTS[table])
+        match = ' '.join(f'"{term}"*' for term in terms)
+        rows = db.session.execute(text(
+            f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH :match "
+            f"ORDER BY bm25({fts_table}, {weights}) LIMIT :limit"
+        ), {'match': match, 'limit': limit})
+    else:
+        config = 'russian' if table == 'properties' else 'simple'
+        ts_query = ' & '.join(f'{term}:*' for term in terms)
+        rows = db.session.execute(text(
+            f"SELECT id FROM {table} WHERE search_vector @@ to_tsquery('{config}', :query) "
+            f"ORDER BY ts_rank_cd(search_vector, to_tsquery('{config}', :query)) DESC, id DESC LIMIT :limit"
+        ), {'query': ts_query, 'limit': limit})
+    return [row[0] for row in rows]
+
+
+def _load_in_order(model, ids):
+    by_id = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))} if ids else {}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def _like_search(model, columns, query, limit):
+    """Pre-FTS behaviour, used when the full-text index has not been created on this database."""
+    pattern = f"%{query.lower()}%"
+    return model.query.filter(or_(*[func.lower(column).like(pattern) for column in columns])).limit(limit).all()
+
+
+def search_properties(query, limit=20):
+    terms = query_terms(query)
+    if not terms:
+        return []
+    if not search_index_available('properties'):
+        columns = [getattr(Property, name) for name in SQLITE_FTS_TABLES['properties'][1]]
+        return _like_search(Property, columns, query, limit)
+    return _load_in_order(Property, _ranked_ids('properties', terms, limit))
+
+
+def search_clients(query, limit=20):
+    terms = query_terms(query)
+    if not terms:
+        return []
+    if not search_index_available('clients'):
+        columns = [getattr(Client, name) for name in SQLITE_FTS_TABLES['clients'][1]]
+        return _like_search(Client, columns, query, limit)
+    results = _load_in_order(Client, _ranked_ids('clients', terms, limit))
+    # Phones are stored in varying formats ("+7 701 ...", "8701..."), so digit queries also match by substring
+    digits = re.sub(r'\D', '', query)
+    if len(digits) >= 5 and len(results) < limit:
+        seen = {client.id for client in results}
+        phone_pattern = f"%{digits[-10:]}%"
+        normalized_phone = func.replace(func.replace(func.replace(func.replace(Client.phone, ' ', ''), '-', ''), '(', ''), ')', '')
+        for client in Client.query.filter(normalized_phone.like(phone_pattern)).limit(limit):
+            if client.id not in seen and len(results) < limit:
+                results.append(client)
+    return results
@@ -0,0 +1,214 @@
+import itertools
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from flask import current_app
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+_SESSION_CHANGED = 'synced_index_changed'
+_SESSION_DELETED = 'synced_index_deleted'
+
+# Ids re-read per query when applying changed rows (IN lists stay under bind limits)
+ID_CHUNK_SIZE = 500
+
+# Generations are unique across rebuilt instances, so caches keyed by them never serve a replaced index
+_generations = itertools.count(1)
+
+
+class SyncedIndex:
+    """
+    Base of the in-process indexes over model rows (property filter columns, address trigrams,
+    autocomplete). Subclasses list their `models` and implement:
+      _select(model, ids=None, since=None) -> rows starting with (id, updated_at, ...)
+      _apply(model, rows) -> True when the index changed; rows may be a one-pass iterator
+      _remove(model, ids)
+      _size(model) -> number of rows of `model` held
+    Instances are filled by load() before they are published, then only changed by catch_up()
+    from the IndexSync thread; readers take self._lock.
+    """
+
+    models = ()
+    label = 'Индекс'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.generation = next(_generations)
+        self._watermarks = {model: None for model in self.models} # Max updated_at seen per model
+
+    def _watermarked(self, model, rows):
+        for row in rows:
+            updated_at = row[1]
+            if updated_at is not None and (self._watermarks[model] is None or updated_at > self._watermarks[model]):
+                self._watermarks[model] = updated_at
+            yield row
+
+    def describe(self):
+        return f"{sum(self._size(model) for model in self.models)} строк"
+
+    def needs_rebuild(self):
+        """Subclass hook: True when incremental updates have degraded the index enough to rebuild it."""
+        return False
+
+    def load(self):
+        started = time.perf_counter()
+        with self._lock:
+            for model in self.models:
+                self._apply(model, self._watermarked(model, self._select(model)))
+            self.generation = next(_generations)
+        logger.info(f"{self.label} загружен: {self.describe()} за {(time.perf_counter() - started) * 1000:.0f} мс.")
+
+    def catch_up(self, changed, deleted, overlap=None):
+        """
+        Applies committed changes: `deleted` and `changed` ({model: ids}, recorded by the session
+        listeners of this process) and, when `overlap` (timedelta) is given, rows any process changed
+        since the watermark minus `overlap`. updated_at is set at flush, not at commit, so a write
+        committed late is only seen through that margin. Database reads happen outside the lock.
+        Returns False when the row counts disagree with the database (rows deleted elsewhere).
+        """
+        reads = {}
+        for model in self.models:
+            rows = {}
+            ids = sorted(set(changed.get(model, ())) - set(deleted.get(model, ())))
+            for start in range(0, len(ids), ID_CHUNK_SIZE):
+                rows.update((row[0], row) for row in self._select(model, ids=ids[start:start + ID_CHUNK_SIZE]))
+            if overlap is not None and self._watermarks[model] is not None:
+                rows.update((row[0], row) for row in self._select(model, since=self._watermarks[model] - overlap))
+            reads[model] = [rows[row_id] for row_id in sorted(rows)]
+        updated = False
+        with self._lock:
+            for model in self.models:
+                if deleted.get(model):
+                    self._remove(model, deleted[model])
+                    updated = True
+                if reads[model]:
+                    updated |= bool(self._apply(model, self._watermarked(model, reads[model])))
+            if updated:
+                self.generation = next(_generations)
+        if overlap is None:
+            return True
+        return all(db.session.query(db.func.count(model.id)).scalar() == self._size(model) for model in self.models)
+
+
+_syncs = []
+
+
+class IndexSync:
+    """
+    Owns the published instance of one SyncedIndex and the daemon thread that builds and updates it,
+    so requests never load or refresh an index: they read `get()`, which is None until the first
+    build finishes. Commits of this process wake the thread to apply exactly the ids they touched;
+    every `interval_setting` seconds it also re-reads rows past the watermark (other processes) and
+    compares row counts. A full rebuild goes into a new instance that replaces the published one
+    when complete, so readers keep using the old index meanwhile.
+    """
+
+    def __init__(self, factory, interval_setting, default_interval):
+        self.factory = factory
+        self.interval_setting = interval_setting
+        self.default_interval = default_interval
+        self.current = None
+        self._active = False # Set once the first build starts; commits are recorded from then on
+        self._rebuild = False
+        self._changed = {}
+        self._deleted = {}
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        _syncs.append(self)
+
+    def get(self):
+        if self._thread is None:
+            self.start(current_app._get_current_object())
+        return self.current
+
+    def start(self, app):
+        with self._start_lock:
+            if self._thread is None:
+                self._active = True
+                self._thread = threading.Thread(target=self._run, args=(app,), daemon=True,
+                                                name=f"index-sync-{self.factory.__name__}")
+                self._thread.start()
+
+    def record(self, changed, deleted):
+        if not self._active:
+            return
+        relevant = False
+        with self._pending_lock:
+            for pending, ids_by_model in ((self._changed, changed), (self._deleted, deleted)):
+                for model, ids in ids_by_model.items():
+                    if model in self.factory.models:
+                        pending.setdefault(model, set()).update(ids)
+                        relevant = True
+        if relevant:
+            self._wake.set()
+
+    def sync(self, full=True):
+        """
+        One round in the calling thread (needs an app context): the first build, or the recorded
+        changes (plus, when `full`, the watermark re-read and count check), rebuilding on a mismatch.
+        """
+        self._active = True
+        with self._pending_lock:
+            changed, self._changed = self._changed, {}
+            deleted, self._deleted = self._deleted, {}
+        index = self.current
+        if index is not None and not self._rebuild:
+            overlap = timedelta(seconds=current_app.config.get('INDEX_SYNC_OVERLAP_SECONDS', 300)) if full else None
+            if index.catch_up(changed, deleted, overlap) and not index.needs_rebuild():
+                return index
+            logger.info(f"{index.label} расходится с БД, перестраивается.")
+        self._rebuild = True # Until a build succeeds: the changes taken above are only covered by one
+        fresh = self.factory()
+        fresh.load()
+        self.current = fresh
+        self._rebuild = False
+        return fresh
+
+    def _run(self, app):
+        interval = app.config.get(self.interval_setting, self.default_interval)
+        next_full = 0.0
+        while True:
+            full = time.monotonic() >= next_full
+            with app.app_context():
+                try:
+                    self.sync(full=full)
+                except Exception as e:
+                    self._rebuild = True # Changes taken by the failed round are only covered by a rebuild
+                    logger.error(f"Ошибка обновления индекса {self.factory.__name__}: {e}", exc_info=True)
+                finally:
+                    db.session.remove()
+            if full:
+                next_full = time.monotonic() + interval
+            self._wake.wait(max(next_full - time.monotonic(), 0))
+            self._wake.clear()
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def _collect_index_changes(session, flush_context):
+    # After the flush new rows have their ids; the new/dirty/deleted collections still hold this flush
+    models = tuple({model for sync in _syncs for model in sync.factory.models})
+    for key, objects in ((_SESSION_CHANGED, list(session.new) + list(session.dirty)), (_SESSION_DELETED, session.deleted)):
+        for obj in objects:
+            if isinstance(obj, models) and obj.id is not None:
+                session.info.setdefault(key, {}).setdefault(type(obj), set()).add(obj.id)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _record_committed_index_changes(session):
+    changed = session.info.pop(_SESSION_CHANGED, None) or {}
+    deleted = session.info.pop(_SESSION_DELETED, None) or {}
+    if changed or deleted:
+        for sync in _syncs:
+            sync.record(changed, deleted)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _discard_index_changes(session):
+    session.info.pop(_SESSION_CHANGED, None)
+    session.info.pop(_SESSION_DELETED, None)
@@ -0,0 +1,58 @@
+document.addEventListener('DOMContentLoaded', function () {
+    const filterForm = document.getElementById('property-filter-form');
+    if (!filterForm || !filterForm.dataset.facetsUrl) {
+        return;
+    }
+
+    const totalDisplay = document.getElementById('filter-facet-total');
+    const facetSelects = Array.from(filterForm.querySelectorAll('select'));
+    let debounceTimer = null;
+    let requestCounter = 0; // Only the newest response is applied
+
+    // Remember the plain option labels so counts can be re-rendered on every update
+    facetSelects.forEach(select => {
+        Array.from(select.options).forEach(option => {
+            option.dataset.label = option.textContent;
+        });
+    });
+
+    function applyCounts(data) {
+        facetSelects.forEach(select => {
+            const counts = (data.facets || {})[select.name];
+            if (!counts) return;
+            Array.from(select.options).forEach(option => {
+                if (!option.value) return; // "Любой ..." keeps its label
+                const count = counts[option.value] || 0;
+                option.textContent = `${option.dataset.label} (${count})`;
+                option.disabled = count === 0 && !option.selected;
+            });
+        });
+        if (totalDisplay) {
+            totalDisplay.textContent = `Найдется объектов: ${data.total}`;
+        }
+    }
+
+    function refreshCounts() {
+        const params = new URLSearchParams(new FormData(filterForm));
+        params.delete('submit');
+        const requestId = ++requestCounter;
+        fetch(`${filterForm.dataset.facetsUrl}?${params.toString()}`, { headers: { 'Accept': 'application/json' } })
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
+            .then(data => {
+                if (requestId === requestCounter) applyCounts(data);
+            })
+            .catch(e => console.error("Error loading facet counts:", e));
+    }
+
+    function scheduleRefresh() {
+        clearTimeout(debounceTimer);
+        debounceTimer = setTimeout(refreshCounts, 300);
+    }
+
+    filterForm.addEventListener('change', scheduleRefresh);
+    filterForm.addEventListener('input', scheduleRefresh);
+    refreshCounts();
+});
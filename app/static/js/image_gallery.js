@@ -24,8 +24,25 @@ document.addEventListener('DOMContentLoaded', function () {
 
         const imageUrlsData = thumbnail.dataset.imageUrls;
         const imageFilenamesData = thumbnail.dataset.imageFilenames;
+        const imageSrcsetsData = thumbnail.dataset.imageSrcsets;
+        const imagesEndpoint = thumbnail.dataset.imagesUrl; // List pages fetch image metadata lazily
         const initialIndex = parseInt(thumbnail.dataset.currentImageIndex || thumbnail.dataset.imageIndex || "0"); // imageIndex from detail, currentImageIndex from list
 
+        if (!imageUrlsData && imagesEndpoint) {
+            fetch(imagesEndpoint, { headers: { 'Accept': 'application/json' } })
+                .then(response => {
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.json();
+                })
+                .then(images => openGallery(images.map((image, index) => ({
+                    url: image.url,
+                    srcset: image.srcset,
+                    filename: image.filename || `Изображение ${index + 1}`
+                })), initialIndex))
+                .catch(e => console.error("Error loading property images:", e));
+            return;
+        }
+
         if (!imageUrlsData) {
             console.error("Thumbnail clicked, but data-image-urls attribute is missing or empty.");
             return;
@@ -34,29 +51,35 @@ document.addEventListener('DOMContentLoaded', function () {
         try {
             const urls = JSON.parse(imageUrlsData);
             const filenames = imageFilenamesData ? JSON.parse(imageFilenamesData) : [];
+            const srcsets = imageSrcsetsData ? JSON.parse(imageSrcsetsData) : [];
             
-            currentPropertyImages = urls.map((url, index) => ({
+            openGallery(urls.map((url, index) => ({
                 url: url,
+                srcset: srcsets[index],
                 filename: filenames[index] || `Изображение ${index + 1}`
-            }));
-            
-            currentImageIndex = initialIndex;
-            if (currentImageIndex >= currentPropertyImages.length) currentImageIndex = 0;
-
-            if (currentPropertyImages.length > 0) {
-                updateModalImage();
-                imageModal.show();
-            } else {
-                console.warn("No images found for this property in data attributes.");
-            }
+            })), initialIndex);
         } catch (e) {
             console.error("Error parsing image data from attributes:", e);
         }
     });
 
+    function openGallery(images, initialIndex) {
+        currentPropertyImages = images;
+        currentImageIndex = initialIndex;
+        if (currentImageIndex >= currentPropertyImages.length) currentImageIndex = 0;
+
+        if (currentPropertyImages.length > 0) {
+            updateModalImage();
+            imageModal.show();
+        } else {
+            console.warn("No images found for this property.");
+        }
+    }
+
     function updateModalImage() {
         if (currentPropertyImages.length === 0 || currentImageIndex < 0 || currentImageIndex >= currentPropertyImages.length) {
             // Optionally hide modal or show placeholder if images become unavailable
+            modalImageDisplay.srcset = "";
             modalImageDisplay.src = ""; 
             modalImageDisplay.alt = "Нет изображения";
             if (modalImageFilenameDisplay) modalImageFilenameDisplay.textContent = "";
@@ -64,6 +87,9 @@ document.addEventListener('DOMContentLoaded', function () {
             return;
         }
         const currentImage = currentPropertyImages[currentImageIndex];
+        // Let the browser pick a resized variant for the modal; the original stays as the fallback src
+        modalImageDisplay.srcset = currentImage.srcset || "";
+        modalImageDisplay.sizes = currentImage.srcset ? "90vw" : "";
         modalImageDisplay.src = currentImage.url;
         modalImageDisplay.alt = currentImage.filename;
         
@@ -0,0 +1,69 @@
+// Remote-search selects: a <select data-lookup-url="..."> gets a search box above it and its options
+// are fetched page by page from the lookup endpoint ({results: [{id, text}], more}) instead of
+// being rendered server-side. The currently selected option is always kept.
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('select[data-lookup-url]').forEach(function (select) {
+        const lookupUrl = select.dataset.lookupUrl;
+        const search = document.createElement('input');
+        search.type = 'search';
+        search.className = 'form-control form-control-sm mb-1';
+        search.placeholder = select.dataset.placeholder || 'Поиск...';
+        search.autocomplete = 'off';
+        select.parentNode.insertBefore(search, select);
+
+        const moreLink = document.createElement('button');
+        moreLink.type = 'button';
+        moreLink.className = 'btn btn-link btn-sm p-0 mt-1 d-none';
+        moreLink.textContent = 'Показать еще';
+        select.insertAdjacentElement('afterend', moreLink);
+
+        let debounceTimer = null;
+        let requestCounter = 0; // Only the newest response is rendered
+        let page = 1;
+
+        function selectedOption() {
+            return select.selectedIndex >= 0 && select.value ? select.options[select.selectedIndex] : null;
+        }
+
+        function load(append) {
+            const requestId = ++requestCounter;
+            const params = new URLSearchParams({ q: search.value.trim(), page: page });
+            fetch(`${lookupUrl}?${params}`, { headers: { 'Accept': 'application/json' } })
+                .then(response => response.json())
+                .then(data => {
+                    if (requestId !== requestCounter) return;
+                    const selected = selectedOption();
+                    if (!append) {
+                        select.innerHTML = '';
+                        if (selected) select.appendChild(selected);
+                        else select.appendChild(new Option('--- Выберите ---', ''));
+                    }
+                    const present = new Set(Array.from(select.options).map(option => option.value));
+                    data.results.forEach(item => {
+                        if (!present.has(String(item.id))) select.appendChild(new Option(item.text, item.id));
+                    });
+                    moreLink.classList.toggle('d-none', !data.more);
+                })
+                .catch(error => console.error('Lookup error:', error));
+        }
+
+        search.addEventListener('input', function () {
+            clearTimeout(debounceTimer);
+            debounceTimer = setTimeout(() => { page = 1; load(false); }, 250);
+        });
+        moreLink.addEventListener('click', function () {
+            page += 1;
+            load(true);
+        });
+        select.addEventListener('focus', function () {
+            if (select.options.length <= 1 && !select.dataset.loaded) {
+                select.dataset.loaded = '1';
+                load(false);
+            }
+        });
+        if (!selectedOption()) {
+            select.dataset.loaded = '1';
+            load(false);
+        }
+    });
+});
@@ -0,0 +1,101 @@
+document.addEventListener('DOMContentLoaded', function () {
+    const searchForm = document.getElementById('global-search-form');
+    if (!searchForm || !searchForm.dataset.autocompleteUrl) {
+        return;
+    }
+    const input = searchForm.querySelector('input[name="query"]');
+    if (!input) {
+        return;
+    }
+
+    const kindLabels = { property: 'Объект', street: 'Улица', district: 'Район', client: 'Клиент' };
+    const menu = document.createElement('div');
+    menu.className = 'dropdown-menu shadow-sm';
+    menu.style.top = '100%';
+    menu.style.left = '0';
+    menu.style.minWidth = '100%';
+    menu.setAttribute('role', 'listbox');
+    searchForm.appendChild(menu);
+
+    let debounceTimer = null;
+    let requestCounter = 0; // Only the newest response is rendered
+    let activeIndex = -1;
+
+    function hideMenu() {
+        menu.classList.remove('show');
+        activeIndex = -1;
+    }
+
+    function setActive(index) {
+        const items = menu.querySelectorAll('.dropdown-item');
+        items.forEach((item, i) => item.classList.toggle('active', i === index));
+        activeIndex = index;
+    }
+
+    function render(suggestions) {
+        menu.innerHTML = '';
+        if (!suggestions.length) {
+            hideMenu();
+            return;
+        }
+        suggestions.forEach(suggestion => {
+            const item = document.createElement('a');
+            item.className = 'dropdown-item d-flex justify-content-between gap-3 small';
+            item.href = suggestion.url;
+            item.setAttribute('role', 'option');
+            const label = document.createElement('span');
+            label.textContent = suggestion.label;
+            const kind = document.createElement('span');
+            kind.className = 'text-muted';
+            kind.textContent = kindLabels[suggestion.kind] || '';
+            item.append(label, kind);
+            menu.appendChild(item);
+        });
+        activeIndex = -1;
+        menu.classList.add('show');
+    }
+
+    function fetchSuggestions() {
+        const prefix = input.value.trim();
+        if (prefix.length < 2) {
+            hideMenu();
+            return;
+        }
+        const requestId = ++requestCounter;
+        fetch(`${searchForm.dataset.autocompleteUrl}?q=${encodeURIComponent(prefix)}`, { headers: { 'Accept': 'application/json' } })
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
+            .then(data => {
+                if (requestId === requestCounter) render(data.suggestions || []);
+            })
+            .catch(e => console.error("Error loading search suggestions:", e));
+    }
+
+    input.addEventListener('input', function () {
+        clearTimeout(debounceTimer);
+        debounceTimer = setTimeout(fetchSuggestions, 120);
+    });
+
+    input.addEventListener('keydown', function (event) {
+        const items = menu.querySelectorAll('.dropdown-item');
+        if (!menu.classList.contains('show') || !items.length) return;
+        if (event.key === 'ArrowDown') {
+            event.preventDefault();
+            setActive((activeIndex + 1) % items.length);
+        } else if (event.key === 'ArrowUp') {
+            event.preventDefault();
+            setActive((activeIndex - 1 + items.length) % items.length);
+        } else if (event.key === 'Enter' && activeIndex >= 0) {
+            event.preventDefault();
+            window.location.href = items[activeIndex].href;
+        } else if (event.key === 'Escape') {
+            hideMenu();
+        }
+    });
+
+    document.addEventListener('click', function (event) {
+        if (!searchForm.contains(event.target)) hideMenu();
+    });
+});
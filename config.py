@@ -15,3 +15,70 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     # For Flask-WTF CSRF protection
     WTF_CSRF_SECRET_KEY = os.environ.get('WTF_CSRF_SECRET_KEY') or 'a-csrf-secret-key'
+    # Number of rows per page on the property list (keyset pagination)
+    PROPERTIES_PER_PAGE = int(os.environ.get('PROPERTIES_PER_PAGE') or 50)
+    # Cards per Kanban column on first load and per "load more" request
+    KANBAN_COLUMN_LIMIT = int(os.environ.get('KANBAN_COLUMN_LIMIT') or 20)
+    # Where new property photos are written: 'database' (inline blob in property_images.image_data)
+    # or 'filesystem' (content-addressed store under IMAGE_STORAGE_PATH, deduplicated)
+    IMAGE_STORAGE_BACKEND = os.environ.get('IMAGE_STORAGE_BACKEND') or 'database'
+    IMAGE_STORAGE_PATH = os.environ.get('IMAGE_STORAGE_PATH') or os.path.join(basedir, 'instance', 'image_store')
+    # Seconds the filter page's drop-down choices may be served from cache (commits invalidate it sooner)
+    FACET_CACHE_TTL = int(os.environ.get('FACET_CACHE_TTL') or 300)
+    # How many distinct filter states keep their facet option counts cached (LRU)
+    FACET_COUNTS_CACHE_SIZE = int(os.environ.get('FACET_COUNTS_CACHE_SIZE') or 256)
+    # Serve the filter page from an in-process NumPy copy of the filterable columns instead of SQL.
+    # A background thread builds it and applies this process's commits as they happen; every
+    # PROPERTY_INDEX_REFRESH_SECONDS it also picks up other processes' writes by updated_at
+    PROPERTY_INDEX_ENABLED = os.environ.get('PROPERTY_INDEX_ENABLED', '').lower() in ('1', 'true', 'yes')
+    PROPERTY_INDEX_REFRESH_SECONDS = float(os.environ.get('PROPERTY_INDEX_REFRESH_SECONDS') or 5)
+    # In-process indexes re-read rows whose updated_at is up to this many seconds older than the newest
+    # seen: updated_at is set at flush, so another process's long transaction commits "in the past"
+    INDEX_SYNC_OVERLAP_SECONDS = float(os.environ.get('INDEX_SYNC_OVERLAP_SECONDS') or 300)
+    # Trigram address lookup (global search, filter page "address" field): time budget per lookup,
+    # minimum similarity (0..1) and how many best-matching properties the filter page narrows to
+    # (they are sent to SQL as an IN list). The index is built and updated by a background thread;
+    # other processes' writes are picked up every ADDRESS_INDEX_REFRESH_SECONDS
+    ADDRESS_SEARCH_BUDGET_MS = float(os.environ.get('ADDRESS_SEARCH_BUDGET_MS') or 50)
+    ADDRESS_SEARCH_MIN_SIMILARITY = float(os.environ.get('ADDRESS_SEARCH_MIN_SIMILARITY') or 0.6)
+    ADDRESS_FILTER_MAX_MATCHES = int(os.environ.get('ADDRESS_FILTER_MAX_MATCHES') or 500)
+    ADDRESS_INDEX_REFRESH_SECONDS = float(os.environ.get('ADDRESS_INDEX_REFRESH_SECONDS') or 30)
+    # Navbar search typeahead: in-process prefix index (built and updated by a background thread; other
+    # processes' writes are picked up every AUTOCOMPLETE_REFRESH_SECONDS) and LRU size for hot prefixes
+    AUTOCOMPLETE_REFRESH_SECONDS = float(os.environ.get('AUTOCOMPLETE_REFRESH_SECONDS') or 10)
+    AUTOCOMPLETE_CACHE_SIZE = int(os.environ.get('AUTOCOMPLETE_CACHE_SIZE') or 512)
+    # Scored ("ranking") matching mode: how many listings to show and how far (relative) outside a
+    # client's price/area/floor/year ranges a listing may be and still be ranked
+    MATCH_SCORE_TOP_N = int(os.environ.get('MATCH_SCORE_TOP_N') or 50)
+    MATCH_SCORE_TOLERANCE = float(os.environ.get('MATCH_SCORE_TOLERANCE') or 0.25)
+    # Candidate rows scored per request at most (those closest to the client's ranges are kept)
+    MATCH_SCORE_MAX_CANDIDATES = int(os.environ.get('MATCH_SCORE_MAX_CANDIDATES') or 2000)
+    # Photos are normalized on ingest (scrapers, forms, Excel import): longest side capped,
+    # re-encoded to IMAGE_OUTPUT_FORMAT (WEBP or JPEG) and stripped of metadata on a worker pool
+    IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION') or 1920)
+    IMAGE_OUTPUT_FORMAT = (os.environ.get('IMAGE_OUTPUT_FORMAT') or 'WEBP').upper()
+    IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY') or 82)
+    IMAGE_PROCESSING_WORKERS = int(os.environ.get('IMAGE_PROCESSING_WORKERS') or min(4, os.cpu_count() or 1))
+    # Seconds a form or Excel import request may wait in total for its photos' processing; photos not done
+    # by then are saved as originals and replaced by the processed copy right after the commit
+    IMAGE_NORMALIZE_WAIT_SECONDS = float(os.environ.get('IMAGE_NORMALIZE_WAIT_SECONDS') or 3)
+    # Resized variants served by /property_image/<id>?w=...: allowed widths, encoding and disk cache cap (LRU-evicted)
+    IMAGE_VARIANT_WIDTHS = tuple(int(w) for w in (os.environ.get('IMAGE_VARIANT_WIDTHS') or '80,160,320,640,1280').split(','))
+    IMAGE_VARIANT_FORMAT = (os.environ.get('IMAGE_VARIANT_FORMAT') or 'WEBP').upper()
+    IMAGE_VARIANT_QUALITY = int(os.environ.get('IMAGE_VARIANT_QUALITY') or 80)
+    IMAGE_VARIANT_CACHE_PATH = os.environ.get('IMAGE_VARIANT_CACHE_PATH') or os.path.join(basedir, 'instance', 'image_variants')
+    IMAGE_VARIANT_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_VARIANT_CACHE_MAX_BYTES') or 512 * 1024 * 1024)
+    # OLX/Krisha scrapers: ad pages fetched in parallel by this many threads, each host paced to
+    # SCRAPER_REQUESTS_PER_SECOND by a token bucket shared by all running scrapes
+    SCRAPER_MAX_WORKERS = int(os.environ.get('SCRAPER_MAX_WORKERS') or 4)
+    SCRAPER_REQUESTS_PER_SECOND = float(os.environ.get('SCRAPER_REQUESTS_PER_SECOND') or 1.0)
+    # Shared outgoing HTTP client (scrapers, photo URLs): pooled keep-alive connections, at most
+    # HTTP_MAX_CONNECTIONS_PER_HOST requests in flight per host, and up to HTTP_MAX_RETRIES retries
+    # on connection errors, 429 and 5xx with jittered exponential backoff (Retry-After is honoured)
+    HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS') or 20)
+    HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('HTTP_MAX_CONNECTIONS_PER_HOST') or 4)
+    HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES') or 3)
+    HTTP_BACKOFF_BASE_SECONDS = float(os.environ.get('HTTP_BACKOFF_BASE_SECONDS') or 0.5)
+    HTTP_BACKOFF_MAX_SECONDS = float(os.environ.get('HTTP_BACKOFF_MAX_SECONDS') or 30)
+    # Let the front web server (nginx X-Accel-Redirect / Apache mod_xsendfile) stream image files
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
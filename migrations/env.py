@@ -1,4 +1,5 @@
 import logging
+import re
 from logging.config import fileConfig
 
 from flask import current_app
@@ -51,6 +52,20 @@ def get_metadata():
     return target_db.metadata
 
 
+# Full-text search objects are created with raw SQL (c5e81a3f7d20) and are not in the models:
+# SQLite FTS5 tables with their shadow tables, PostgreSQL search_vector columns and GIN indexes.
+# Without this filter autogenerate would emit migrations that drop the search index.
+SEARCH_INDEX_TABLE = re.compile(r'_fts(_data|_idx|_docsize|_config|_content)?$')
+
+
+def include_name(name, type_, parent_names):
+    if type_ == 'table':
+        return not SEARCH_INDEX_TABLE.search(name)
+    if type_ in ('column', 'index'):
+        return not name.endswith('search_vector')
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +80,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_name=include_name
     )
 
     with context.begin_transaction():
@@ -93,6 +109,7 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_name", include_name)
 
     connectable = get_engine()
 
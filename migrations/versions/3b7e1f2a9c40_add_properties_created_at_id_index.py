@@ -0,0 +1,26 @@
+"""Add (created_at, id) index on properties for keyset pagination
+
+Revision ID: 3b7e1f2a9c40
+Revises: c2e2ac311c69
+Create Date: 2025-06-02 10:14:37.512908
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e1f2a9c40'
+down_revision = 'c2e2ac311c69'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        batch_op.create_index('ix_properties_created_at_id', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        batch_op.drop_index('ix_properties_created_at_id')
@@ -0,0 +1,35 @@
+"""Add denormalized cover_image_id and image_count to properties
+
+Revision ID: 8d41c6e0b2f7
+Revises: 3b7e1f2a9c40
+Create Date: 2025-06-03 09:27:51.204113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41c6e0b2f7'
+down_revision = '3b7e1f2a9c40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cover_image_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('image_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from existing images (correlated subqueries work on both SQLite and PostgreSQL)
+    op.execute("""
+        UPDATE properties SET
+            cover_image_id = (SELECT MIN(pi.id) FROM property_images pi WHERE pi.property_id = properties.id),
+            image_count = (SELECT COUNT(pi.id) FROM property_images pi WHERE pi.property_id = properties.id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        batch_op.drop_column('image_count')
+        batch_op.drop_column('cover_image_id')
@@ -0,0 +1,51 @@
+"""Add rollup_counters for the dashboard
+
+Revision ID: a1d7e5c30f48
+Revises: f4c8a2e61b93
+Create Date: 2025-06-13 09:51:26.447130
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1d7e5c30f48'
+down_revision = 'f4c8a2e61b93'
+branch_labels = None
+depends_on = None
+
+# (table, dimension prefix, agent column, broken-down columns) as of this revision
+ROLLUPS = (
+    ('properties', 'properties', 'added_by_user_id', ('source', 'status', 'district')),
+    ('clients', 'clients', 'added_by_user_id', ()),
+    ('deals', 'deals', 'agent_id', ('stage',)),
+)
+
+
+def upgrade():
+    op.create_table('rollup_counters',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('agent_id', sa.Integer(), nullable=False),
+    sa.Column('dimension', sa.String(length=40), nullable=False),
+    sa.Column('value', sa.String(length=100), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('agent_id', 'dimension', 'value', name='uq_rollup_counters_agent_dimension_value')
+    )
+
+    # Backfill: the global scope (agent_id 0) and one scope per agent, for totals and each breakdown
+    for table, prefix, agent_column, columns in ROLLUPS:
+        for scope, where in (('0', ''), (agent_column, f' WHERE {agent_column} IS NOT NULL')):
+            group_by = f' GROUP BY {agent_column}' if scope != '0' else ''
+            op.execute(f"INSERT INTO rollup_counters (agent_id, dimension, value, count) "
+                       f"SELECT {scope}, '{prefix}', '', COUNT(*) FROM {table}{where}{group_by}")
+            for column in columns:
+                group_by = f' GROUP BY {agent_column}, COALESCE({column}, \'\')' if scope != '0' else f' GROUP BY COALESCE({column}, \'\')'
+                op.execute(f"INSERT INTO rollup_counters (agent_id, dimension, value, count) "
+                           f"SELECT {scope}, '{prefix}.{column}', COALESCE({column}, ''), COUNT(*) FROM {table}{where}{group_by}")
+    op.execute("DELETE FROM rollup_counters WHERE count = 0")
+
+
+def downgrade():
+    op.drop_table('rollup_counters')
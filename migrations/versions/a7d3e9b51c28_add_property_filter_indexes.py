@@ -0,0 +1,39 @@
+"""Add composite indexes on properties for the filter page and client matching
+
+Revision ID: a7d3e9b51c28
+Revises: f1c27a84d5e9
+Create Date: 2025-06-06 11:42:09.318274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e9b51c28'
+down_revision = 'f1c27a84d5e9'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ix_properties_district_price', ['district', 'price']),
+    ('ix_properties_status_created_at', ['status', 'created_at']),
+    ('ix_properties_cat_price', ['cat', 'price']),
+    ('ix_properties_condition_layout', ['condition', 'layout']),
+    ('ix_properties_price_id', ['price', 'id']),
+    ('ix_properties_area', ['area']),
+    ('ix_properties_floor_total_floors', ['floor', 'total_floors']),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        for name, columns in INDEXES:
+            batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        for name, _ in reversed(INDEXES):
+            batch_op.drop_index(name)
@@ -0,0 +1,64 @@
+"""Add deal stage transition log and pipeline aggregates
+
+Revision ID: b6e2f9a4c715
+Revises: a1d7e5c30f48
+Create Date: 2025-06-14 12:06:53.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2f9a4c715'
+down_revision = 'a1d7e5c30f48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('deal_stage_transitions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('deal_id', sa.Integer(), nullable=True),
+    sa.Column('agent_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('from_stage', sa.String(length=50), nullable=True),
+    sa.Column('to_stage', sa.String(length=50), nullable=False),
+    sa.Column('transitioned_at', sa.DateTime(), nullable=False),
+    sa.Column('seconds_in_stage', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['deal_id'], ['deals.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('deal_stage_transitions', schema=None) as batch_op:
+        batch_op.create_index('ix_deal_stage_transitions_deal_id_transitioned_at', ['deal_id', 'transitioned_at'], unique=False)
+
+    op.create_table('deal_stage_monthly',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.String(length=7), nullable=False),
+    sa.Column('agent_id', sa.Integer(), nullable=False),
+    sa.Column('stage', sa.String(length=50), nullable=False),
+    sa.Column('entered', sa.Integer(), nullable=False),
+    sa.Column('exited', sa.Integer(), nullable=False),
+    sa.Column('seconds_total', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('month', 'agent_id', 'stage', name='uq_deal_stage_monthly_month_agent_stage')
+    )
+    op.create_table('deal_stage_durations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('agent_id', sa.Integer(), nullable=False),
+    sa.Column('stage', sa.String(length=50), nullable=False),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('agent_id', 'stage', 'bucket', name='uq_deal_stage_durations_agent_stage_bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('deal_stage_durations')
+    op.drop_table('deal_stage_monthly')
+    with op.batch_alter_table('deal_stage_transitions', schema=None) as batch_op:
+        batch_op.drop_index('ix_deal_stage_transitions_deal_id_transitioned_at')
+
+    op.drop_table('deal_stage_transitions')
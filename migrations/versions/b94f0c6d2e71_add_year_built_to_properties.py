@@ -0,0 +1,30 @@
+"""Add integer year_built column to properties
+
+Revision ID: b94f0c6d2e71
+Revises: a7d3e9b51c28
+Create Date: 2025-06-07 09:26:51.770413
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b94f0c6d2e71'
+down_revision = 'a7d3e9b51c28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Nullable with no default, so adding it does not rewrite the table; existing rows are
+    # filled in batches afterwards with `flask backfill-year-built`
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('year_built', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_properties_year_built'), ['year_built'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_properties_year_built'))
+        batch_op.drop_column('year_built')
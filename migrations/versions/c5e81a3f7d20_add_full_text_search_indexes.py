@@ -0,0 +1,78 @@
+"""Add full-text search indexes for properties and clients (FTS5 on SQLite, tsvector on PostgreSQL)
+
+Revision ID: c5e81a3f7d20
+Revises: b94f0c6d2e71
+Create Date: 2025-06-08 15:03:44.905126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e81a3f7d20'
+down_revision = 'b94f0c6d2e71'
+branch_labels = None
+depends_on = None
+
+
+# Keep in sync with app/services/search.py (flask search-reindex recreates missing objects from there)
+SQLITE_FTS_TABLES = {
+    'properties': ('properties_fts', ('name', 'street', 'address', 'district', 'cat', 'status', 'description')),
+    'clients': ('clients_fts', ('name', 'email', 'phone', 'notes')),
+}
+
+POSTGRES_SEARCH_VECTORS = {
+    'properties': (
+        "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce(street, '') || ' ' || coalesce(address, '') || ' ' || coalesce(district, '')), 'B') || "
+        "setweight(to_tsvector('russian', coalesce(cat, '') || ' ' || coalesce(status, '')), 'C') || "
+        "setweight(to_tsvector('russian', coalesce(description, '')), 'D')"
+    ),
+    'clients': (
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(email, '') || ' ' || coalesce(phone, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(notes, '')), 'D')"
+    ),
+}
+
+
+def _sqlite_upgrade(table):
+    fts_table, columns = SQLITE_FTS_TABLES[table]
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    op.execute(f"CREATE VIRTUAL TABLE {fts_table} USING fts5({column_list}, content='{table}', "
+               f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+    op.execute(f"CREATE TRIGGER {fts_table}_ai AFTER INSERT ON {table} BEGIN "
+               f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END")
+    op.execute(f"CREATE TRIGGER {fts_table}_ad AFTER DELETE ON {table} BEGIN "
+               f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END")
+    op.execute(f"CREATE TRIGGER {fts_table}_au AFTER UPDATE OF {column_list} ON {table} BEGIN "
+               f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+               f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END")
+    op.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')") # Index existing rows
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table in ('properties', 'clients'):
+        if dialect == 'sqlite':
+            _sqlite_upgrade(table)
+        elif dialect == 'postgresql':
+            op.execute(f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+                       f"GENERATED ALWAYS AS ({POSTGRES_SEARCH_VECTORS[table]}) STORED")
+            op.execute(f"CREATE INDEX ix_{table}_search_vector ON {table} USING GIN (search_vector)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in ('clients', 'properties'):
+        if dialect == 'sqlite':
+            fts_table = SQLITE_FTS_TABLES[table][0]
+            for suffix in ('au', 'ad', 'ai'):
+                op.execute(f"DROP TRIGGER IF EXISTS {fts_table}_{suffix}")
+            op.execute(f"DROP TABLE IF EXISTS {fts_table}")
+        elif dialect == 'postgresql':
+            op.execute(f"DROP INDEX IF EXISTS ix_{table}_search_vector")
+            op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,26 @@
+"""Add normalize_pending flag to property_images
+
+Revision ID: c81f4d2a6e95
+Revises: b6e2f9a4c715
+Create Date: 2025-06-16 10:42:17.508113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f4d2a6e95'
+down_revision = 'b6e2f9a4c715'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('property_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('normalize_pending', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table('property_images', schema=None) as batch_op:
+        batch_op.drop_column('normalize_pending')
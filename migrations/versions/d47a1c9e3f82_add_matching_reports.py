@@ -0,0 +1,40 @@
+"""Add matching_reports table for the persisted bulk matching report
+
+Revision ID: d47a1c9e3f82
+Revises: c81f4d2a6e95
+Create Date: 2025-06-17 09:15:42.731904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd47a1c9e3f82'
+down_revision = 'c81f4d2a6e95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('matching_reports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('generated_at', sa.DateTime(), nullable=False),
+    sa.Column('top_n', sa.Integer(), nullable=False),
+    sa.Column('property_count', sa.Integer(), nullable=False),
+    sa.Column('client_count', sa.Integer(), nullable=False),
+    sa.Column('skipped_clients', sa.Integer(), nullable=False),
+    sa.Column('load_ms', sa.Float(), nullable=False),
+    sa.Column('total_ms', sa.Float(), nullable=False),
+    sa.Column('rows', sa.JSON(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('matching_reports', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_matching_reports_generated_at'), ['generated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('matching_reports', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_matching_reports_generated_at'))
+
+    op.drop_table('matching_reports')
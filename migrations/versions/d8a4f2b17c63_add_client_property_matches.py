@@ -0,0 +1,44 @@
+"""Add client_property_matches for new-listing alerts
+
+Revision ID: d8a4f2b17c63
+Revises: c5e81a3f7d20
+Create Date: 2025-06-09 11:04:37.218945
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a4f2b17c63'
+down_revision = 'c5e81a3f7d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('client_property_matches',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('property_id', sa.Integer(), nullable=False),
+    sa.Column('source', sa.String(length=50), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('seen_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('client_id', 'property_id', name='uq_client_property_matches_client_property')
+    )
+    with op.batch_alter_table('client_property_matches', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_client_property_matches_client_id'), ['client_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_client_property_matches_property_id'), ['property_id'], unique=False)
+        batch_op.create_index('ix_client_property_matches_seen_at_created_at', ['seen_at', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('client_property_matches', schema=None) as batch_op:
+        batch_op.drop_index('ix_client_property_matches_seen_at_created_at')
+        batch_op.drop_index(batch_op.f('ix_client_property_matches_property_id'))
+        batch_op.drop_index(batch_op.f('ix_client_property_matches_client_id'))
+
+    op.drop_table('client_property_matches')
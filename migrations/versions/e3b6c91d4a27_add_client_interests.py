@@ -0,0 +1,120 @@
+"""Add client_interests and client_interest_terms (structured Client.interests)
+
+Revision ID: e3b6c91d4a27
+Revises: d8a4f2b17c63
+Create Date: 2025-06-11 15:42:09.630518
+
+"""
+import json
+import math
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b6c91d4a27'
+down_revision = 'd8a4f2b17c63'
+branch_labels = None
+depends_on = None
+
+# Frozen copy of the interests parsing at this revision (app code may change later)
+RANGES = (
+    ('min_price', 'max_price'),
+    ('min_area', 'max_area'),
+    ('min_floor', 'max_floor'),
+    ('year_built_from', 'year_built_to'),
+)
+INTEGER_KEYS = {'min_floor': math.floor, 'max_floor': math.ceil}
+TERMS = (('districts', 'district'), ('condition', 'condition'), ('layout', 'layout'))
+YEAR_PATTERN = re.compile(r'(?<!\d)(1[89]\d\d|20\d\d)(?!\d)') # Same as app.models.YEAR_PATTERN
+
+
+def _bound(key, value):
+    if value is None or value == '':
+        return None
+    if key.startswith('year_built'):
+        match = YEAR_PATTERN.search(str(value))
+        return int(match.group(1)) if match else None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number):
+        return None
+    rounding = INTEGER_KEYS.get(key)
+    return rounding(number) if rounding else number
+
+
+def upgrade():
+    client_interests = op.create_table('client_interests',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('min_price', sa.Float(), nullable=True),
+    sa.Column('max_price', sa.Float(), nullable=True),
+    sa.Column('min_area', sa.Float(), nullable=True),
+    sa.Column('max_area', sa.Float(), nullable=True),
+    sa.Column('min_floor', sa.Integer(), nullable=True),
+    sa.Column('max_floor', sa.Integer(), nullable=True),
+    sa.Column('year_built_from', sa.Integer(), nullable=True),
+    sa.Column('year_built_to', sa.Integer(), nullable=True),
+    sa.Column('any_district', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('client_id')
+    )
+    with op.batch_alter_table('client_interests', schema=None) as batch_op:
+        batch_op.create_index('ix_client_interests_price', ['min_price', 'max_price'], unique=False)
+        batch_op.create_index('ix_client_interests_area', ['min_area', 'max_area'], unique=False)
+        batch_op.create_index(batch_op.f('ix_client_interests_any_district'), ['any_district'], unique=False)
+
+    client_interest_terms = op.create_table('client_interest_terms',
+    sa.Column('client_interest_id', sa.Integer(), nullable=False),
+    sa.Column('field', sa.String(length=20), nullable=False),
+    sa.Column('value', sa.String(length=100), nullable=False),
+    sa.ForeignKeyConstraint(['client_interest_id'], ['client_interests.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('client_interest_id', 'field', 'value')
+    )
+    with op.batch_alter_table('client_interest_terms', schema=None) as batch_op:
+        batch_op.create_index('ix_client_interest_terms_field_value', ['field', 'value'], unique=False)
+
+    # Backfill from the existing JSON
+    bind = op.get_bind()
+    now = sa.func.now()
+    for client_id, interests in bind.execute(sa.text("SELECT id, interests FROM clients WHERE interests IS NOT NULL")).fetchall():
+        if isinstance(interests, str):
+            try:
+                interests = json.loads(interests)
+            except ValueError:
+                continue
+        if not isinstance(interests, dict):
+            continue
+        bounds = {key: _bound(key, interests.get(key)) for pair in RANGES for key in pair}
+        terms = set()
+        for key, field in TERMS:
+            value = interests.get(key)
+            values = value if isinstance(value, (list, tuple)) else [value]
+            terms.update((field, v.strip()[:100]) for v in values if isinstance(v, str) and v.strip())
+        if all(v is None for v in bounds.values()) and not terms:
+            continue
+        any_district = not any(field == 'district' for field, _ in terms)
+        interest_id = bind.execute(client_interests.insert().values(
+            client_id=client_id, any_district=any_district, updated_at=now, **bounds)).inserted_primary_key[0]
+        if terms:
+            bind.execute(client_interest_terms.insert(),
+                         [{'client_interest_id': interest_id, 'field': field, 'value': value} for field, value in sorted(terms)])
+
+
+def downgrade():
+    with op.batch_alter_table('client_interest_terms', schema=None) as batch_op:
+        batch_op.drop_index('ix_client_interest_terms_field_value')
+
+    op.drop_table('client_interest_terms')
+    with op.batch_alter_table('client_interests', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_client_interests_any_district'))
+        batch_op.drop_index('ix_client_interests_price')
+        batch_op.drop_index('ix_client_interests_area')
+
+    op.drop_table('client_interests')
@@ -0,0 +1,55 @@
+"""Add content_hash and byte_size to property_images for ETag/Range support
+
+Revision ID: e5a90c7d13b6
+Revises: 8d41c6e0b2f7
+Create Date: 2025-06-04 11:02:16.873540
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a90c7d13b6'
+down_revision = '8d41c6e0b2f7'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 200
+
+
+def upgrade():
+    with op.batch_alter_table('property_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('byte_size', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_property_images_content_hash'), ['content_hash'], unique=False)
+
+    # Hash existing blobs in id-ordered batches so only one batch of images is in memory at a time
+    bind = op.get_bind()
+    images = sa.table('property_images',
+                      sa.column('id', sa.Integer), sa.column('image_data', sa.LargeBinary),
+                      sa.column('content_hash', sa.String), sa.column('byte_size', sa.Integer))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(images.c.id, images.c.image_data)
+            .where(images.c.id > last_id).order_by(images.c.id).limit(BACKFILL_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        for image_id, image_data in rows:
+            data = bytes(image_data or b'')
+            bind.execute(
+                images.update().where(images.c.id == image_id)
+                .values(content_hash=hashlib.sha256(data).hexdigest(), byte_size=len(data))
+            )
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    with op.batch_alter_table('property_images', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_property_images_content_hash'))
+        batch_op.drop_column('byte_size')
+        batch_op.drop_column('content_hash')
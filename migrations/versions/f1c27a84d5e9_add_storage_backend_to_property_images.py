@@ -0,0 +1,33 @@
+"""Add storage column to property_images, allow image_data to be NULL for file-stored images
+
+Revision ID: f1c27a84d5e9
+Revises: e5a90c7d13b6
+Create Date: 2025-06-05 14:41:09.337615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c27a84d5e9'
+down_revision = 'e5a90c7d13b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('property_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('storage', sa.String(length=16), nullable=False, server_default='database'))
+        batch_op.alter_column('image_data',
+               existing_type=sa.LargeBinary(),
+               nullable=True)
+
+
+def downgrade():
+    # Images moved to the file store must be copied back into image_data before downgrading
+    with op.batch_alter_table('property_images', schema=None) as batch_op:
+        batch_op.alter_column('image_data',
+               existing_type=sa.LargeBinary(),
+               nullable=False)
+        batch_op.drop_column('storage')
@@ -0,0 +1,36 @@
+"""Add indexes on deals for the Kanban board and foreign keys
+
+Revision ID: f4c8a2e61b93
+Revises: e3b6c91d4a27
+Create Date: 2025-06-12 10:18:44.902716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c8a2e61b93'
+down_revision = 'e3b6c91d4a27'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ix_deals_stage_updated_at_id', ['stage', 'updated_at', 'id']),
+    ('ix_deals_client_id', ['client_id']),
+    ('ix_deals_property_id', ['property_id']),
+    ('ix_deals_agent_id', ['agent_id']),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('deals', schema=None) as batch_op:
+        for name, columns in INDEXES:
+            batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('deals', schema=None) as batch_op:
+        for name, _ in reversed(INDEXES):
+            batch_op.drop_index(name)
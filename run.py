@@ -1,6 +1,16 @@
 from app import app, db
-from app.models import User, Role
+from app.models import User, Role, Property, PropertyImage, Client, ClientInterest, parse_year
+from app.services.image_storage import get_storage, content_hash_for, STORAGE_DATABASE, STORAGE_FILESYSTEM
+from app.services.image_processing import apply_normalized, normalize_image, normalization_settings
+from app.services.query_plans import check_query_plans
+from app.services.property_index import PropertyIndex, benchmark, sample_filters
+from app.services.search import rebuild_search_index
+from app.services.client_matching import bulk_match_report
+from app.services.rollups import reconcile as reconcile_rollups
+from app.services.deal_analytics import rebuild_aggregates as rebuild_deal_analytics
+from app.services.address_index import benchmark as benchmark_address_lookups, sample_queries as sample_address_queries
 import click # Flask's CLI is based on Click
+import time
 
 @app.cli.command("create-admin")
 @click.option('--username', required=True, help="Имя пользователя для нового администратора.")
@@ -39,6 +49,259 @@ def create_admin_command(username, email, password):
             db.session.rollback()
             click.echo(click.style(f"Ошибка при создании администратора: {e}", fg='red'))
 
+@app.cli.command("images-to-disk")
+@click.option('--batch-size', default=100, show_default=True, help="Сколько изображений переносить за одну транзакцию.")
+def images_to_disk_command(batch_size):
+    """Переносит изображения из БД (property_images.image_data) в файловое хранилище."""
+    with app.app_context():
+        storage = get_storage(STORAGE_FILESYSTEM)
+        moved = deduplicated = 0
+        last_id = 0
+        while True:
+            # Keyset batches: only `batch_size` blobs are held in memory at a time
+            batch = PropertyImage.query_with_data()\
+                .filter(PropertyImage.storage == STORAGE_DATABASE, PropertyImage.id > last_id)\
+                .order_by(PropertyImage.id).limit(batch_size).all()
+            if not batch:
+                break
+            for image in batch:
+                data = bytes(image.image_data or b'')
+                image.content_hash = content_hash_for(data)
+                image.byte_size = len(data)
+                if not storage.save(image.content_hash, data):
+                    deduplicated += 1
+                image.image_data = None
+                image.storage = storage.name
+                moved += 1
+            last_id = batch[-1].id
+            try:
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                click.echo(click.style(f"Ошибка при сохранении пакета (ID до {last_id}): {e}", fg='red'))
+                return
+            db.session.expunge_all()
+            click.echo(f"Перенесено {moved} изображений (последний ID {last_id}).")
+        click.echo(click.style(f"Готово. Перенесено: {moved}, из них дубликатов: {deduplicated}. "
+                               f"Файлы: {storage.root}. Для PostgreSQL/SQLite выполните VACUUM, чтобы освободить место.", fg='green'))
+
+@app.cli.command("images-gc")
+@click.option('--dry-run', is_flag=True, help="Только показать файлы, которые будут удалены.")
+@click.option('--min-age', default=24 * 3600, show_default=True,
+              help="Не трогать файлы моложе стольких секунд (их записи могут быть еще не сохранены).")
+def images_gc_command(dry_run, min_age):
+    """Удаляет из файлового хранилища изображения, на которые больше не ссылается ни одна запись."""
+    with app.app_context():
+        storage = get_storage(STORAGE_FILESYSTEM)
+        referenced = {h for (h,) in db.session.query(PropertyImage.content_hash)
+                      .filter(PropertyImage.storage == STORAGE_FILESYSTEM).distinct()}
+        cutoff = time.time() - min_age
+        removed = 0
+        for content_hash in list(storage.iter_hashes()):
+            if content_hash in referenced:
+                continue
+            # Scrapers and imports write the file before their row commits, and a new row may
+            # re-reference a file that was orphaned earlier (saving it again refreshes the mtime)
+            modified_at = storage.modified_at(content_hash)
+            if modified_at is None or modified_at > cutoff:
+                continue
+            if dry_run:
+                click.echo(f"Будет удален: {storage.path_for(content_hash)}")
+                removed += 1
+                continue
+            # Re-check right before deleting: rows committed since the snapshot above
+            db.session.rollback()
+            still_referenced = db.session.query(PropertyImage.id).filter(
+                PropertyImage.storage == STORAGE_FILESYSTEM, PropertyImage.content_hash == content_hash).first()
+            if still_referenced is None and storage.delete(content_hash):
+                removed += 1
+        click.echo(click.style(f"{'Найдено' if dry_run else 'Удалено'} неиспользуемых файлов: {removed}.", fg='green'))
+
+@app.cli.command("images-normalize-pending")
+def images_normalize_pending_command():
+    """Обрабатывает фото, сохраненные оригиналами и не замененные обработанной копией (например, после перезапуска)."""
+    with app.app_context():
+        settings = normalization_settings()
+        done = 0
+        pending = [image_id for (image_id,) in db.session.query(PropertyImage.id)
+                   .filter(PropertyImage.normalize_pending.is_(True)).order_by(PropertyImage.id)]
+        for image_id in pending:
+            image = db.session.get(PropertyImage, image_id)
+            if image is None or not image.normalize_pending:
+                continue
+            original_hash = image.content_hash
+            normalized = normalize_image(image.read_bytes(), image.mimetype, image.filename, **settings)
+            if apply_normalized(image_id, original_hash, normalized):
+                done += 1
+        click.echo(click.style(f"Обработано фото: {done} из {len(pending)}.", fg='green'))
+
+@app.cli.command("backfill-year-built")
+@click.option('--batch-size', default=500, show_default=True, help="Сколько объектов обновлять за одну транзакцию.")
+def backfill_year_built_command(batch_size):
+    """Заполняет properties.year_built из текстового поля year для уже существующих объектов."""
+    with app.app_context():
+        updated = unparsed = 0
+        last_id = 0
+        while True:
+            # Keyset batches over the primary key with a short transaction each, so rows are never locked for long
+            batch = db.session.query(Property.id, Property.year)\
+                .filter(Property.id > last_id, Property.year_built.is_(None), Property.year.isnot(None))\
+                .order_by(Property.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            values = []
+            for property_id, year in batch:
+                year_built = parse_year(year)
+                if year_built is None:
+                    unparsed += 1
+                else:
+                    values.append({'id': property_id, 'year_built': year_built})
+            if values:
+                db.session.execute(db.update(Property), values) # Bulk UPDATE ... WHERE id = ? (executemany)
+            db.session.commit()
+            updated += len(values)
+            click.echo(f"Обработано до ID {last_id}: заполнено {updated}")
+        click.echo(click.style(f"Готово. Заполнено year_built: {updated}, не удалось разобрать год: {unparsed}.", fg='green'))
+
+@app.cli.command("check-query-plans")
+@click.option('--verbose', is_flag=True, help="Печатать план выполнения для каждого запроса.")
+def check_query_plans_command(verbose):
+    """Проверяет через EXPLAIN, что типовые запросы фильтра и подбора используют индексы, а не полный просмотр таблицы."""
+    with app.app_context():
+        failed = skipped = 0
+        for label, plan, scans in check_query_plans():
+            if plan is None:
+                skipped += 1
+                click.echo(f"ПРОПУЩЕНО: {label}")
+                continue
+            if scans:
+                failed += 1
+                click.echo(click.style(f"ПОЛНЫЙ ПРОСМОТР: {label}", fg='red'))
+            else:
+                click.echo(click.style(f"OK: {label}", fg='green'))
+            if verbose or scans:
+                for line in plan:
+                    click.echo(f"    {line}")
+        if failed:
+            click.echo(click.style(f"Запросов без индекса: {failed}.", fg='red'))
+            raise SystemExit(1)
+        if skipped:
+            click.echo(f"Проверка не поддерживается для этой СУБД, пропущено запросов: {skipped}.")
+            return
+        click.echo(click.style("Все проверенные запросы используют индексы.", fg='green'))
+
+@app.cli.command("benchmark-property-index")
+@click.option('--repeat', default=20, show_default=True, help="Сколько раз выполнять каждый запрос.")
+@click.option('--samples', default=20, show_default=True, help="Сколько вариантов фильтра проверить.")
+def benchmark_property_index_command(repeat, samples):
+    """Сравнивает скорость фильтрации через SQL и через индекс объектов в памяти и проверяет совпадение результатов."""
+    with app.app_context():
+        index = PropertyIndex()
+        index.load()
+        results = benchmark(sample_filters(index, samples), repeat=repeat)
+        mismatches = 0
+        for filters, sql_ms, index_ms, same in results:
+            mismatches += not same
+            label = ', '.join(f"{k}={v}" for k, v in filters.items()) or 'без фильтра'
+            line = f"SQL {sql_ms:8.2f} мс | индекс {index_ms:8.3f} мс | x{sql_ms / max(index_ms, 1e-6):6.1f} | {label}"
+            click.echo(click.style(line, fg='green' if same else 'red'))
+        sql_total = sum(r[1] for r in results)
+        index_total = sum(r[2] for r in results)
+        click.echo(f"Объектов в индексе: {len(index)}. Сумма медиан: SQL {sql_total:.2f} мс, индекс {index_total:.3f} мс.")
+        if mismatches:
+            click.echo(click.style(f"Результаты расходятся для {mismatches} фильтров.", fg='red'))
+            raise SystemExit(1)
+
+@app.cli.command("benchmark-address-search")
+@click.option('--queries', default=50, show_default=True, help="Сколько адресов (с внесенной опечаткой) искать.")
+@click.option('--repeat', default=5, show_default=True, help="Сколько раз выполнять каждый поиск.")
+def benchmark_address_search_command(queries, repeat):
+    """Замеряет время нечеткого поиска по адресу и сравнивает его с бюджетом ADDRESS_SEARCH_BUDGET_MS."""
+    with app.app_context():
+        budget_ms = app.config['ADDRESS_SEARCH_BUDGET_MS']
+        index, results = benchmark_address_lookups(sample_address_queries(queries), repeat=repeat)
+        over_budget = 0
+        for query, ms, found in results:
+            over_budget += ms > budget_ms
+            click.echo(click.style(f"{ms:8.2f} мс | найдено {found:3d} | {query}", fg='green' if ms <= budget_ms else 'red'))
+        if results:
+            timings = sorted(r[1] for r in results)
+            click.echo(f"Объектов в индексе: {len(index)}, триграмм: {len(index.postings)}. "
+                       f"Медиана {timings[len(timings) // 2]:.2f} мс, максимум {timings[-1]:.2f} мс (бюджет {budget_ms:.0f} мс).")
+        if over_budget:
+            click.echo(click.style(f"Бюджет превышен для {over_budget} запросов.", fg='red'))
+            raise SystemExit(1)
+
+@app.cli.command("matching-report")
+@click.option('--top', 'top_n', default=5, show_default=True, help="Сколько лучших (самых дешевых) объектов показать для клиента.")
+@click.option('--csv', 'csv_path', default=None, help="Сохранить отчет в CSV-файл.")
+def matching_report_command(top_n, csv_path):
+    """Подбирает объекты сразу для всех клиентов (векторно, за один проход), сохраняет отчет для админки и выводит число совпадений."""
+    import csv
+    with app.app_context():
+        report = bulk_match_report(top_n=top_n)
+        rows = sorted(report.rows, key=lambda row: (-row['count'], row['client_name']))
+        for row in rows:
+            top_ids = ', '.join(str(property_id) for property_id in row['top_property_ids']) or '-'
+            click.echo(f"{row['count']:7d} | {row['client_name']} (ID {row['client_id']}) | лучшие: {top_ids}")
+        if csv_path:
+            with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['client_id', 'client_name', 'match_count', 'top_property_ids'])
+                for row in rows:
+                    writer.writerow([row['client_id'], row['client_name'], row['count'],
+                                     ' '.join(str(property_id) for property_id in row['top_property_ids'])])
+        click.echo(click.style(f"Клиентов: {report.client_count}, объектов: {report.property_count}, "
+                               f"время: {report.total_ms:.0f} мс (загрузка {report.load_ms:.0f} мс). "
+                               f"Отчет сохранен для страницы «Сводный подбор».", fg='green'))
+
+@app.cli.command("search-reindex")
+def search_reindex_command():
+    """Создает недостающие объекты полнотекстового поиска и заново индексирует объекты и клиентов."""
+    with app.app_context():
+        try:
+            dialect = rebuild_search_index()
+        except NotImplementedError as e:
+            click.echo(click.style(str(e), fg='red'))
+            raise SystemExit(1)
+        click.echo(click.style(f"Полнотекстовый индекс перестроен ({dialect}).", fg='green'))
+
+@app.cli.command("sync-client-interests")
+@click.option('--batch-size', default=500, show_default=True, help="Сколько клиентов обрабатывать за одну транзакцию.")
+def sync_client_interests_command(batch_size):
+    """Заново строит структурированные интересы (client_interests) из JSON интересов всех клиентов."""
+    with app.app_context():
+        synced = last_id = 0
+        while True:
+            batch = Client.query.filter(Client.id > last_id).order_by(Client.id).limit(batch_size).all()
+            if not batch:
+                break
+            for client in batch:
+                ClientInterest.sync(client, client.interests)
+                synced += client.interest_criteria is not None
+            last_id = batch[-1].id
+            db.session.commit()
+            db.session.expunge_all()
+        click.echo(click.style(f"Клиентов с заданными интересами: {synced}.", fg='green'))
+
+@app.cli.command("rollups-reconcile")
+def rollups_reconcile_command():
+    """Пересчитывает счетчики панели управления (rollup_counters) по таблицам объектов, клиентов и сделок."""
+    with app.app_context():
+        drifted = reconcile_rollups()
+        if drifted:
+            click.echo(click.style(f"Исправлено расхождений в счетчиках: {drifted}.", fg='red'))
+        else:
+            click.echo(click.style("Счетчики совпадают с данными.", fg='green'))
+
+@app.cli.command("deal-analytics-rebuild")
+def deal_analytics_rebuild_command():
+    """Пересчитывает агрегаты аналитики сделок (время на стадиях, конверсия) по журналу переходов."""
+    with app.app_context():
+        processed = rebuild_deal_analytics()
+        click.echo(click.style(f"Аналитика пересчитана по {processed} переходам.", fg='green'))
+
 if __name__ == '__main__':
     # Note: app.run() is not called when using Flask CLI commands.
     # The FLASK_APP environment variable (set in .flaskenv) ensures 'app' is discovered.
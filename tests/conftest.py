@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The app reads DATABASE_URL when it is imported: point it at a throwaway SQLite file first
+_db_dir = tempfile.mkdtemp(prefix='crm-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.db')
+os.environ['IMAGE_STORAGE_PATH'] = os.path.join(_db_dir, 'image_store')
+os.environ['IMAGE_VARIANT_CACHE_PATH'] = os.path.join(_db_dir, 'image_variants')
+
+
+@pytest.fixture(scope='session')
+def migrated_app():
+    """The app with its database built by the real migrations (`flask db upgrade`), not create_all()."""
+    from flask_migrate import upgrade
+    from app import app
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        yield app
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import Client, Deal, DealStageDuration, DealStageMonthly, DealStageTransition, DealStatusEnum, Property, User
+from app.services.deal_analytics import (ALL_AGENTS, bucket_midpoint, duration_bucket, median_from_buckets,
+                                         record_stage_change)
+
+NEW, IN_PROGRESS, WON = DealStatusEnum.NEW.value, DealStatusEnum.IN_PROGRESS.value, DealStatusEnum.CLOSED_WON.value
+START = datetime(2019, 3, 4, 9, 0)
+
+
+@pytest.fixture
+def deal(migrated_app):
+    agent = User(username='analytics_agent', email='analytics@example.com')
+    agent.set_password('secret')
+    client = Client(name='Клиент аналитики')
+    prop = Property(name='Объект аналитики')
+    db.session.add_all([agent, client, prop])
+    db.session.flush()
+    deal = Deal(title='Сделка аналитики', client_id=client.id, property_id=prop.id, agent_id=agent.id,
+                stage=NEW, created_at=START, updated_at=START)
+    db.session.add(deal)
+    db.session.commit()
+    yield deal
+    DealStageTransition.query.filter_by(deal_id=deal.id).delete()
+    DealStageMonthly.query.filter_by(agent_id=agent.id).delete()
+    DealStageDuration.query.filter_by(agent_id=agent.id).delete()
+    for obj in (deal, prop, client, agent):
+        db.session.delete(obj)
+    db.session.commit()
+
+
+def durations(agent_id, stage):
+    return {row.bucket: row.count for row in DealStageDuration.query.filter_by(agent_id=agent_id, stage=stage)}
+
+
+def move(deal, stage, moment):
+    previous, deal.stage = deal.stage, stage
+    transition = record_stage_change(deal, previous, moment=moment)
+    db.session.commit()
+    return transition
+
+
+def test_stage_durations_come_from_the_previous_transition(deal):
+    all_agents_before = durations(ALL_AGENTS, IN_PROGRESS)
+    assert record_stage_change(deal, None, moment=START).seconds_in_stage is None
+    db.session.commit()
+
+    assert move(deal, IN_PROGRESS, START + timedelta(hours=2)).seconds_in_stage == 7200
+    assert move(deal, WON, START + timedelta(hours=2, minutes=30)).seconds_in_stage == 1800
+    assert move(deal, WON, START + timedelta(hours=3)) is None # Same stage: nothing recorded
+
+    assert durations(deal.agent_id, NEW) == {duration_bucket(7200): 1}
+    assert durations(deal.agent_id, IN_PROGRESS) == {duration_bucket(1800): 1}
+    all_agents_after = durations(ALL_AGENTS, IN_PROGRESS)
+    assert all_agents_after[duration_bucket(1800)] - all_agents_before.get(duration_bucket(1800), 0) == 1
+
+    monthly = {row.stage: (row.entered, row.exited, row.seconds_total)
+               for row in DealStageMonthly.query.filter_by(agent_id=deal.agent_id, month='2019-03')}
+    assert monthly == {NEW: (1, 1, 7200.0), IN_PROGRESS: (1, 1, 1800.0), WON: (1, 0, 0.0)}
+
+
+def test_deal_without_log_measures_new_from_its_creation(deal):
+    assert move(deal, IN_PROGRESS, START + timedelta(days=1)).seconds_in_stage == 86400
+    # Any other stage without a logged start has no known duration
+    deal.stage = IN_PROGRESS
+    DealStageTransition.query.filter_by(deal_id=deal.id).delete()
+    db.session.commit()
+    assert move(deal, WON, START + timedelta(days=2)).seconds_in_stage is None
+
+
+def test_median_from_buckets():
+    assert median_from_buckets({}) is None
+    assert median_from_buckets({3: 0}) is None
+    assert median_from_buckets({5: 1}) == bucket_midpoint(5)
+    assert median_from_buckets({9: 1, 2: 1, 5: 1}) == bucket_midpoint(5)
+    assert median_from_buckets({2: 1, 5: 1}) == bucket_midpoint(2) # Lower median for an even count
+    assert median_from_buckets({2: 10, 5: 3, 9: 3}) == bucket_midpoint(2)
+
+
+@pytest.mark.parametrize('seconds', [61, 600, 7200, 86400 * 3, 86400 * 45])
+def test_bucket_midpoint_is_within_ten_percent(seconds):
+    assert abs(bucket_midpoint(duration_bucket(seconds)) - seconds) / seconds < 0.1
+    assert duration_bucket(30) == 0
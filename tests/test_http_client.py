@@ -0,0 +1,111 @@
+import email.utils
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import http_client
+from app.services.http_client import FetchError, fetch
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeTransport:
+    """Returns (or raises) the scripted outcomes in order and records the requested URLs."""
+
+    retry_errors = (ConnectionError,)
+    errors = (ConnectionError, ValueError)
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def get(self, url, headers, timeout):
+        self.calls.append(url)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    """Installs a FakeTransport; `sleeps` collects the backoff delays instead of sleeping."""
+    settings = dict(http_client.DEFAULT_SETTINGS, max_retries=3, backoff_base=0.5, backoff_max=30.0)
+    fake = FakeTransport([])
+    fake.sleeps = []
+    monkeypatch.setattr(http_client, '_get_client', lambda: (fake, settings))
+    monkeypatch.setattr(http_client, 'time', SimpleNamespace(sleep=fake.sleeps.append)) # Other threads keep the real sleep
+    return fake
+
+
+def test_transient_errors_and_5xx_are_retried_with_backoff(transport, monkeypatch):
+    monkeypatch.setattr(http_client.random, 'uniform', lambda low, high: high) # Full jitter at its cap
+    transport.outcomes = [ConnectionError('reset'), FakeResponse(503), FakeResponse(200)]
+    response = fetch('https://example.com/a')
+    assert response.status_code == 200
+    assert len(transport.calls) == 3
+    assert transport.sleeps == [0.5, 1.0] # backoff_base * 2**attempt
+
+
+def test_retry_after_seconds_and_dates_are_honoured(transport):
+    in_a_minute = email.utils.format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    transport.outcomes = [FakeResponse(429, {'Retry-After': '7'}),
+                          FakeResponse(503, {'Retry-After': in_a_minute}),
+                          FakeResponse(429, {'Retry-After': '3600'}),
+                          FakeResponse(200)]
+    fetch('https://example.com/b')
+    assert transport.sleeps[0] == 7
+    assert 25 <= transport.sleeps[1] <= 30 # Date about a minute away, capped at backoff_max
+    assert transport.sleeps[2] == 30
+
+
+def test_gives_up_after_max_retries(transport):
+    transport.outcomes = [FakeResponse(502)] * 3
+    with pytest.raises(FetchError) as error:
+        fetch('https://example.com/c', max_retries=2)
+    assert error.value.status_code == 502
+    assert len(transport.calls) == 3
+    assert len(transport.sleeps) == 2
+
+
+def test_client_errors_and_permanent_failures_are_not_retried(transport):
+    transport.outcomes = [FakeResponse(404)]
+    with pytest.raises(FetchError) as error:
+        fetch('https://example.com/d')
+    assert error.value.status_code == 404
+
+    transport.outcomes = [ValueError('bad url')] # A transport error that is not transient
+    with pytest.raises(FetchError):
+        fetch('https://example.com/e')
+
+    transport.outcomes = [FakeResponse(503)]
+    with pytest.raises(FetchError):
+        fetch('https://example.com/f', max_retries=0) # Request handlers never wait on backoff
+    assert transport.sleeps == []
+    assert len(transport.calls) == 3
+
+
+def test_rate_limiter_is_acquired_before_every_attempt(transport):
+    acquired = []
+
+    class Limiter:
+        def acquire(self, url):
+            acquired.append(url)
+
+    transport.outcomes = [FakeResponse(500), FakeResponse(200)]
+    fetch('https://example.com/g', rate_limiter=Limiter())
+    assert acquired == ['https://example.com/g'] * 2
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None), ('', None), ('12', 12.0), ('-5', 0.0), ('soon', None),
+    ('Wed, 21 Oct 2015 07:28:00 GMT', 0.0), # In the past
+])
+def test_retry_after_parsing(value, expected):
+    headers = {} if value is None else {'Retry-After': value}
+    assert http_client._retry_after(FakeResponse(503, headers)) == expected
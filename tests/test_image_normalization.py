@@ -0,0 +1,73 @@
+import io
+from concurrent.futures import Future
+
+import pytest
+from PIL import Image
+
+from app import db
+from app.models import Property, PropertyImage
+from app.services import image_processing
+from app.services.image_processing import NormalizationBudget, apply_normalized, normalize_image
+
+
+def png(width, height):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), 'blue').save(output, format='PNG')
+    return output.getvalue()
+
+
+@pytest.fixture
+def listing(migrated_app):
+    prop = Property(name='Объект с фото')
+    db.session.add(prop)
+    db.session.commit()
+    yield prop
+    db.session.delete(prop)
+    db.session.commit()
+
+
+def test_normalized_in_budget_is_stored_before_commit(migrated_app, listing):
+    data = png(3000, 1500)
+    future = Future()
+    future.set_result(normalize_image(data, 'image/png', 'big.png', max_dimension=1920))
+    image = NormalizationBudget().image(future, data, 'image/png', 'big.png', property_id=listing.id)
+    db.session.add(image)
+    db.session.commit()
+    assert not image.normalize_pending
+    assert image.mimetype == 'image/webp'
+    assert Image.open(io.BytesIO(image.read_bytes())).size == (1920, 960)
+
+
+def test_late_normalization_is_swapped_in_by_the_writer(migrated_app, listing, monkeypatch):
+    queued = []
+    monkeypatch.setattr(image_processing, '_start_writer', lambda: None)
+    monkeypatch.setattr(image_processing._swap_queue, 'put', queued.append)
+    monkeypatch.setitem(migrated_app.config, 'IMAGE_NORMALIZE_WAIT_SECONDS', 0)
+    data = png(3000, 1500)
+    future = Future() # Still running when the request's budget is spent
+    image = NormalizationBudget().image(future, data, 'image/png', 'big.png', property_id=listing.id)
+    db.session.add(image)
+    db.session.commit()
+    assert image.normalize_pending
+    assert image.read_bytes() == data
+    response = migrated_app.test_client().get(f'/property_image/{image.id}')
+    assert 'no-cache' in response.headers['Cache-Control']
+
+    [(_, image_id, original_hash, queued_future)] = queued
+    assert (image_id, original_hash, queued_future) == (image.id, image.content_hash, future)
+    assert apply_normalized(image_id, original_hash, normalize_image(data, 'image/png', 'big.png', max_dimension=1920))
+    db.session.expire_all()
+    image = db.session.get(PropertyImage, image_id)
+    assert not image.normalize_pending
+    assert image.mimetype == 'image/webp'
+    response = migrated_app.test_client().get(f'/property_image/{image.id}')
+    assert 'no-cache' not in response.headers['Cache-Control']
+
+
+def test_swap_skips_images_replaced_since(migrated_app, listing):
+    image = PropertyImage.from_bytes(png(100, 50), property_id=listing.id, mimetype='image/png', normalize_pending=True)
+    db.session.add(image)
+    db.session.commit()
+    image.store_bytes(png(120, 60))
+    db.session.commit()
+    assert not apply_normalized(image.id, 'stale-hash', (b'webp', 'image/webp', None))
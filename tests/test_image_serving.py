@@ -0,0 +1,68 @@
+import pytest
+
+from app import db
+from app.models import Property, PropertyImage
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture(params=['database', 'filesystem'])
+def image(request, migrated_app, monkeypatch):
+    monkeypatch.setitem(migrated_app.config, 'IMAGE_STORAGE_BACKEND', request.param)
+    prop = Property(name='Объект с фото')
+    db.session.add(prop)
+    db.session.flush()
+    image = PropertyImage.from_bytes(DATA, property_id=prop.id, mimetype='application/octet-stream')
+    db.session.add(image)
+    db.session.commit()
+    yield image
+    db.session.delete(prop)
+    db.session.commit()
+
+
+def get(migrated_app, image, **headers):
+    return migrated_app.test_client().get(f'/property_image/{image.id}', headers=headers)
+
+
+def test_full_response_is_validated_by_etag_only(migrated_app, image):
+    response = get(migrated_app, image)
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers['ETag'] == f'"{image.content_hash}"'
+    assert 'Last-Modified' not in response.headers
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_if_none_match_is_answered_with_304(migrated_app, image):
+    response = get(migrated_app, image, **{'If-None-Match': f'"{image.content_hash}"'})
+    assert response.status_code == 304
+    assert not response.data
+
+
+def test_single_range_returns_the_slice(migrated_app, image):
+    response = get(migrated_app, image, Range='bytes=10-19')
+    assert response.status_code == 206
+    assert response.data == DATA[10:20]
+    assert response.headers['Content-Range'] == f'bytes 10-19/{len(DATA)}'
+
+
+def test_multi_range_is_ignored(migrated_app, image):
+    response = get(migrated_app, image, Range='bytes=0-1,5-6')
+    assert response.status_code == 200
+    assert response.data == DATA
+
+
+def test_range_outside_the_image_is_416(migrated_app, image):
+    response = get(migrated_app, image, Range=f'bytes={len(DATA) + 10}-{len(DATA) + 20}')
+    assert response.status_code == 416
+
+
+@pytest.mark.parametrize('if_range, status', [
+    ('"{etag}"', 206),
+    ('"0000"', 200),
+    ('Wed, 21 Oct 2099 07:28:00 GMT', 200), # Dates never validate: no Last-Modified is sent
+])
+def test_if_range(migrated_app, image, if_range, status):
+    response = get(migrated_app, image, Range='bytes=0-9', **{'If-Range': if_range.format(etag=image.content_hash)})
+    assert response.status_code == status
+    assert response.data == (DATA[:10] if status == 206 else DATA)
@@ -0,0 +1,53 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app import db
+from app.models import Property, PropertyImage
+from app.services import image_variants
+
+
+def png(width, height):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(output, format='PNG')
+    return output.getvalue()
+
+
+@pytest.fixture
+def listing(migrated_app):
+    prop = Property(name='Объект с превью')
+    db.session.add(prop)
+    db.session.commit()
+    yield prop
+    db.session.delete(prop)
+    db.session.commit()
+
+
+def add_image(listing, data):
+    image = PropertyImage.from_bytes(data, property_id=listing.id, mimetype='image/png')
+    db.session.add(image)
+    db.session.commit()
+    return image
+
+
+def test_small_original_is_decoded_once(migrated_app, listing, monkeypatch):
+    image = add_image(listing, png(100, 50))
+    calls = []
+    resize = image_variants.resize_image
+    monkeypatch.setattr(image_variants, 'resize_image', lambda *args: calls.append(args) or resize(*args))
+    client = migrated_app.test_client()
+    for _ in range(3):
+        response = client.get(f'/property_image/{image.id}?w=320')
+        assert response.status_code == 200
+        assert response.data == image.read_bytes()
+    assert len(calls) == 1
+
+
+def test_large_original_gets_a_cached_variant(migrated_app, listing):
+    image = add_image(listing, png(1000, 500))
+    response = migrated_app.test_client().get(f'/property_image/{image.id}?w=320')
+    assert response.status_code == 200
+    assert response.mimetype == image_variants.variant_mimetype()
+    with Image.open(io.BytesIO(response.data)) as variant:
+        assert variant.size == (320, 160)
@@ -0,0 +1,47 @@
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import Client, Deal, DealStatusEnum, Property, User
+
+
+@pytest.fixture
+def board(migrated_app):
+    agent = User(username='kanban_agent', email='kanban@example.com')
+    agent.set_password('secret')
+    client = Client(name='Клиент канбана')
+    prop = Property(name='Объект канбана')
+    db.session.add_all([agent, client, prop])
+    db.session.flush()
+    start = datetime(2026, 1, 1)
+    deals = [Deal(title=f'Новая {i}', client_id=client.id, property_id=prop.id, agent_id=agent.id,
+                  stage=DealStatusEnum.NEW.value, updated_at=start + timedelta(minutes=i)) for i in range(5)]
+    deals.append(Deal(title='Выигранная', client_id=client.id, property_id=prop.id, agent_id=agent.id,
+                      stage=DealStatusEnum.CLOSED_WON.value, updated_at=start))
+    db.session.add_all(deals)
+    db.session.commit()
+    yield agent, deals
+    for obj in deals + [prop, client, agent]:
+        db.session.delete(obj)
+    db.session.commit()
+
+
+def test_board_reads_newest_cards_per_stage(migrated_app, board, monkeypatch):
+    agent, deals = board
+    rendered = {}
+    monkeypatch.setattr(sys.modules['app.deal_bp'], 'render_template', lambda template, **context: rendered.update(context) or '')
+    monkeypatch.setitem(migrated_app.config, 'KANBAN_COLUMN_LIMIT', 2)
+    client = migrated_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(agent.id)
+    assert client.get('/deals/kanban').status_code == 200
+
+    new_column = rendered['deals_by_stage'][DealStatusEnum.NEW.value]
+    assert [deal.title for deal in new_column] == ['Новая 4', 'Новая 3']
+    assert [deal.title for deal in rendered['deals_by_stage'][DealStatusEnum.CLOSED_WON.value]] == ['Выигранная']
+    assert rendered['deals_by_stage'][DealStatusEnum.IN_PROGRESS.value] == []
+    assert set(rendered['next_cursors']) == {DealStatusEnum.NEW.value}
+    assert rendered['totals'][DealStatusEnum.NEW.value] == 5
+    assert rendered['totals'][DealStatusEnum.CLOSED_WON.value] == 1
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+from app import db
+from app.models import Client, MatchingReport, Property
+from app.services import client_matching
+
+
+@pytest.fixture
+def client_with_match(migrated_app):
+    prop = Property(name='Для отчета', price=100, area=40, district='Ауэзовский')
+    client = Client(name='Клиент отчета', interests={'max_price': 150, 'districts': ['Ауэзовский']})
+    db.session.add_all([prop, client])
+    db.session.commit()
+    yield client, prop
+    db.session.delete(client)
+    db.session.delete(prop)
+    db.session.commit()
+
+
+def row_for(report, client):
+    return next(row for row in report.rows if row['client_id'] == client.id)
+
+
+def test_report_is_saved_and_replaces_the_previous_one(client_with_match):
+    client, prop = client_with_match
+    first_id = client_matching.bulk_match_report(top_n=3).id
+    second_id = client_matching.bulk_match_report(top_n=3).id
+    assert db.session.query(MatchingReport.id).all() == [(second_id,)]
+    report = client_matching.get_last_report()
+    assert report.id == second_id != first_id
+    assert row_for(report, client)['count'] >= 1
+    assert prop.id in row_for(report, client)['top_property_ids']
+
+
+def test_rebuild_runs_once_at_a_time_in_the_background(migrated_app, client_with_match):
+    client, _ = client_with_match
+    assert client_matching.start_report_rebuild(migrated_app, top_n=2)
+    assert not client_matching.start_report_rebuild(migrated_app, top_n=2)
+    deadline = time.monotonic() + 10
+    while client_matching.report_rebuild_running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    db.session.expire_all()
+    report = client_matching.get_last_report()
+    assert report.top_n == 2
+    assert row_for(report, client)['client_name'] == 'Клиент отчета'
@@ -0,0 +1,55 @@
+import pytest
+
+from app import db
+from app.models import Client, ClientPropertyMatch, Property
+from app.services.client_matching import record_new_matches
+
+
+@pytest.fixture
+def clients(migrated_app):
+    by_district = Client(name='Ищет в Медеуском', interests={'districts': ['Медеуский'], 'min_price': 50, 'max_price': 150})
+    by_layout = Client(name='Ищет студию', interests={'layout': 'Студия', 'max_area': 40})
+    no_interests = Client(name='Без интересов')
+    db.session.add_all([by_district, by_layout, no_interests])
+    db.session.commit()
+    yield by_district, by_layout, no_interests
+    for client in (by_district, by_layout, no_interests):
+        db.session.delete(client)
+    db.session.commit()
+
+
+@pytest.fixture
+def listings(migrated_app):
+    props = {
+        'fits_district': Property(name='Медеуский, 100', district='Медеуский', price=100, area=60),
+        'too_expensive': Property(name='Медеуский, 300', district='Медеуский', price=300, area=60),
+        'no_price': Property(name='Медеуский, без цены', district='Медеуский', area=60),
+        'studio': Property(name='Студия', district='Алатауский', price=400, area=30, layout='Студия'),
+        'big_studio': Property(name='Большая студия', district='Алатауский', price=400, area=55, layout='Студия'),
+    }
+    db.session.add_all(props.values())
+    db.session.commit()
+    yield props
+    for prop in props.values():
+        db.session.delete(prop)
+    db.session.commit()
+
+
+def test_new_listings_are_matched_to_clients_once(clients, listings):
+    by_district, by_layout, _ = clients
+    ids = [prop.id for prop in listings.values()]
+    assert record_new_matches(ids, source='Тест') == 2
+    pairs = set(db.session.query(ClientPropertyMatch.client_id, ClientPropertyMatch.property_id)
+                .filter(ClientPropertyMatch.property_id.in_(ids)))
+    assert pairs == {(by_district.id, listings['fits_district'].id), (by_layout.id, listings['studio'].id)}
+    assert {row.source for row in ClientPropertyMatch.query.filter(ClientPropertyMatch.property_id.in_(ids))} == {'Тест'}
+
+    assert record_new_matches(ids, source='Тест') == 0 # Already stored pairs are not added again
+    assert record_new_matches([]) == 0
+
+
+def test_interest_changes_apply_to_later_batches(clients, listings):
+    by_district, _, _ = clients
+    by_district.interests = {'districts': ['Медеуский']}
+    db.session.commit()
+    assert record_new_matches([listings['too_expensive'].id, listings['no_price'].id]) == 2
@@ -0,0 +1,16 @@
+from app.services.query_plans import check_query_plans, full_scans
+
+
+def test_common_filters_use_an_index(migrated_app):
+    results = check_query_plans()
+    assert results
+    assert all(plan is not None for _, plan, _ in results)
+    scans = {label: plan for label, plan, found in results if found}
+    assert not scans, f"Queries without an index: {scans}"
+
+
+def test_full_scans_tells_scan_from_search():
+    plan = ['SEARCH properties USING INDEX ix_properties_district (district=?)',
+            '`--SCAN properties',
+            'Seq Scan on properties  (cost=0.00..35.50 rows=10 width=4)']
+    assert full_scans(plan) == plan[1:]
@@ -0,0 +1,43 @@
+import pytest
+
+from app import db
+from app.models import Client, Property
+from app.services.client_matching import scored_matches
+
+
+@pytest.fixture
+def listings(migrated_app):
+    props = [
+        Property(name='В бюджете', price=100, area=50, district='Бостандыкский'),
+        Property(name='Чуть дороже', price=104, area=50, district='Бостандыкский'),
+        Property(name='Намного дороже', price=200, area=50, district='Бостандыкский'),
+        Property(name='Другой район', price=100, area=50, district='Медеуский'),
+    ]
+    db.session.add_all(props)
+    db.session.commit()
+    yield props
+    for prop in props:
+        db.session.delete(prop)
+    db.session.commit()
+
+
+@pytest.fixture
+def client(migrated_app):
+    client = Client(name='Клиент подбора', interests={'min_price': 90, 'max_price': 100, 'districts': ['Бостандыкский']})
+    db.session.add(client)
+    db.session.commit()
+    yield client
+    db.session.delete(client)
+    db.session.commit()
+
+
+def test_ranges_are_soft_and_districts_prefiltered(listings, client):
+    scored = scored_matches(client, limit=10, tolerance=0.25)
+    assert [prop.name for prop, _ in scored] == ['В бюджете', 'Чуть дороже']
+    assert scored[0][1] == 0
+    assert scored[1][1] == pytest.approx(0.04 * 3 / 5) # Price weight 3 of 3 + district 2
+
+
+def test_candidates_are_capped_closest_first(listings, client):
+    scored = scored_matches(client, limit=10, tolerance=1.5, max_candidates=2)
+    assert [prop.name for prop, _ in scored] == ['В бюджете', 'Чуть дороже']
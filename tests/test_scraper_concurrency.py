@@ -0,0 +1,64 @@
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+from app.scrapers.concurrency import fetch_ordered
+
+
+def test_results_are_yielded_in_input_order():
+    finished = []
+
+    def work(delay, update_callback=None):
+        time.sleep(delay)
+        finished.append(delay)
+        return delay * 10
+
+    delays = [0.06, 0.0, 0.03, 0.01]
+    results = list(fetch_ordered(work, delays, max_workers=4))
+    assert results == [(index, delay, delay * 10) for index, delay in enumerate(delays)]
+    assert finished != delays # The workers really finished out of order
+
+
+def test_updates_are_replayed_in_the_calling_thread_with_their_result():
+    caller = threading.current_thread()
+    replayed = []
+
+    def callback(status):
+        replayed.append((status, threading.current_thread() is caller))
+
+    def work(item, update_callback=None):
+        update_callback(f'{item}: начало')
+        update_callback(f'{item}: конец')
+        return item
+
+    for index, item, _ in fetch_ordered(work, ['a', 'b', 'c'], max_workers=3, update_callback=callback):
+        # Everything up to this item has been replayed, nothing after it
+        assert replayed[-1] == (f'{item}: конец', True)
+        assert len(replayed) == 2 * (index + 1)
+    assert [status for status, _ in replayed] == ['a: начало', 'a: конец', 'b: начало', 'b: конец',
+                                                  'c: начало', 'c: конец']
+
+
+def test_exceptions_are_yielded_as_results():
+    def work(item, update_callback=None):
+        if item == 2:
+            raise ValueError('сбой')
+        return item
+
+    results = list(fetch_ordered(work, [1, 2, 3], max_workers=2))
+    assert [item for _, item, _ in results] == [1, 2, 3]
+    assert isinstance(results[1][2], ValueError)
+    assert results[2][2] == 3
+
+
+def test_workers_run_in_the_callers_app(migrated_app, monkeypatch):
+    def work(item, update_callback=None):
+        return has_app_context() and current_app.config.get('SCRAPER_TEST_MARKER')
+
+    monkeypatch.setitem(migrated_app.config, 'SCRAPER_TEST_MARKER', 'marker')
+    assert [result for _, _, result in fetch_ordered(work, [1, 2])] == ['marker', 'marker']
+
+
+def test_no_items_yield_nothing():
+    assert list(fetch_ordered(lambda item, update_callback=None: item, [])) == []
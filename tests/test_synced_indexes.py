@@ -0,0 +1,96 @@
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.models import Client, Property
+from app.services.address_index import index_sync as address_index_sync
+from app.services.autocomplete import index_sync as autocomplete_sync
+from app.services.property_index import index_sync as property_index_sync
+
+
+@pytest.fixture
+def listing(migrated_app):
+    prop = Property(name='Тестовая квартира', price=100, district='Алмалинский', street='ул. Абая', address='10')
+    db.session.add(prop)
+    db.session.commit()
+    yield prop
+    if db.session.get(Property, prop.id) is not None:
+        db.session.delete(prop)
+        db.session.commit()
+
+
+def test_property_index_applies_committed_update_and_delete(listing):
+    index = property_index_sync.sync()
+    assert listing.id in index.search({'district': 'Алмалинский'})
+
+    # updated_at far behind the watermark, as for a row flushed long before its transaction committed
+    listing.price = 250
+    listing.updated_at = datetime(2000, 1, 1)
+    db.session.commit()
+    index = property_index_sync.sync(full=False)
+    assert listing.id in index.search({'min_price': 200})
+    assert listing.id not in index.search({'max_price': 150})
+
+    property_id = listing.id
+    db.session.delete(listing)
+    db.session.commit()
+    index = property_index_sync.sync(full=False)
+    assert property_id not in index.search({})
+
+
+def test_autocomplete_applies_committed_renames_and_deletes(listing):
+    client = Client(name='Жанар Тестова')
+    db.session.add(client)
+    db.session.commit()
+    index = autocomplete_sync.sync()
+    assert {'kind': 'client', 'label': 'Жанар Тестова', 'id': client.id} in index.suggest('жанар')
+    generation = index.generation
+
+    listing.name = 'Пентхаус Достык'
+    listing.updated_at = datetime(2000, 1, 1)
+    client.name = 'Жанара Тестова'
+    db.session.commit()
+    index = autocomplete_sync.sync(full=False)
+    assert index.generation != generation
+    assert [item['id'] for item in index.suggest('пентхаус')] == [listing.id]
+    assert not index.suggest('тестовая')
+    assert [item['label'] for item in index.suggest('жанара')] == ['Жанара Тестова']
+
+    db.session.delete(client)
+    db.session.commit()
+    index = autocomplete_sync.sync(full=False)
+    assert not index.suggest('жанар')
+
+
+def test_address_index_reindexes_changed_addresses_only(listing):
+    index = address_index_sync.sync()
+    assert listing.id in [property_id for property_id, _ in index.lookup('улица Абая')]
+    rows = len(index.row_ids)
+
+    listing.price = 300
+    db.session.commit()
+    index = address_index_sync.sync(full=False)
+    assert len(index.row_ids) == rows
+
+    listing.street = 'пр. Сейфуллина'
+    listing.updated_at = datetime(2000, 1, 1)
+    db.session.commit()
+    index = address_index_sync.sync(full=False)
+    assert listing.id in [property_id for property_id, _ in index.lookup('Сейфулина')]
+    assert listing.id not in [property_id for property_id, _ in index.lookup('улица Абая')]
+
+    property_id = listing.id
+    db.session.delete(listing)
+    db.session.commit()
+    index = address_index_sync.sync(full=False)
+    assert property_id not in [property_id for property_id, _ in index.lookup('Сейфуллина')]
+
+
+def test_rows_deleted_elsewhere_trigger_a_rebuild(listing):
+    index = address_index_sync.sync()
+    db.session.execute(db.delete(Property).where(Property.id == listing.id)) # Bypasses the session listeners
+    db.session.commit()
+    rebuilt = address_index_sync.sync()
+    assert rebuilt is not index
+    assert listing.id not in [property_id for property_id, _ in rebuilt.lookup('улица Абая')]
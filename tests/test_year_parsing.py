@@ -0,0 +1,24 @@
+import importlib.util
+import os
+
+import pytest
+
+from app.models import parse_year
+from app.services.client_matching import _bound
+
+MIGRATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         'migrations', 'versions', 'e3b6c91d4a27_add_client_interests.py')
+
+
+@pytest.fixture(scope='module')
+def migration():
+    spec = importlib.util.spec_from_file_location('add_client_interests', MIGRATION)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize('text', ['2015', '2015г.', 'от 2010года', 'c1990', 'до 1960', '1985-1990', '12015',
+                                  '20150', 'год 2100', 'новостройка', '', None, 2005, 1999.0])
+def test_migration_backfill_parses_years_like_the_model(migration, text):
+    assert migration._bound('year_built_from', text) == parse_year(text) == _bound('year_built_from', text)